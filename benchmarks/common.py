@@ -0,0 +1,160 @@
+"""
+Общие части бенчмарков: базы данных, фиктивные курсоры и замеры.
+
+SQLite в памяти используется всегда, PostgreSQL - если передан DSN
+через --postgres или переменную окружения BENCH_POSTGRES_DSN.
+"""
+from dataclasses import dataclass, field
+from typing import Any, Callable
+import itertools
+import os
+import sqlite3
+import statistics
+import time
+
+from classic.db_tools import ConnectionPool
+
+# recognize_param_style ищет paramstyle в модуле класса курсора
+paramstyle = 'qmark'
+
+_databases = itertools.count()
+
+
+class SQLiteConnection(sqlite3.Connection):
+    # ScopedConnection проверяет autocommit, которого у sqlite3
+    # до 3.12 нет
+    autocommit = False
+
+
+@dataclass
+class Backend:
+    name: str
+    pool: ConnectionPool
+    #: Плейсхолдер для статических запросов
+    placeholder: str
+    #: Соединения, которые надо держать открытыми, пока жива база
+    keep: list[Any] = field(default_factory=list)
+
+
+def sqlite_backend(path: str | None = None, **pool_kwargs: Any) -> Backend:
+    """
+    Без path база создается в памяти. Файловая база нужна для
+    конкурентной записи: в памяти с общим кэшем писатели сразу
+    получают "database table is locked" вместо ожидания.
+    """
+    if path is None:
+        # Общий кэш позволяет нескольким соединениям видеть одну базу
+        uri = f'file:bench{next(_databases)}?mode=memory&cache=shared'
+        options = {'uri': True}
+    else:
+        uri = path
+        options = {'timeout': 30}
+
+    def connect():
+        return sqlite3.connect(
+            uri, factory=SQLiteConnection, check_same_thread=False,
+            **options,
+        )
+
+    keep = connect()
+    if path is not None:
+        keep.execute('PRAGMA journal_mode=WAL')
+    return Backend(
+        'sqlite', ConnectionPool(connect, **pool_kwargs), '?', [keep],
+    )
+
+
+def postgres_backend(dsn: str, **pool_kwargs: Any) -> Backend:
+    import psycopg
+
+    return Backend(
+        'postgres',
+        ConnectionPool(lambda: psycopg.connect(dsn), **pool_kwargs),
+        '%s',
+    )
+
+
+def backends(
+    postgres_dsn: str | None = None,
+) -> list[tuple[str, Callable[..., Backend]]]:
+    """
+    Имена и фабрики доступных баз, фабрики принимают аргументы пула.
+    """
+    postgres_dsn = postgres_dsn or os.environ.get('BENCH_POSTGRES_DSN')
+    factories = [('sqlite', sqlite_backend)]
+    if postgres_dsn:
+        factories.append((
+            'postgres',
+            lambda **kwargs: postgres_backend(postgres_dsn, **kwargs),
+        ))
+    return factories
+
+
+class NullCursor:
+    """
+    Курсор без базы: отдает заранее заданные строки, чтобы замерять
+    рендеринг и маппинг без затрат драйвера.
+    """
+
+    def __init__(self, columns=(), rows=()):
+        self.description = [
+            (name, 0, 0, 0, 0, True) for name in columns
+        ]
+        self.rows = list(rows)
+        self.rowcount = len(self.rows)
+
+    def execute(self, operation, parameters=None):
+        return self
+
+    def executemany(self, operation, seq_of_parameters):
+        return self
+
+    def fetchall(self):
+        return self.rows
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def fetchmany(self, size):
+        return self.rows[:size]
+
+    def close(self):
+        pass
+
+
+def measure(
+    func: Callable[[], Any],
+    operations: int = 1,
+    repeat: int = 5,
+    min_time: float = 0.2,
+) -> dict[str, float]:
+    """
+    Подбирает число вызовов так, чтобы замер длился не меньше
+    min_time, и повторяет его repeat раз. operations - сколько
+    операций (строк, запросов) выполняет один вызов func.
+    Возвращает время одного вызова и пропускную способность
+    по лучшему замеру.
+    """
+    number = 1
+    while (elapsed := _timeit(func, number)) < min_time:
+        if elapsed < min_time / 10:
+            number *= 10
+        else:
+            number = int(number * min_time / elapsed) + 1
+
+    timings = [elapsed / number]
+    for _ in range(repeat - 1):
+        timings.append(_timeit(func, number) / number)
+    best = min(timings)
+    return {
+        'time': best,
+        'median': statistics.median(timings),
+        'ops_per_sec': operations / best,
+    }
+
+
+def _timeit(func: Callable[[], Any], number: int) -> float:
+    started = time.perf_counter()
+    for _ in range(number):
+        func()
+    return time.perf_counter() - started
@@ -0,0 +1,85 @@
+"""
+Сравнение MappedQuery.iter с фоновой выборкой и без нее.
+
+Курсор имитирует сетевую задержку на каждый fetchmany через
+time.sleep, который, как и драйверы, отпускает GIL.
+
+    python benchmarks/prefetch.py --rows 100000 --latency 0.005
+"""
+from dataclasses import dataclass, field
+import argparse
+import time
+
+from classic.db_tools import Engine, ConnectionPool, OneToMany
+
+
+@dataclass
+class Task:
+    id: int
+    name: str
+    statuses: list['Status'] = field(default_factory=list)
+
+
+@dataclass
+class Status:
+    id: int
+    title: str
+
+
+class SlowCursor:
+    description = [
+        (name, 0, 0, 0, 0, True)
+        for name in ('task__id', 'task__name', 'status__id', 'status__title')
+    ]
+
+    def __init__(self, rows: int, latency: float):
+        self.rows = [
+            (index // 4, 'task', index, 'status') for index in range(rows)
+        ]
+        self.latency = latency
+        self.position = 0
+
+    def execute(self, operation, parameters=None):
+        self.position = 0
+
+    def fetchmany(self, size):
+        time.sleep(self.latency)
+        rows = self.rows[self.position:self.position + size]
+        self.position += size
+        return rows
+
+
+def measure(query, cursor, batch: int, prefetch: int) -> float:
+    started = time.perf_counter()
+    for _ in query.iter(_cursor=cursor, _batch=batch, _prefetch=prefetch):
+        pass
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--batch', type=int, default=500)
+    parser.add_argument('--latency', type=float, default=0.005)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    engine = Engine('.', ConnectionPool(lambda: None))
+    query = engine.query('SELECT', static=True).return_as(
+        Task, OneToMany(Task, 'statuses', Status),
+    )
+    cursor = SlowCursor(args.rows, args.latency)
+
+    for prefetch in (0, 1, 2, 4):
+        elapsed = min(
+            measure(query, cursor, args.batch, prefetch)
+            for _ in range(args.repeat)
+        )
+        print(
+            f'prefetch={prefetch}: {elapsed * 1000:8.1f} ms, '
+            f'{args.rows / elapsed:10.0f} rows/s'
+        )
+
+
+if __name__ == '__main__':
+    main()
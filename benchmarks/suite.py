@@ -0,0 +1,330 @@
+"""
+Набор бенчмарков: рендеринг, выполнение, маппинг и пул соединений.
+
+Результаты пишутся в JSON и сравниваются с прошлым прогоном:
+
+    python benchmarks/suite.py --output before.json
+    python benchmarks/suite.py --output after.json --compare before.json
+
+Кейсы с базой выполняются на SQLite в памяти, а при заданном
+BENCH_POSTGRES_DSN (или --postgres) - еще и на PostgreSQL.
+--filter оставляет кейсы, в имени которых есть подстрока.
+"""
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterator
+import argparse
+import datetime
+import json
+import platform
+import sys
+import threading
+
+from classic.db_tools import Engine, ConnectionPool, OneToMany
+from classic.db_tools.mapping import compile_mapper
+
+from common import Backend, NullCursor, backends, measure
+
+
+@dataclass
+class Task:
+    id: int
+    name: str
+    statuses: list['Status'] = field(default_factory=list)
+
+
+@dataclass
+class Status:
+    id: int
+    title: str
+    changes: list['Change'] = field(default_factory=list)
+
+
+@dataclass
+class Change:
+    id: int
+    value: int
+
+
+Case = Callable[[argparse.Namespace], Iterator[tuple[str, dict[str, Any]]]]
+CASES: list[Case] = []
+DB_CASES: list[Callable[..., Iterator[tuple[str, dict[str, Any]]]]] = []
+
+
+def case(func):
+    CASES.append(func)
+    return func
+
+
+def db_case(func):
+    DB_CASES.append(func)
+    return func
+
+
+def null_engine() -> Engine:
+    return Engine('.', ConnectionPool(lambda: None))
+
+
+@case
+def render(args):
+    engine = null_engine()
+    cursor = NullCursor()
+    sql = 'SELECT id, name FROM tasks WHERE id = {} AND name = {}'
+    static = engine.query(sql.format('?', '?'), static=True)
+    dynamic = engine.query(
+        sql.format('{{ id }}', '{{ name }}'), static=False,
+    )
+    params = {'id': 1, 'name': 'First'}
+
+    yield 'render.static', measure(
+        lambda: static.execute(params, cursor=cursor), repeat=args.repeat,
+    )
+    yield 'render.dynamic', measure(
+        lambda: dynamic.execute(params, cursor=cursor), repeat=args.repeat,
+    )
+
+    in_clause = engine.query(
+        'SELECT id FROM tasks WHERE id IN {{ ids | inclause }}',
+        static=False,
+    )
+    for size in (10, 100, 1000):
+        ids = {'ids': list(range(size))}
+        yield f'render.in_clause[{size}]', measure(
+            lambda: in_clause.execute(ids, cursor=cursor),
+            repeat=args.repeat,
+        )
+
+
+def flat_rows(count):
+    columns = ('task__id', 'task__name')
+    rows = [(index, f'task {index}') for index in range(count)]
+    return columns, rows, ()
+
+
+def one_to_many_rows(count):
+    columns = ('task__id', 'task__name', 'status__id', 'status__title')
+    rows = [
+        (index // 4, 'task', index, 'status') for index in range(count)
+    ]
+    return columns, rows, (OneToMany(Task, 'statuses', Status),)
+
+
+def nested_rows(count):
+    columns = (
+        'task__id', 'task__name',
+        'status__id', 'status__title',
+        'change__id', 'change__value',
+    )
+    rows = [
+        (index // 16, 'task', index // 4, 'status', index, index % 4)
+        for index in range(count)
+    ]
+    relationships = (
+        OneToMany(Task, 'statuses', Status),
+        OneToMany(Status, 'changes', Change),
+    )
+    return columns, rows, relationships
+
+
+@case
+def mapper(args):
+    for name, make_rows in (
+        ('flat', flat_rows),
+        ('one_to_many', one_to_many_rows),
+        ('nested', nested_rows),
+    ):
+        columns, rows, relationships = make_rows(args.rows)
+        func = compile_mapper(Task, relationships, columns)
+        yield f'mapper.{name}', measure(
+            lambda: list(func(rows)), operations=len(rows),
+            repeat=args.repeat,
+        )
+
+    columns, rows, relationships = one_to_many_rows(args.rows)
+    yield 'mapper.compile', measure(
+        lambda: compile_mapper(Task, relationships, columns),
+        repeat=args.repeat,
+    )
+
+
+def checkouts(pool: ConnectionPool, threads: int, per_thread: int) -> None:
+    def work():
+        for _ in range(per_thread):
+            with pool.connect():
+                pass
+
+    workers = [threading.Thread(target=work) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+@db_case
+def pool(args, make_backend):
+    per_thread = 200
+    for threads in (1, 4, 16, 64):
+        backend = make_backend(limit=args.pool_limit, timeout=60)
+        yield f'pool.checkout[{threads}]', measure(
+            lambda: checkouts(backend.pool, threads, per_thread),
+            operations=threads * per_thread,
+            repeat=args.repeat,
+        )
+        backend = make_backend(
+            limit=args.pool_limit, timeout=60, thread_affinity=True,
+        )
+        yield f'pool.affinity[{threads}]', measure(
+            lambda: checkouts(backend.pool, threads, per_thread),
+            operations=threads * per_thread,
+            repeat=args.repeat,
+        )
+
+
+def create_schema(engine: Engine, backend: Backend, rows: int) -> None:
+    p = backend.placeholder
+    with engine:
+        engine.query('DROP TABLE IF EXISTS task_status').execute()
+        engine.query('DROP TABLE IF EXISTS tasks').execute()
+        engine.query(
+            'CREATE TABLE tasks (id integer PRIMARY KEY, name text)'
+        ).execute()
+        engine.query(
+            'CREATE TABLE task_status '
+            '(id integer PRIMARY KEY, title text, task_id integer)'
+        ).execute()
+        engine.query(
+            f'INSERT INTO tasks (id, name) VALUES ({p}, {p})', static=True,
+        ).executemany([(index, f'task {index}') for index in range(rows)])
+        engine.query(
+            f'INSERT INTO task_status (id, title, task_id) '
+            f'VALUES ({p}, {p}, {p})',
+            static=True,
+        ).executemany([
+            (index, 'status', index // 4) for index in range(rows * 4)
+        ])
+
+
+@db_case
+def execute(args, make_backend):
+    backend = make_backend()
+    engine = Engine('.', backend.pool)
+    create_schema(engine, backend, args.rows)
+    p = backend.placeholder
+
+    sql = 'SELECT id, name FROM tasks WHERE id = {}'
+    static = engine.query(sql.format(p), static=True)
+    dynamic = engine.query(sql.format('{{ id }}'), static=False)
+    mapped = engine.query(
+        'SELECT tasks.id AS task__id, tasks.name AS task__name, '
+        'task_status.id AS status__id, task_status.title AS status__title '
+        'FROM tasks JOIN task_status ON task_status.task_id = tasks.id '
+        'ORDER BY tasks.id',
+        static=True,
+    ).return_as(Task, OneToMany(Task, 'statuses', Status))
+
+    with engine:
+        yield 'execute.static', measure(
+            lambda: static.one((1,)), repeat=args.repeat,
+        )
+        yield 'execute.dynamic', measure(
+            lambda: dynamic.one(id=1), repeat=args.repeat,
+        )
+        yield 'execute.mapped', measure(
+            lambda: mapped.all(), operations=args.rows * 4,
+            repeat=args.repeat,
+        )
+
+
+def run(args) -> dict[str, dict[str, Any]]:
+    results = {}
+
+    def add(items, prefix=''):
+        for name, result in items:
+            name = prefix + name
+            if args.filter and args.filter not in name:
+                continue
+            results[name] = result
+            print(
+                f'{name:40} {result["time"] * 1e6:12.1f} us '
+                f'{result["ops_per_sec"]:14.0f} ops/s',
+                file=sys.stderr,
+            )
+
+    for func in CASES:
+        if not args.filter or args.filter in func.__name__:
+            add(func(args))
+    for backend_name, make_backend in backends(args.postgres):
+        for func in DB_CASES:
+            if not args.filter or args.filter in func.__name__:
+                add(func(args, make_backend), f'{backend_name}.')
+    return results
+
+
+def compare(
+    current: dict[str, dict[str, Any]],
+    baseline: dict[str, dict[str, Any]],
+    threshold: float,
+) -> list[str]:
+    """
+    Печатает изменение пропускной способности относительно baseline
+    и возвращает имена кейсов, замедлившихся больше чем на threshold.
+    """
+    regressions = []
+    print(f'{"case":40} {"baseline":>14} {"current":>14} {"change":>8}')
+    for name, result in current.items():
+        before = baseline.get(name)
+        if before is None:
+            print(f'{name:40} {"-":>14} {result["ops_per_sec"]:14.0f}')
+            continue
+        change = result['ops_per_sec'] / before['ops_per_sec'] - 1
+        mark = ''
+        if change < -threshold:
+            regressions.append(name)
+            mark = ' REGRESSION'
+        print(
+            f'{name:40} {before["ops_per_sec"]:14.0f} '
+            f'{result["ops_per_sec"]:14.0f} {change:+8.1%}{mark}'
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=10_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument(
+        '--pool-limit', type=int, default=0,
+        help='limit пула в кейсах pool, 0 - без ограничения',
+    )
+    parser.add_argument('--postgres', help='DSN локального PostgreSQL')
+    parser.add_argument('--filter')
+    parser.add_argument('--output', help='файл для результатов в JSON')
+    parser.add_argument('--compare', help='JSON прошлого прогона')
+    parser.add_argument(
+        '--threshold', type=float, default=0.1,
+        help='допустимое замедление при сравнении, доля',
+    )
+    args = parser.parse_args()
+
+    results = run(args)
+    report = {
+        'meta': {
+            'created_at': datetime.datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'rows': args.rows,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)['results']
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
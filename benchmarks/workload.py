@@ -0,0 +1,112 @@
+"""
+Нагрузочный прогон Engine + ScopedConnection + ConnectionPool
+смесью чтений и записей.
+
+    python benchmarks/workload.py --concurrency 200 --duration 10
+    python benchmarks/workload.py --rate 2000 --pool-limit 20
+
+По умолчанию используется временная файловая база SQLite в режиме
+WAL, при заданном BENCH_POSTGRES_DSN (или --postgres) - PostgreSQL.
+"""
+import argparse
+import os
+import tempfile
+
+from classic.db_tools import Engine
+from classic.db_tools.workload import Scenario, run_workload
+
+from common import postgres_backend, sqlite_backend
+
+
+def prepare(engine: Engine, placeholder: str, rows: int) -> None:
+    with engine:
+        engine.query('DROP TABLE IF EXISTS tasks').execute()
+        engine.query(
+            'CREATE TABLE tasks (id integer PRIMARY KEY, name text)'
+        ).execute()
+        engine.query(
+            f'INSERT INTO tasks (id, name) '
+            f'VALUES ({placeholder}, {placeholder})',
+            static=True,
+        ).executemany([(index, f'task {index}') for index in range(rows)])
+
+
+def scenarios(rows: int, write_ratio: float) -> list[Scenario]:
+    read_ratio = 1 - write_ratio
+    return [
+        Scenario(
+            'get_by_id',
+            'SELECT id, name FROM tasks WHERE id = {{ id }}',
+            params=lambda rng: {'id': rng.randrange(rows)},
+            weight=read_ratio * 0.8,
+            method='one',
+        ),
+        Scenario(
+            'list_range',
+            'SELECT id, name FROM tasks '
+            'WHERE id >= {{ start }} ORDER BY id LIMIT 50',
+            params=lambda rng: {'start': rng.randrange(rows)},
+            weight=read_ratio * 0.2,
+        ),
+        Scenario(
+            'rename',
+            'UPDATE tasks SET name = {{ name }} WHERE id = {{ id }}',
+            params=lambda rng: {
+                'id': rng.randrange(rows), 'name': f'renamed {rng.random()}',
+            },
+            weight=write_ratio,
+            method='execute',
+        ),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--requests', type=int)
+    parser.add_argument('--rate', type=float, help='запросов в секунду')
+    parser.add_argument('--rows', type=int, default=10_000)
+    parser.add_argument('--write-ratio', type=float, default=0.1)
+    parser.add_argument(
+        '--pool-limit', type=int, default=0,
+        help='limit пула, 0 - без ограничения',
+    )
+    parser.add_argument('--postgres', help='DSN локального PostgreSQL')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    pool_kwargs = {'limit': args.pool_limit, 'timeout': 30, 'metrics': True}
+    dsn = args.postgres or os.environ.get('BENCH_POSTGRES_DSN')
+    with tempfile.TemporaryDirectory() as directory:
+        if dsn:
+            backend = postgres_backend(dsn, **pool_kwargs)
+        else:
+            backend = sqlite_backend(
+                os.path.join(directory, 'workload.db'), **pool_kwargs,
+            )
+        engine = Engine('.', backend.pool)
+        prepare(engine, backend.placeholder, args.rows)
+
+        report = run_workload(
+            engine,
+            scenarios(args.rows, args.write_ratio),
+            concurrency=args.concurrency,
+            duration=args.duration,
+            requests=args.requests,
+            rate=args.rate,
+            seed=args.seed,
+        )
+
+    print(report.format())
+    wait = report.pool['wait_time']
+    print(
+        f'pool: {report.pool["connections_created"]} connections, '
+        f'wait p50 <= {wait["p50"] * 1000:.2f} ms, '
+        f'p99 <= {wait["p99"] * 1000:.2f} ms, '
+        f'timeouts {report.pool["timeouts"]}'
+    )
+
+
+if __name__ == '__main__':
+    main()
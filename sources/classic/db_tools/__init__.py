@@ -1,4 +1,11 @@
 from .engine import Engine, in_transaction
 from .pool import ConnectionPool
-from .mapping import OneToMany, OneToOne, ID, Name
+from .mapping import OneToMany, OneToOne, LazyOneToMany, ID, Name
 from .scoped_connection import ScopedConnection
+from .instrumentation import QueryEvent, QueryStats
+from .slow_log import SlowQueryLog, redact_keys
+from .write_buffer import WriteBuffer
+from .bulk import BulkUpsert, UpsertResult
+from .sharding import ShardedEngine, ShardedQuery
+from .poollimit import AdaptiveLimit
+from .loader import DataLoader
@@ -0,0 +1,288 @@
+from contextlib import nullcontext
+from dataclasses import dataclass
+from itertools import chain, islice
+from typing import Any, Iterable, Literal, Mapping, Sequence
+from uuid import uuid4
+import re
+
+from . import values_batch
+from .params_styles import recognize_param_style
+from .pool import ConnectionPool
+from .transaction import Transaction
+from .types import Connection, Cursor
+
+_IDENTIFIER_RE = re.compile(
+    r'^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)?$'
+)
+
+_PLACEHOLDERS = {
+    'qmark': lambda index: '?',
+    'format': lambda index: '%s',
+    'pyformat': lambda index: '%s',
+    'numeric': lambda index: f':{index + 1}',
+    'named': lambda index: f':c{index}',
+    'asyncpg': lambda index: f'${index + 1}',
+}
+
+Row = Mapping[str, Any] | Sequence[Any]
+
+STAGE_TABLE = 'classic_db_tools_stage'
+
+
+@dataclass(slots=True)
+class UpsertResult:
+    inserted: int = 0
+    updated: int = 0
+
+    @property
+    def total(self) -> int:
+        return self.inserted + self.updated
+
+
+def quote_identifier(name: str) -> str:
+    """
+    Проверяет имя таблицы или колонки (допускается схема через
+    точку) и заключает его в двойные кавычки.
+    """
+    if not _IDENTIFIER_RE.match(name):
+        raise ValueError(f'Invalid SQL identifier: {name!r}')
+    return '.'.join(f'"{part}"' for part in name.split('.'))
+
+
+class BulkUpsert:
+    """
+    Загрузка строк через временную таблицу: каждая пачка из
+    chunk_size строк копируется в staging-таблицу (COPY, если курсор
+    его поддерживает, как psycopg 3, иначе многострочными INSERT),
+    затем одним запросом переносится в целевую таблицу через
+    INSERT ... ON CONFLICT или MERGE. Если в run передано соединение,
+    все пачки выполняются на нем в транзакции вызывающего кода,
+    иначе каждая пачка - отдельная транзакция на соединении из пула.
+
+    Число вставленных строк считается до переноса через NOT EXISTS
+    по ключу, остальные строки пачки считаются обновленными (или
+    пропущенными, если update_columns пуст). Повторы ключа внутри
+    пачки схлопываются, побеждает последняя строка.
+    """
+
+    def __init__(
+        self,
+        pool: ConnectionPool,
+        table: str,
+        key_columns: Sequence[str],
+        update_columns: Sequence[str] | None = None,
+        columns: Sequence[str] | None = None,
+        chunk_size: int = 10_000,
+        method: Literal['on_conflict', 'merge'] = 'on_conflict',
+    ):
+        if method not in ('on_conflict', 'merge'):
+            raise ValueError(f'Unknown upsert method: {method}')
+        if not key_columns:
+            raise ValueError('key_columns must not be empty')
+        self.pool = pool
+        self.table = quote_identifier(table)
+        self.key_columns = tuple(key_columns)
+        self.update_columns = update_columns
+        self.columns = tuple(columns) if columns else None
+        self.chunk_size = chunk_size
+        self.method = method
+        for name in (*self.key_columns, *(update_columns or ()),
+                     *(self.columns or ())):
+            quote_identifier(name)
+
+    def run(
+        self,
+        rows: Iterable[Row],
+        conn: Connection | None = None,
+    ) -> UpsertResult:
+        result = UpsertResult()
+        iterator = iter(rows)
+        first = next(iterator, None)
+        if first is None:
+            return result
+
+        columns = self.columns
+        if columns is None:
+            if not isinstance(first, Mapping):
+                raise ValueError(
+                    'columns are required when rows are not mappings'
+                )
+            columns = tuple(first)
+            for name in columns:
+                quote_identifier(name)
+        missing = set(self.key_columns) - set(columns)
+        if missing:
+            raise ValueError(f'Key columns not in rows: {sorted(missing)}')
+        update_columns = self.update_columns
+        if update_columns is None:
+            update_columns = [
+                name for name in columns if name not in self.key_columns
+            ]
+
+        iterator = self._as_tuples(columns, first, iterator)
+        if conn is not None:
+            self._run(conn, columns, update_columns, iterator, result, False)
+            return result
+        with self.pool.connect() as conn:
+            self._run(conn, columns, update_columns, iterator, result, True)
+        return result
+
+    def _run(
+        self,
+        conn: Connection,
+        columns: Sequence[str],
+        update_columns: Sequence[str],
+        iterator: Iterable[tuple[Any, ...]],
+        result: UpsertResult,
+        per_chunk: bool,
+    ) -> None:
+        # Имя уникально для вызова, чтобы не задеть постоянную таблицу
+        # с тем же именем и остатки временной после прошлой ошибки
+        stage = f'{STAGE_TABLE}_{uuid4().hex}'
+        cursor = conn.cursor()
+        try:
+            while chunk := list(islice(iterator, self.chunk_size)):
+                with Transaction(conn) if per_chunk else nullcontext():
+                    inserted, total = self._upsert(
+                        cursor, stage, columns, update_columns, chunk,
+                    )
+                result.inserted += inserted
+                if update_columns:
+                    result.updated += total - inserted
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def _as_tuples(
+        columns: Sequence[str],
+        first: Row,
+        rows: Iterable[Row],
+    ) -> Iterable[tuple[Any, ...]]:
+        for row in chain((first,), rows):
+            if isinstance(row, Mapping):
+                yield tuple(row[name] for name in columns)
+            else:
+                yield tuple(row)
+
+    def _upsert(
+        self,
+        cursor: Cursor,
+        stage: str,
+        columns: Sequence[str],
+        update_columns: Sequence[str],
+        chunk: list[tuple[Any, ...]],
+    ) -> tuple[int, int]:
+        key_indexes = [columns.index(name) for name in self.key_columns]
+        unique = {
+            tuple(row[index] for index in key_indexes): row for row in chunk
+        }
+        chunk = list(unique.values())
+
+        quoted = [quote_identifier(name) for name in columns]
+        column_list = ', '.join(quoted)
+        cursor.execute(
+            f'CREATE TEMP TABLE {stage} AS '
+            f'SELECT {column_list} FROM {self.table} WHERE 1 = 0'
+        )
+        self._load(cursor, stage, column_list, chunk)
+
+        key_match = ' AND '.join(
+            f't.{quote_identifier(name)} = s.{quote_identifier(name)}'
+            for name in self.key_columns
+        )
+        cursor.execute(
+            f'SELECT count(*) FROM {stage} s WHERE NOT EXISTS '
+            f'(SELECT 1 FROM {self.table} t WHERE {key_match})'
+        )
+        inserted = cursor.fetchone()[0]
+
+        if self.method == 'merge':
+            cursor.execute(self._merge_sql(
+                stage, quoted, update_columns, key_match,
+            ))
+        else:
+            cursor.execute(self._on_conflict_sql(
+                stage, column_list, update_columns,
+            ))
+        cursor.execute(f'DROP TABLE {stage}')
+        return inserted, len(chunk)
+
+    def _on_conflict_sql(
+        self,
+        stage: str,
+        column_list: str,
+        update_columns: Sequence[str],
+    ) -> str:
+        keys = ', '.join(quote_identifier(name) for name in self.key_columns)
+        if update_columns:
+            action = 'DO UPDATE SET ' + ', '.join(
+                f'{quote_identifier(name)} = excluded.{quote_identifier(name)}'
+                for name in update_columns
+            )
+        else:
+            action = 'DO NOTHING'
+        # WHERE нужен SQLite, чтобы отличить ON CONFLICT от JOIN ... ON
+        return (
+            f'INSERT INTO {self.table} ({column_list}) '
+            f'SELECT {column_list} FROM {stage} WHERE 1 = 1 '
+            f'ON CONFLICT ({keys}) {action}'
+        )
+
+    def _merge_sql(
+        self,
+        stage: str,
+        quoted: Sequence[str],
+        update_columns: Sequence[str],
+        key_match: str,
+    ) -> str:
+        sql = f'MERGE INTO {self.table} t USING {stage} s ON ({key_match}) '
+        if update_columns:
+            sql += 'WHEN MATCHED THEN UPDATE SET ' + ', '.join(
+                f'{quote_identifier(name)} = s.{quote_identifier(name)}'
+                for name in update_columns
+            ) + ' '
+        return (
+            sql
+            + f'WHEN NOT MATCHED THEN INSERT ({", ".join(quoted)}) '
+            + f'VALUES ({", ".join("s." + name for name in quoted)})'
+        )
+
+    @staticmethod
+    def _load(
+        cursor: Cursor,
+        stage: str,
+        column_list: str,
+        chunk: list[tuple[Any, ...]],
+    ) -> None:
+        copy = getattr(cursor, 'copy', None)
+        if copy is not None:
+            with copy(f'COPY {stage} ({column_list}) FROM STDIN') as writer:
+                for row in chunk:
+                    writer.write_row(row)
+            return
+
+        style = recognize_param_style(cursor)
+        if style == 'named':
+            chunk = [
+                {f'c{index}': value for index, value in enumerate(row)}
+                for row in chunk
+            ]
+        placeholder = _PLACEHOLDERS[style]
+        width = column_list.count(',') + 1
+        sql = (
+            f'INSERT INTO {stage} ({column_list}) VALUES ('
+            + ', '.join(placeholder(index) for index in range(width))
+            + ')'
+        )
+        template = values_batch.parse_values(sql)
+        size = values_batch.rows_per_batch(
+            template,
+            values_batch.DEFAULT_BATCH_SIZE,
+            values_batch.max_params_for(cursor),
+        )
+        for start in range(0, len(chunk), size):
+            batch = chunk[start:start + size]
+            cursor.execute(
+                values_batch.multi_row_sql(sql, len(batch)),
+                template.params(batch),
+            )
@@ -1,8 +1,10 @@
 import threading
+from time import perf_counter
 from typing import Iterable, Callable, Sequence
 
 import jinja2
 
+from classic.db_tools.instrumentation import QueryEvent
 from classic.db_tools.params_styles import recognize_param_style
 from classic.db_tools.types import Cursor, CursorParams
 
@@ -16,31 +18,52 @@ class DynamicQuery:
         self,
         renderer: Renderer,
         template: jinja2.Template,
+        source: str | None = None,
     ):
         self.renderer = renderer
         self.template = template
+        #: Текст шаблона до рендеринга
+        self.source = source
+
+    def render(
+        self,
+        params: CursorParams,
+        param_style: str,
+    ) -> tuple[str, CursorParams]:
+        return self.renderer.prepare_query(self.template, params, param_style)
 
     def execute(
         self,
         params: CursorParams = None,
         cursor: Cursor = None,
+        event: QueryEvent | None = None,
     ) -> Cursor:
+        if event is None:
+            sql, ordered_params = self.renderer.prepare_query(
+                self.template, params, recognize_param_style(cursor),
+            )
+            cursor.execute(sql, ordered_params)
+            return cursor
+
+        started = perf_counter()
         sql, ordered_params = self.renderer.prepare_query(
             self.template, params, recognize_param_style(cursor),
         )
+        rendered = perf_counter()
         cursor.execute(sql, ordered_params)
+        event.render_time += rendered - started
+        event.execute_time += perf_counter() - rendered
+        event.sql, event.params = sql, ordered_params
         return cursor
 
     def executemany(
         self,
         params: Iterable[CursorParams],
         cursor: Cursor,
+        event: QueryEvent | None = None,
     ) -> Cursor:
         for param in params:
-            sql, ordered_params = self.renderer.prepare_query(
-                self.template, param, recognize_param_style(cursor),
-            )
-            cursor.execute(sql, ordered_params)
+            self.execute(param, cursor, event)
         return cursor
 
 
@@ -91,12 +114,16 @@ class DynamicQueriesCache:
                 if obj is None:
                     if filename:
                         template = self.jinja.get_template(filename)
+                        source = self.jinja.loader.get_source(
+                            self.jinja, filename,
+                        )[0]
                     elif content:
                         template = self.jinja.from_string(content)
+                        source = content
                     else:
                         raise NotImplemented
 
-                    obj = DynamicQuery(self.renderer, template)
+                    obj = DynamicQuery(self.renderer, template, source)
                     self.cache[key] = obj
 
             return obj
@@ -1,21 +1,122 @@
+from contextlib import contextmanager, nullcontext
 from functools import wraps, partial
+from itertools import chain, groupby, islice
+from operator import itemgetter
 from os import PathLike
+from time import perf_counter
 from types import TracebackType
 from typing import (
     Any, Iterable, Generator,
-    TypeAlias, Sequence, Generic, Hashable, Type, TypeVar, Callable,
+    TypeAlias, Sequence, Generic, Hashable, Type, TypeVar, Callable, Literal,
 )
 import threading
 from pathlib import Path
 
 from classic.components import add_extra_annotation, doublewrap
 
+from .instrumentation import QueryEvent, Listener
+from .loader import DataLoader, Key, LoaderScope
+from .params_styles import recognize_param_style
 from .pool import ConnectionPool
-from .types import Cursor, CursorParams, Row
+from .replicas import ReplicaSet, RoutingState, in_dirs, is_readonly_sql
+from .prefetch import prefetch_batches
+from .types import Connection, Cursor, CursorDescription, CursorParams, Row
 from .transaction import Transaction
 from .scoped_connection import ScopedConnection
+from .single_flight import SingleFlight
+from .timeouts import StatementGuard
+from .bulk import BulkUpsert, UpsertResult
+from .slow_log import SlowQueryLog
+from .write_buffer import WriteBuffer
 
-from . import dynamic, static, mapping
+from . import dynamic, static, mapping, values_batch
+
+
+NO_EVENT = nullcontext()
+_END = object()
+
+DEFAULT_CHUNK_SIZE = 1000
+CHUNK_SAVEPOINT = 'classic_db_tools_chunk'
+
+
+def chunked(
+    params: Iterable[CursorParams],
+    size: int,
+) -> Generator[list[CursorParams], None, None]:
+    iterator = iter(params)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def execute_query(
+    lazy_query: Callable[[], Any],
+    params: CursorParams,
+    cursor: Cursor,
+    event: QueryEvent | None,
+) -> Cursor:
+    if event is None:
+        return lazy_query().execute(params, cursor)
+    return lazy_query().execute(params, cursor, event)
+
+
+def timed_fetch(
+    event: QueryEvent | None,
+    fetch: Callable[[], Any],
+    one: bool = False,
+) -> Any:
+    if event is None:
+        return fetch()
+    started = perf_counter()
+    rows = fetch()
+    event.fetched(rows, started, one)
+    return rows
+
+
+def guarded(
+    guard: StatementGuard,
+    fetch: Callable[[], Sequence[Row]],
+) -> Callable[[], Sequence[Row]]:
+    def guarded_fetch():
+        with guard:
+            return fetch()
+
+    return guarded_fetch
+
+
+def fetch_batches(
+    cursor: Cursor,
+    batch: int | None,
+    prefetch: int = 0,
+    event: QueryEvent | None = None,
+    guard: StatementGuard | None = None,
+) -> Iterable[Sequence[Row]]:
+    """
+    guard ограничивает время каждой выборки пачки по отдельности,
+    между выборками ограничения нет.
+    """
+    if batch:
+        fetch = partial(cursor.fetchmany, batch)
+    else:
+        fetch = cursor.fetchall
+        prefetch = 0
+    if guard is not None:
+        fetch = guarded(guard, fetch)
+    if event is not None:
+        fetch = event.timed(fetch)
+
+    if prefetch:
+        return prefetch_batches(
+            fetch, prefetch, getattr(cursor, 'connection', None),
+        )
+
+    def batches():
+        while True:
+            rows = fetch()
+            if not rows:
+                return
+            yield rows
+
+    return batches()
 
 
 class Engine:
@@ -27,9 +128,16 @@ class Engine:
         commit_on_exit: bool = True,
         str_templates_static_by_default: bool = False,
         identifier_quote_char: str = "'",
+        mapper_cache_dir: str | PathLike | None = None,
+        profile_mappers: bool = False,
+        replicas: Sequence[ConnectionPool] = (),
+        readonly_dirs: Sequence[str] = (),
+        statement_timeout: float | None = None,
+        single_flight: bool = False,
     ):
-        self.pool = pool
-        self.conn = ScopedConnection(pool, commit_on_exit)
+        self.commit_on_exit = commit_on_exit
+        self.readonly_dirs = tuple(readonly_dirs)
+        self._readonly_files: dict[str, bool] = {}
         if isinstance(templates_paths, str):
             self.templates_paths = [templates_paths]
         elif isinstance(templates_paths, Path):
@@ -50,7 +158,198 @@ class Engine:
         )
         self.mapper_cache = {}
         self.mapper_cache_lock = threading.Lock()
+        self.mapper_disk_cache = None
+        if mapper_cache_dir is not None:
+            self.mapper_disk_cache = mapping.MapperDiskCache(
+                mapper_cache_dir,
+            )
+        self.profile_mappers = profile_mappers
+        self.mapper_stats: dict[str, mapping.MapperStats] = {}
         self.str_templates_static_by_default = str_templates_static_by_default
+        self.statement_timeout = statement_timeout
+        self.single_flight = single_flight
+        self.listeners: tuple[Listener, ...] = ()
+        self._init_connections(pool, replicas)
+
+    def _init_connections(
+        self,
+        pool: ConnectionPool,
+        replicas: Sequence[ConnectionPool],
+    ) -> None:
+        """Состояние, привязанное к пулам и выполнениям запросов"""
+        self.pool = pool
+        self.conn = ScopedConnection(pool, self.commit_on_exit)
+        self.replicas = ReplicaSet(replicas) if replicas else None
+        self.routing = RoutingState()
+        self.flights = SingleFlight()
+        self.loaders = LoaderScope()
+        # Адаптивный лимит пула меряет время запросов, а не время
+        # удержания соединения
+        if pool.adaptive is not None:
+            self.add_listener(pool.adaptive)
+
+    def with_pool(
+        self,
+        pool: ConnectionPool,
+        replicas: Sequence[ConnectionPool] = (),
+    ) -> 'Engine':
+        """
+        Движок на другом пуле с общими кэшами шаблонов и мапперов
+        и теми же настройками. Слушатели копируются на момент вызова,
+        все состояние соединений и выполнения запросов у каждого
+        движка свое.
+        """
+        engine = object.__new__(type(self))
+        # Настройки
+        engine.commit_on_exit = self.commit_on_exit
+        engine.readonly_dirs = self.readonly_dirs
+        engine.templates_paths = self.templates_paths
+        engine.profile_mappers = self.profile_mappers
+        engine.str_templates_static_by_default = (
+            self.str_templates_static_by_default
+        )
+        engine.statement_timeout = self.statement_timeout
+        engine.single_flight = self.single_flight
+        # Ограничитель пула шаблона получает замеры только своего движка
+        engine.listeners = tuple(
+            listener for listener in self.listeners
+            if listener is not self.pool.adaptive
+        )
+        # Общие кэши. Статистика мапперов хранится вместе с ними:
+        # маппер, скомпилированный одним движком, используют все
+        engine._readonly_files = self._readonly_files
+        engine.dynamic_templates = self.dynamic_templates
+        engine.static_templates = self.static_templates
+        engine.mapper_cache = self.mapper_cache
+        engine.mapper_cache_lock = self.mapper_cache_lock
+        engine.mapper_disk_cache = self.mapper_disk_cache
+        engine.mapper_stats = self.mapper_stats
+        engine._init_connections(pool, replicas)
+        return engine
+
+    def add_listener(self, listener: Listener) -> None:
+        """
+        Слушатель вызывается с QueryEvent после каждого выполнения
+        запроса. Пока слушателей нет, замеры не производятся.
+        """
+        self.listeners = (*self.listeners, listener)
+
+    def remove_listener(self, listener: Listener) -> None:
+        self.listeners = tuple(
+            item for item in self.listeners if item is not listener
+        )
+
+    def enable_slow_query_log(
+        self,
+        threshold: float,
+        explain: bool = False,
+        **kwargs: Any,
+    ) -> SlowQueryLog:
+        """
+        Включает журнал запросов дольше threshold секунд.
+        При explain=True планы снимаются через соединения пула движка.
+        Остальные аргументы передаются в SlowQueryLog.
+        """
+        if explain:
+            kwargs.setdefault('pool', self.pool)
+        slow_log = SlowQueryLog(threshold, **kwargs)
+        self.add_listener(slow_log)
+        return slow_log
+
+    def bulk_upsert(
+        self,
+        table: str,
+        rows: Iterable[Any],
+        key_columns: Sequence[str],
+        update_columns: Sequence[str] | None = None,
+        **kwargs: Any,
+    ) -> UpsertResult:
+        """
+        Вставляет или обновляет строки (словари или кортежи при
+        явных columns) по ключу key_columns через временную таблицу.
+        По умолчанию обновляются все колонки, кроме ключевых, пустой
+        update_columns оставляет существующие строки как есть.
+        Остальные аргументы передаются в BulkUpsert.
+
+        Внутри контекста движка вставка идет через его соединение
+        и коммитится вместе с остальной работой контекста, вне
+        контекста - пачками в отдельных транзакциях.
+        """
+        upsert = BulkUpsert(
+            self.pool, table, key_columns, update_columns, **kwargs,
+        )
+        if self.conn.active:
+            return upsert.run(rows, self.connection)
+        return upsert.run(rows)
+
+    def write_buffer(self, **kwargs: Any) -> WriteBuffer:
+        """
+        Запускает буфер записи с групповым коммитом на пуле движка,
+        аргументы передаются в WriteBuffer. Буфер надо закрыть.
+        """
+        return WriteBuffer(self, **kwargs)
+
+    def clear_loaders(self) -> None:
+        """
+        Забывает результаты и ожидающие ключи всех загрузчиков
+        в текущем потоке, как при выходе из контекста движка.
+        """
+        self.loaders.clear()
+
+    def coalesces(self, single_flight: bool | None, cursor: Cursor) -> bool:
+        """
+        Объединять ли вызов с одновременными такими же: явный
+        single_flight вызова или настройка движка. Результат ожидающих
+        получен через соединение первого потока, поэтому объединяются
+        только вызовы без явного курсора из контекстов, которые еще
+        не писали: не внутри пишущей транзакции и не после запроса
+        без пометки readonly (routing.pinned). Иначе вызов не увидел бы
+        своих незакоммиченных изменений.
+        """
+        if cursor is not None:
+            return False
+        routing = self.routing
+        if routing.pinned or routing.writing:
+            return False
+        if single_flight is None:
+            return self.single_flight
+        return single_flight
+
+    def statement_cursor(
+        self,
+        cursor: Cursor | None,
+        readonly: bool,
+        timeout: float | None,
+    ) -> tuple[Cursor, StatementGuard | nullcontext]:
+        """
+        Курсор для запроса (переданный или выбранный route) и
+        ограничение его времени: timeout или statement_timeout движка,
+        если оба None - без ограничения.
+
+        Соединение для ограничения берется из контекста движка.
+        Атрибут connection курсора - необязательное расширение DB-API,
+        он используется только для переданного курсора, а без него -
+        соединение контекста.
+        """
+        if cursor is None:
+            conn = self.route_connection(readonly)
+            cursor = conn.cursor()
+        else:
+            conn = None
+        if timeout is None:
+            timeout = self.statement_timeout
+            if timeout is None:
+                return cursor, NO_EVENT
+        if conn is None:
+            conn = getattr(cursor, 'connection', None)
+        if conn is None:
+            conn = self.connection
+        return cursor, StatementGuard(conn, timeout)
+
+    def start_event(self, template: str, method: str) -> QueryEvent | None:
+        if not self.listeners:
+            return None
+        return QueryEvent(template, method, self.listeners)
 
     def get_mapper_from_cache(self, key: Hashable):
         return self.mapper_cache.get(key)
@@ -58,17 +357,59 @@ class Engine:
     def cache_mapper(self, key: Hashable, value: mapping.Mapper):
         with self.mapper_cache_lock:
             self.mapper_cache[key] = value
+            stats = getattr(value, 'stats', None)
+            if stats is not None:
+                self.mapper_stats[stats.filename] = stats
 
-    def query_from(self, filename: str) -> 'Query':
+    def mapper_profile(self) -> dict[str, dict[str, Any]]:
+        """
+        Счетчики мапперов по их синтетическим именам файлов,
+        заполняются при profile_mappers=True.
+        """
+        with self.mapper_cache_lock:
+            stats = list(self.mapper_stats.values())
+        return {item.filename: item.report() for item in stats}
+
+    def query_from(
+        self,
+        filename: str,
+        readonly: bool | None = None,
+    ) -> 'Query':
+        """
+        readonly=None - шаблон считается читающим, если лежит
+        в одном из readonly_dirs или начинается с комментария
+        -- readonly (или /* readonly */).
+        """
         if filename.endswith('.sql'):
             create_lazy = self.static_templates.create_lazy
         elif filename.endswith('.sql.tmpl'):
             create_lazy = self.dynamic_templates.create_lazy
         else:
             raise ValueError(f'Unsupported filename extension: {filename}')
-        return Query(self, create_lazy(filename=filename))
+        if readonly is None:
+            readonly = self._is_readonly_file(filename)
+        return Query(self, create_lazy(filename=filename), filename, readonly)
+
+    def _is_readonly_file(self, filename: str) -> bool:
+        readonly = self._readonly_files.get(filename)
+        if readonly is None:
+            readonly = in_dirs(filename, self.readonly_dirs)
+            if not readonly:
+                for path in self.templates_paths:
+                    filepath = Path(path, filename)
+                    if filepath.exists():
+                        with open(filepath, 'rt') as file:
+                            readonly = is_readonly_sql(file.read())
+                        break
+            self._readonly_files[filename] = readonly
+        return readonly
 
-    def query(self, content: str, static: bool = None) -> 'Query':
+    def query(
+        self,
+        content: str,
+        static: bool = None,
+        readonly: bool | None = None,
+    ) -> 'Query':
         if static is None:
             static = self.str_templates_static_by_default
 
@@ -79,25 +420,124 @@ class Engine:
         else:
             raise ValueError(f'Unknown "static" arg value: {static}')
 
-        return Query(self, create_lazy(content=content))
+        if readonly is None:
+            readonly = is_readonly_sql(content)
+        return Query(self, create_lazy(content=content), content, readonly)
 
     @property
-    def cursor(self):
-        try:
-            return self.conn.cursor()
-        except AttributeError:
+    def connection(self) -> Connection:
+        """
+        Соединение контекста движка с основным сервером. После
+        обращения к нему контекст считается пишущим: чтения остаются
+        на основном сервере и не объединяются с чужими (см. coalesces).
+        """
+        self.routing.pinned = True
+        return self._primary()
+
+    def _primary(self) -> Connection:
+        if not self.conn.active:
             raise AttributeError('''
                 Trying to access cursor, while not in started state.
                 Maybe, you forgot to enter in engine ctx?:
                 >>> with engine:
                 ...     query.execute(...)
             ''')
+        return self.conn.__wrapped__
 
-    def transaction(self):
-        return Transaction(self.conn.__wrapped__)
+    @property
+    def cursor(self):
+        return self.connection.cursor()
+
+    def route(self, readonly: bool) -> Cursor:
+        """
+        Курсор для запроса: читающие запросы и все запросы внутри
+        transaction(readonly=True) уходят на реплику, но внутри
+        пишущей транзакции остаются на основном сервере, чтобы
+        видеть собственные изменения. Контекст движка - тоже
+        транзакция, поэтому после первого запроса на основной
+        сервер (любой запрос без пометки readonly считается пишущим)
+        чтения до выхода из контекста остаются на нем.
+        """
+        return self.route_connection(readonly).cursor()
+
+    def route_connection(self, readonly: bool) -> Connection:
+        """Соединение, на котором route создает курсор"""
+        routing = self.routing
+        if self.replicas is None:
+            if readonly and not routing.writing:
+                return self._primary()
+            return self.connection
+        if routing.writing:
+            return self.connection
+        if routing.reading or (readonly and not routing.pinned):
+            return self.replica_connection()
+        return self.connection
+
+    def replica_connection(self):
+        """
+        Соединение с репликой, берется при первом обращении
+        и возвращается в пул при выходе из контекста движка.
+        """
+        routing = self.routing
+        if routing.conn is None:
+            if not routing.entered:
+                raise AttributeError('''
+                    Trying to access replica, while not in started state.
+                    Maybe, you forgot to enter in engine ctx?:
+                    >>> with engine:
+                    ...     query.execute(...)
+                ''')
+            routing.index, routing.conn = self.replicas.getconn()
+        return routing.conn
+
+    def _release_replica(self) -> None:
+        routing = self.routing
+        routing.entered = False
+        routing.pinned = False
+        conn, routing.conn = routing.conn, None
+        if conn is None:
+            return
+        try:
+            if conn.autocommit is False:
+                conn.rollback()
+        finally:
+            self.replicas.release(routing.index, conn)
+
+    def transaction(self, readonly: bool = False):
+        """
+        При настроенных репликах транзакция с readonly=True
+        открывается на реплике, если поток не находится внутри
+        пишущей транзакции и контекст еще не обращался к основному
+        серверу.
+        """
+        if self.replicas is None:
+            if not readonly:
+                self.routing.pinned = True
+            return Transaction(self.conn.__wrapped__)
+        return self._routed_transaction(readonly)
+
+    @contextmanager
+    def _routed_transaction(self, readonly: bool):
+        routing = self.routing
+        if readonly and not (routing.writing or routing.pinned):
+            routing.reading += 1
+            try:
+                with Transaction(self.replica_connection()) as transaction:
+                    yield transaction
+            finally:
+                routing.reading -= 1
+        else:
+            routing.writing += 1
+            try:
+                with Transaction(self.conn.__wrapped__) as transaction:
+                    yield transaction
+            finally:
+                routing.writing -= 1
 
     def __enter__(self):
         self.conn.__enter__()
+        if self.replicas is not None:
+            self.routing.entered = True
         return self
 
     def __exit__(
@@ -106,7 +546,14 @@ class Engine:
             value: BaseException | None,
             traceback: TracebackType | None,
     ) -> bool | None:
-        return self.conn.__exit__(type_, value, traceback)
+        self.loaders.clear()
+        if self.replicas is None:
+            self.routing.pinned = False
+            return self.conn.__exit__(type_, value, traceback)
+        try:
+            return self.conn.__exit__(type_, value, traceback)
+        finally:
+            self._release_replica()
 
     def commit(self):
         self.conn.commit()
@@ -121,55 +568,245 @@ class Query:
         self,
         engine: Engine,
         lazy_query,
+        name: str = None,
+        readonly: bool = False,
     ):
         self.engine = engine
         self._lazy_query = lazy_query
+        self.name = name
+        self.readonly = readonly
 
     def return_as(
         self,
         result: mapping.Result,
         *relationships: mapping.Relationship,
+        columns: Sequence[str] | bool | None = None,
     ) -> 'MappedQuery[mapping.Result]':
+        """
+        columns позволяет заранее скомпилировать маппер: либо явный
+        список колонок, либо True, чтобы вывести их из псевдонимов
+        вида AS cls__field в тексте статического запроса.
+        """
+        if columns is True:
+            columns = self._infer_columns()
         return MappedQuery[mapping.Result](
             engine=self.engine,
             lazy_query=self._lazy_query,
             result=result,
             relationships=relationships,
+            columns=columns or None,
+            name=self.name,
+            readonly=self.readonly,
         )
 
+    def loader(
+        self,
+        key: Key = 0,
+        param: str = 'ids',
+        many: bool = False,
+        batch_size: int = DEFAULT_CHUNK_SIZE,
+    ) -> DataLoader:
+        """
+        Загрузчик строк по ключам пачками: запрос получает список
+        ключей в параметре param (например, WHERE id = ANY(%(ids)s)),
+        key - индекс, имя колонки или функция, достающие ключ
+        из строки. При many=True по ключу возвращается список строк.
+        """
+        return DataLoader(
+            self, self.engine.loaders, key, param, many, batch_size,
+        )
+
+    def _infer_columns(self) -> tuple[str, ...]:
+        query = self._lazy_query()
+        if not isinstance(query, static.StaticQuery):
+            raise ValueError(
+                'Columns can be inferred only for static queries, '
+                'pass them explicitly'
+            )
+        columns = mapping.parse_select_columns(query.content)
+        if not columns:
+            raise ValueError(
+                'Query does not contain columns aliased as cls__field'
+            )
+        return columns
+
     def execute(
         self,
         params: CursorParams = None,
         /,
         cursor: Cursor = None,
+        _timeout: float | None = None,
         **kwargs: Any,
     ) -> Cursor:
-        return self._lazy_query().execute(
-            params or kwargs,
-            cursor or self.engine.cursor,
+        """
+        _timeout - ограничение времени запроса в секундах, по умолчанию
+        statement_timeout движка. Запрос, не уложившийся в него,
+        отменяется драйвером, открытая транзакция откатывается целиком,
+        и выбрасывается StatementTimeoutError. То же относится
+        к остальным методам выполнения.
+        """
+        cursor, guard = self.engine.statement_cursor(
+            cursor, self.readonly, _timeout,
         )
+        event = self.engine.start_event(self.name, 'execute')
+        with event or NO_EVENT, guard:
+            return execute_query(
+                self._lazy_query, params or kwargs, cursor, event,
+            )
 
     def executemany(
         self,
-        params: Sequence[CursorParams],
+        params: Iterable[CursorParams],
         cursor: Cursor = None,
+        chunk_size: int | None = None,
+        per_chunk: Literal['commit', 'savepoint'] | None = None,
+        progress: Callable[[int], None] | None = None,
     ) -> Cursor:
-        return self._lazy_query().executemany(
-            params, cursor or self.engine.cursor,
-        )
+        """
+        params может быть любым итерируемым, в том числе генератором.
+        Все, кроме последовательности без дополнительных опций,
+        отправляется в драйвер пачками по chunk_size (по умолчанию
+        DEFAULT_CHUNK_SIZE), так что в памяти держится одна пачка.
+
+        per_chunk='commit' коммитит соединение курсора после каждой
+        пачки, per_chunk='savepoint' оборачивает каждую пачку
+        в точку сохранения: при ошибке откатывается только она,
+        и исключение пробрасывается дальше. progress вызывается
+        после каждой пачки с числом обработанных записей.
+        """
+        if per_chunk not in (None, 'commit', 'savepoint'):
+            raise ValueError(f'Unknown per_chunk value: {per_chunk}')
+        cursor = cursor or self.engine.cursor
+        if (
+            isinstance(params, Sequence)
+            and chunk_size is None and per_chunk is None and progress is None
+        ):
+            chunks = (params,)
+        else:
+            chunks = chunked(params, chunk_size or DEFAULT_CHUNK_SIZE)
+
+        event = self.engine.start_event(self.name, 'executemany')
+        with event or NO_EVENT:
+            query = self._lazy_query()
+            processed = 0
+            for chunk in chunks:
+                if per_chunk == 'savepoint':
+                    cursor.execute(f'SAVEPOINT {CHUNK_SAVEPOINT}')
+                try:
+                    if event is None:
+                        query.executemany(chunk, cursor)
+                    else:
+                        query.executemany(chunk, cursor, event)
+                except Exception:
+                    if per_chunk == 'savepoint':
+                        cursor.execute(
+                            f'ROLLBACK TO SAVEPOINT {CHUNK_SAVEPOINT}'
+                        )
+                    raise
+                if per_chunk == 'savepoint':
+                    cursor.execute(f'RELEASE SAVEPOINT {CHUNK_SAVEPOINT}')
+                elif per_chunk == 'commit':
+                    cursor.connection.commit()
+                processed += len(chunk)
+                if progress is not None:
+                    progress(processed)
+            return cursor
+
+    def insert_many(
+        self,
+        params: Iterable[CursorParams],
+        cursor: Cursor = None,
+        batch_size: int = values_batch.DEFAULT_BATCH_SIZE,
+        max_params: int | None = None,
+    ) -> list[Row] | int:
+        """
+        Вставляет строки многострочными INSERT ... VALUES (...), (...)
+        вместо построчного executemany. Шаблон должен вставлять одну
+        строку, параметры допускаются только в группе VALUES.
+
+        В одном запросе не больше batch_size строк и не больше
+        max_params параметров (по умолчанию - ограничение драйвера).
+        SQL для каждого числа строк строится один раз. Динамический
+        шаблон рендерится для каждой строки, подряд идущие строки
+        с одинаковым SQL объединяются.
+
+        Если в шаблоне есть RETURNING, возвращает строки всех пачек
+        в порядке вставки, иначе - суммарный rowcount.
+        """
+        cursor = cursor or self.engine.cursor
+        max_params = max_params or values_batch.max_params_for(cursor)
+        query = self._lazy_query()
+        returning = False
+        if isinstance(query, static.StaticQuery):
+            groups = ((query.content, params),)
+        else:
+            # Без строк шаблон не рендерится, RETURNING ищется в исходном
+            # тексте, чтобы и пустая вставка вернула список
+            if query.source is not None:
+                returning = values_batch.has_returning(query.source)
+            style = recognize_param_style(cursor)
+            rendered = (query.render(row, style) for row in params)
+            groups = (
+                (sql, (row for _, row in group))
+                for sql, group in groupby(rendered, key=itemgetter(0))
+            )
+
+        returned, rowcount = [], 0
+        event = self.engine.start_event(self.name, 'insert_many')
+        with event or NO_EVENT:
+            for sql, rows in groups:
+                template = values_batch.parse_values(sql)
+                returning = returning or template.returning
+                size = values_batch.rows_per_batch(
+                    template, batch_size, max_params,
+                )
+                for chunk in chunked(rows, size):
+                    batch_sql = values_batch.multi_row_sql(sql, len(chunk))
+                    batch_params = template.params(chunk)
+                    started = perf_counter()
+                    cursor.execute(batch_sql, batch_params)
+                    if event is not None:
+                        event.execute_time += perf_counter() - started
+                        event.sql, event.params = batch_sql, batch_params
+                    if template.returning:
+                        returned.extend(timed_fetch(event, cursor.fetchall))
+                    else:
+                        rowcount += cursor.rowcount
+        return returned if returning else rowcount
 
     def all(
         self,
         params: CursorParams = None,
         /,
         cursor: Cursor = None,
+        _timeout: float | None = None,
+        _single_flight: bool | None = None,
+        _copy: bool = False,
         **kwargs: Any,
     ):
-        cursor = self._lazy_query().execute(
-            params or kwargs,
-            cursor or self.engine.cursor,
+        """
+        _single_flight=True (по умолчанию - single_flight движка)
+        объединяет одновременные вызовы с одинаковыми параметрами
+        в одно выполнение. _copy=True отдает ожидающим глубокую
+        копию результата. С явным курсором объединения нет.
+        """
+        params = params or kwargs
+        if self.engine.coalesces(_single_flight, cursor):
+            return self.engine.flights.run(
+                (self.name, 'all', self.readonly), params,
+                lambda: self.all(
+                    params, _timeout=_timeout, _single_flight=False,
+                ),
+                _copy,
+            )
+
+        cursor, guard = self.engine.statement_cursor(
+            cursor, self.readonly, _timeout,
         )
-        return cursor.fetchall()
+        event = self.engine.start_event(self.name, 'all')
+        with event or NO_EVENT, guard:
+            execute_query(self._lazy_query, params, cursor, event)
+            return timed_fetch(event, cursor.fetchall)
 
     def iter(
         self,
@@ -177,31 +814,61 @@ class Query:
         /,
         _batch: int = 500,
         _cursor: Cursor = None,
+        _prefetch: int = 0,
+        _timeout: float | None = None,
         **kwargs: Any,
     ) -> Generator[Any, None, None]:
-        _cursor = self._lazy_query().execute(
-            params or kwargs,
-            _cursor or self.engine.cursor,
+        """
+        _prefetch > 0 включает выборку следующих пачек в фоновом
+        потоке, значение ограничивает число пачек в очереди.
+        _timeout ограничивает выполнение запроса и выборку каждой
+        пачки, пока вызывающий код обрабатывает строки, соединение
+        свободно для других запросов.
+        """
+        _cursor, guard = self.engine.statement_cursor(
+            _cursor, self.readonly, _timeout,
         )
-        while True:
-            batch = _cursor.fetchmany(_batch)
-            if not batch:
-                return
-            for row in batch:
-                yield row
+        event = self.engine.start_event(self.name, 'iter')
+        with event or NO_EVENT:
+            with guard:
+                execute_query(
+                    self._lazy_query, params or kwargs, _cursor, event,
+                )
+            batches = fetch_batches(
+                _cursor, _batch, _prefetch, event,
+                None if guard is NO_EVENT else guard,
+            )
+            for batch in batches:
+                for row in batch:
+                    yield row
 
     def one(
         self,
         params: CursorParams = None,
         /,
         _cursor: Cursor = None,
+        _timeout: float | None = None,
+        _single_flight: bool | None = None,
+        _copy: bool = False,
         **kwargs: Any,
     ) -> Any:
-        _cursor = self._lazy_query().execute(
-            params or kwargs,
-            _cursor or self.engine.cursor,
+        params = params or kwargs
+        if self.engine.coalesces(_single_flight, _cursor):
+            return self.engine.flights.run(
+                (self.name, 'one', self.readonly), params,
+                lambda: self.one(
+                    params, _timeout=_timeout, _single_flight=False,
+                ),
+                _copy,
+            )
+
+        _cursor, guard = self.engine.statement_cursor(
+            _cursor, self.readonly, _timeout,
         )
-        return _cursor.fetchone()
+        event = self.engine.start_event(self.name, 'one')
+        with event or NO_EVENT, guard:
+            execute_query(self._lazy_query, params, _cursor, event)
+            return timed_fetch(event, _cursor.fetchone, one=True)
 
     def scalar(
         self,
@@ -209,12 +876,16 @@ class Query:
         /,
         _raising: bool = False,
         _cursor: Cursor = None,
+        _timeout: float | None = None,
+        _single_flight: bool | None = None,
         **kwargs: Any,
     ) -> Any:
         value = self.one(
             params or kwargs,
             _raising=_raising,
-            _cursor=_cursor or self.engine.cursor,
+            _cursor=_cursor,
+            _timeout=_timeout,
+            _single_flight=_single_flight,
         )
         if not _raising and value is None:
             return None
@@ -225,14 +896,17 @@ class Query:
         params: CursorParams = None,
         /,
         _cursor: Cursor = None,
+        _timeout: float | None = None,
         **kwargs: Any,
     ) -> int:
         """Количество строк, обработанных запросом"""
-        cursor = self._lazy_query().execute(
-            params or kwargs,
-            _cursor or self.engine.cursor,
+        _cursor, guard = self.engine.statement_cursor(
+            _cursor, self.readonly, _timeout,
         )
-        return cursor.rowcount
+        event = self.engine.start_event(self.name, 'rowcount')
+        with event or NO_EVENT, guard:
+            execute_query(self._lazy_query, params or kwargs, _cursor, event)
+            return _cursor.rowcount
 
 
 class MappedQuery(Generic[mapping.Result]):
@@ -243,24 +917,79 @@ class MappedQuery(Generic[mapping.Result]):
         lazy_query,
         result: TypeAlias,
         relationships: Iterable[mapping.Relationship],
+        columns: Sequence[str] | None = None,
+        name: str = None,
+        readonly: bool = False,
     ) -> None:
         self.engine = engine
         self._lazy_query = lazy_query
+        self.name = name
+        self.readonly = readonly
         self.result = result
-        self.relationships = relationships
+        self.relationships = tuple(
+            rel for rel in relationships
+            if not isinstance(rel, mapping.LazyOneToMany)
+        )
+        self.lazy_relationships = tuple(
+            rel for rel in relationships
+            if isinstance(rel, mapping.LazyOneToMany)
+        )
+        self._lazy_mapper = None
+        if self.lazy_relationships:
+            self._lazy_mapper = mapping.parse_lazy_mapper(
+                result, self.lazy_relationships,
+            )
         self._mapper = None
+        self._mapper_columns = None
         self._compile_mapper = mapping.compile_mapper
+        if columns is not None:
+            self.precompile(columns)
+
+    def precompile(self, columns: Sequence[str]) -> None:
+        """
+        Компилирует маппер для ожидаемых колонок и привязывает его
+        к запросу. При выполнении достаточно сверить имена колонок
+        курсора, при несовпадении используется обычный путь через кэш.
+        """
+        columns = tuple(columns)
+        self._mapper = self._get_mapper(columns)
+        # Драйверы могут менять регистр имен (Postgres приводит
+        # к нижнему), а маппер обращается к колонкам по индексам
+        self._mapper_columns = tuple(column.lower() for column in columns)
+
+    def _matches_precompiled(self, description: CursorDescription) -> bool:
+        columns = self._mapper_columns
+        if len(description) != len(columns):
+            return False
+        for column, name in zip(description, columns):
+            if column[0].lower() != name:
+                return False
+        return True
 
     def mapper(self, cursor: Cursor) -> Callable[
         [Iterable[Row]],
         Generator[Any, Any, None]
     ]:
-        columns = tuple(column[0] for column in cursor.description)
+        if (
+            self._mapper is not None
+            and self._matches_precompiled(cursor.description)
+        ):
+            return self._mapper
+        return self._get_mapper(
+            tuple(column[0] for column in cursor.description)
+        )
+
+    def _get_mapper(self, columns: tuple[str, ...]) -> Callable[
+        [Iterable[Row]],
+        Generator[Any, Any, None]
+    ]:
         key = (self.result, *self.relationships, *columns)
         mapper = self.engine.get_mapper_from_cache(key)
         if not mapper:
             mapper = self._compile_mapper(
                 self.result, self.relationships, columns,
+                disk_cache=self.engine.mapper_disk_cache,
+                profile=self.engine.profile_mappers,
             )
             self.engine.cache_mapper(key, mapper)
         return mapper
@@ -274,7 +1003,7 @@ class MappedQuery(Generic[mapping.Result]):
     ):
         cursor = self._lazy_query().execute(
             params or kwargs,
-            _cursor or self.engine.cursor,
+            _cursor or self.engine.route(self.readonly),
         )
         return self.mapper(cursor).sources()
 
@@ -283,9 +1012,59 @@ class MappedQuery(Generic[mapping.Result]):
         params: CursorParams = None,
         /,
         _cursor: Cursor = None,
+        _prefetch: int = 0,
+        _timeout: float | None = None,
+        _single_flight: bool | None = None,
+        _copy: bool = False,
         **kwargs: Any,
     ) -> list[mapping.Result]:
-        return list(self.iter(params or kwargs, _cursor=_cursor))
+        """
+        _single_flight и _copy - как в Query.all. Без _copy
+        ожидающие получают те же объекты, что и первый поток.
+        """
+        params = params or kwargs
+        if self.engine.coalesces(_single_flight, _cursor):
+            return self.engine.flights.run(
+                self._flight_key('all'), params,
+                lambda: self.all(
+                    params, _prefetch=_prefetch, _timeout=_timeout,
+                    _single_flight=False,
+                ),
+                _copy,
+            )
+        return list(self._iter(
+            params, 500, _cursor, _prefetch, 'all', _timeout,
+        ))
+
+    def loader(
+        self,
+        key: Key | None = None,
+        param: str = 'ids',
+        many: bool = False,
+        batch_size: int = DEFAULT_CHUNK_SIZE,
+    ) -> DataLoader:
+        """
+        Как Query.loader, но для объектов результата. По умолчанию
+        ключ - поля ID класса результата.
+        """
+        if key is None:
+            mapper = mapping.context.Mapper.parse_from_annotation(
+                self.result,
+            )
+            if not isinstance(mapper, mapping.context.Mapper):
+                raise ValueError(
+                    'key is required for results other than a single class'
+                )
+            key = mapper.id.fields
+        return DataLoader(
+            self, self.engine.loaders, key, param, many, batch_size,
+        )
+
+    def _flight_key(self, method: str) -> tuple:
+        return (
+            self.name, method, self.readonly,
+            self.result, *self.relationships, *self.lazy_relationships,
+        )
 
     def iter(
         self,
@@ -293,52 +1072,78 @@ class MappedQuery(Generic[mapping.Result]):
         /,
         _batch: int | None = 500,
         _cursor: Cursor = None,
+        _prefetch: int = 0,
+        _timeout: float | None = None,
         **kwargs: Any,
     ) -> Generator[mapping.Result, None, None]:
-        _cursor = self._lazy_query().execute(
-            params or kwargs,
-            _cursor or self.engine.cursor,
+        return self._iter(
+            params or kwargs, _batch, _cursor, _prefetch, 'iter', _timeout,
         )
-        mapper = self.mapper(_cursor)
 
-        if _batch:
-            fetch = partial(_cursor.fetchmany, _batch)
-        else:
-            fetch = _cursor.fetchall
+    def _iter(
+        self,
+        params: CursorParams,
+        batch: int | None,
+        cursor: Cursor | None,
+        prefetch: int,
+        method: str,
+        timeout: float | None = None,
+    ) -> Generator[mapping.Result, None, None]:
+        cursor, guard = self.engine.statement_cursor(
+            cursor, self.readonly, timeout,
+        )
+        event = self.engine.start_event(self.name, method)
+        with event or NO_EVENT:
+            with guard:
+                execute_query(self._lazy_query, params, cursor, event)
+            mapper = self.mapper(cursor)
+            batches = fetch_batches(
+                cursor, batch, prefetch, event,
+                None if guard is NO_EVENT else guard,
+            )
 
-        def rows_iter():
+            if event is None:
+                objects = mapper(chain.from_iterable(batches))
+                if self.lazy_relationships:
+                    objects = mapping.attach_lazy(
+                        objects, self._lazy_mapper, self.lazy_relationships,
+                        batch,
+                    )
+                for obj in objects:
+                    yield obj
+                return
+
+            # Время маппинга - время внутри маппера без ожидания строк
+            waited = 0.0
+
+            def rows_iter():
+                nonlocal waited
+                batches_iter = iter(batches)
+                while True:
+                    started = perf_counter()
+                    rows = next(batches_iter, None)
+                    waited += perf_counter() - started
+                    if rows is None:
+                        return
+                    for row in rows:
+                        yield row
+
+            objects = mapper(rows_iter())
+            if self.lazy_relationships:
+                objects = mapping.attach_lazy(
+                    objects, self._lazy_mapper, self.lazy_relationships,
+                    batch,
+                )
             while True:
-                rows = fetch()
-                if not rows:
+                started = perf_counter()
+                waited_before = waited
+                obj = next(objects, _END)
+                event.map_time += (
+                    perf_counter() - started - (waited - waited_before)
+                )
+                if obj is _END:
                     return
-                for row in rows:
-                    yield row
-
-        for obj in mapper(rows_iter()):
-            yield obj
-
-        # next(mapper_instance)
-        # while True:
-        #     if _batch:
-        #         rows = _cursor.fetchmany(_batch)
-        #     else:
-        #         rows = _cursor.fetchall()
-        #     if not rows:
-        #         try:
-        #             last_obj = mapper_instance.send(None)
-        #         except StopIteration:
-        #             last_obj = None
-        #         finally:
-        #             mapper_instance.close()
-        #             _cursor.close()
-        #         if last_obj:
-        #             yield last_obj
-        #         break
-        #     for row in rows:
-        #         result = mapper_instance.send(row)
-        #         if result is not None:
-        #             yield result
-        #             next(mapper_instance)
+                yield obj
 
     def one(
         self,
@@ -346,29 +1151,52 @@ class MappedQuery(Generic[mapping.Result]):
         /,
         _batch: int = 500,
         _cursor: Cursor = None,
+        _timeout: float | None = None,
+        _single_flight: bool | None = None,
+        _copy: bool = False,
         **kwargs: Any,
     ) -> mapping.Result:
-        iterator = self.iter(
-            params or kwargs,
-            _batch,
-            _cursor or self.engine.cursor,
+        params = params or kwargs
+        if self.engine.coalesces(_single_flight, _cursor):
+            return self.engine.flights.run(
+                self._flight_key('one'), params,
+                lambda: self.one(
+                    params, _batch=_batch, _timeout=_timeout,
+                    _single_flight=False,
+                ),
+                _copy,
+            )
+        iterator = self._iter(
+            params, _batch, _cursor, 0, 'one', _timeout,
         )
         try:
-            result = next(iterator)
-        except StopIteration:
+            return next(iterator, None)
+        finally:
             iterator.close()
-            result = None
-        return result
 
 
 T = TypeVar('T')
 
 @doublewrap
-def in_transaction(fn: T, prop: str = 'db', type_: Type[Engine] = Engine) -> T:
+def in_transaction(
+    fn: T,
+    prop: str = 'db',
+    type_: Type[Engine] = Engine,
+    readonly: bool = False,
+) -> T:
+    """
+    readonly=True открывает транзакцию на реплике,
+    если у движка они настроены.
+    """
 
     @wraps(fn)
     def wrapper(self, *args, **kwargs):
-        with getattr(self, prop).transaction():
+        engine = getattr(self, prop)
+        if readonly:
+            transaction = engine.transaction(readonly=True)
+        else:
+            transaction = engine.transaction()
+        with transaction:
             return fn(self, *args, **kwargs)
 
     return add_extra_annotation(wrapper, prop, type_)
@@ -2,3 +2,27 @@ class ConnectionLimitError(Exception):
     """
     The connection pool has run out of available connections
     """
+
+
+class DeadlineExpired(ConnectionLimitError):
+    """
+    The deadline passed before a connection could be acquired
+    """
+
+
+class PoolOverloaded(ConnectionLimitError):
+    """
+    The adaptive concurrency limit of the pool is reached
+    """
+
+
+class StatementTimeoutError(TimeoutError):
+    """
+    The statement was cancelled because it ran longer than its timeout
+    """
+
+
+class WriteBufferFull(Exception):
+    """
+    The write buffer queue stayed full for the whole put timeout
+    """
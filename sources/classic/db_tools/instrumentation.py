@@ -0,0 +1,180 @@
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+from time import perf_counter
+from types import TracebackType
+from typing import Any, Callable, Sequence, TypeAlias
+import logging
+import threading
+
+from .types import Row
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(slots=True, eq=False)
+class QueryEvent:
+    """
+    Замеры одного выполнения запроса. Время в секундах.
+    bytes - примерный объем выборки: длина текстовых и бинарных
+    значений плюс 8 байт на любое другое значение.
+    """
+    template: str
+    method: str
+    listeners: Sequence['Listener'] = field(repr=False, default=())
+    sql: str | None = None
+    params: Any = field(repr=False, default=None)
+    render_time: float = 0.0
+    execute_time: float = 0.0
+    fetch_time: float = 0.0
+    map_time: float = 0.0
+    rows: int = 0
+    bytes: int = 0
+    error: BaseException | None = None
+
+    @property
+    def total_time(self) -> float:
+        return (
+            self.render_time + self.execute_time
+            + self.fetch_time + self.map_time
+        )
+
+    def fetched(
+        self,
+        rows: Sequence[Row] | Row | None,
+        started: float,
+        one: bool = False,
+    ) -> None:
+        self.fetch_time += perf_counter() - started
+        if rows is None:
+            return
+        if one:
+            rows = (rows,)
+        self.rows += len(rows)
+        self.bytes += rows_size(rows)
+
+    def timed(
+        self,
+        fetch: Callable[[], Sequence[Row]],
+    ) -> Callable[[], Sequence[Row]]:
+        def timed_fetch():
+            started = perf_counter()
+            rows = fetch()
+            self.fetched(rows, started)
+            return rows
+        return timed_fetch
+
+    def __enter__(self) -> 'QueryEvent':
+        return self
+
+    def __exit__(
+        self,
+        type_: type[BaseException] | None,
+        value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> bool:
+        # Закрытый до конца генератор ошибкой не считается
+        if not isinstance(value, GeneratorExit):
+            self.error = value
+        self.emit()
+        return False
+
+    def emit(self) -> None:
+        for listener in self.listeners:
+            try:
+                listener(self)
+            except Exception:
+                logger.exception('Query listener %r failed', listener)
+
+
+Listener: TypeAlias = Callable[[QueryEvent], None]
+
+
+def rows_size(rows: Sequence[Row]) -> int:
+    size = 0
+    for row in rows:
+        if isinstance(row, dict):
+            row = row.values()
+        for value in row:
+            if isinstance(value, (str, bytes, bytearray, memoryview)):
+                size += len(value)
+            else:
+                size += 8
+    return size
+
+
+def percentile(sorted_values: Sequence[float], percent: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = round(percent / 100 * (len(sorted_values) - 1))
+    return sorted_values[index]
+
+
+class QueryStats:
+    """
+    Слушатель, который копит замеры по шаблонам и считает перцентили.
+    Для каждого шаблона хранится не больше max_samples последних
+    замеров.
+    """
+    phases = ('total', 'render', 'execute', 'fetch', 'map')
+
+    def __init__(
+        self,
+        max_samples: int = 10_000,
+        percentiles: Sequence[float] = (50, 90, 99),
+    ):
+        self.max_samples = max_samples
+        self.percentiles = percentiles
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self.lock:
+            self.samples = defaultdict(
+                lambda: deque(maxlen=self.max_samples),
+            )
+            self.counts = defaultdict(int)
+            self.errors = defaultdict(int)
+            self.rows = defaultdict(int)
+            self.bytes = defaultdict(int)
+
+    def __call__(self, event: QueryEvent) -> None:
+        sample = (
+            event.total_time, event.render_time, event.execute_time,
+            event.fetch_time, event.map_time,
+        )
+        with self.lock:
+            self.samples[event.template].append(sample)
+            self.counts[event.template] += 1
+            self.rows[event.template] += event.rows
+            self.bytes[event.template] += event.bytes
+            if event.error is not None:
+                self.errors[event.template] += 1
+
+    def report(self) -> dict[str, dict[str, Any]]:
+        with self.lock:
+            samples = {
+                template: list(values)
+                for template, values in self.samples.items()
+            }
+            counts = dict(self.counts)
+            errors = dict(self.errors)
+            rows = dict(self.rows)
+            size = dict(self.bytes)
+
+        report = {}
+        for template, values in samples.items():
+            item = {
+                'count': counts[template],
+                'errors': errors.get(template, 0),
+                'rows': rows[template],
+                'bytes': size[template],
+            }
+            for index, phase in enumerate(self.phases):
+                timings = sorted(value[index] for value in values)
+                item[phase] = {
+                    f'p{percent:g}': percentile(timings, percent)
+                    for percent in self.percentiles
+                }
+                item[phase]['max'] = timings[-1] if timings else 0.0
+            report[template] = item
+        return report
@@ -0,0 +1,169 @@
+from itertools import islice
+from typing import Any, Callable, Hashable, Iterable
+import threading
+
+from .mapping.lazy import _getter
+
+DEFAULT_BATCH_SIZE = 1000
+
+Key = str | int | tuple[str, ...] | Callable[[Any], Hashable]
+
+
+class LoaderState:
+    __slots__ = ('cache', 'pending')
+
+    def __init__(self):
+        self.cache: dict[Hashable, Any] = {}
+        #: Упорядоченное множество ключей, ожидающих загрузки
+        self.pending: dict[Hashable, None] = {}
+
+
+class LoaderScope(threading.local):
+    """
+    Запомненные результаты и ожидающие ключи загрузчиков
+    для текущего контекста движка в потоке.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.states: dict['DataLoader', LoaderState] = {}
+
+    def state(self, loader: 'DataLoader') -> LoaderState:
+        state = self.states.get(loader)
+        if state is None:
+            state = self.states[loader] = LoaderState()
+        return state
+
+    def clear(self) -> None:
+        self.states = {}
+
+
+class Deferred:
+    """
+    Отложенный результат загрузчика для одного ключа. get загружает
+    одним запросом все ключи, накопленные к этому моменту.
+    """
+    __slots__ = ('loader', 'key')
+
+    def __init__(self, loader: 'DataLoader', key: Hashable):
+        self.loader = loader
+        self.key = key
+
+    def get(self) -> Any:
+        return self.loader.load(self.key)
+
+    def __repr__(self) -> str:
+        return f'<{self.__class__.__name__} {self.key!r}>'
+
+
+class DataLoader:
+    """
+    Загрузка по ключам пачками вместо запроса на каждый ключ.
+    Запрошенные в контексте движка ключи без повторов передаются
+    в query одним списком в параметре param (не больше batch_size
+    за запрос), key достает ключ из строки или объекта результата.
+    Результаты запоминаются до выхода из контекста движка или до
+    Engine.clear_loaders, поэтому после изменения данных в том же
+    контексте загрузчик надо очистить.
+
+    Для отсутствующих в результате ключей возвращается None,
+    при many=True - пустой список всех строк ключа.
+    """
+
+    def __init__(
+        self,
+        query: Any,
+        scope: LoaderScope,
+        key: Key = 0,
+        param: str = 'ids',
+        many: bool = False,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+    ):
+        if batch_size < 1:
+            raise ValueError('batch_size must be positive')
+        self.query = query
+        self.scope = scope
+        self.key = key
+        self.param = param
+        self.many = many
+        self.batch_size = batch_size
+        self.key_of: Callable[[Any], Hashable] | None = None
+        self.lock = threading.Lock()
+        #: Сколько запросов выполнил загрузчик
+        self.batches = 0
+        #: Сколько ключей было загружено этими запросами
+        self.keys = 0
+
+    def defer(self, key: Hashable) -> Deferred:
+        """Добавляет ключ в следующую пачку, не выполняя запрос"""
+        state = self.scope.state(self)
+        if key not in state.cache:
+            state.pending[key] = None
+        return Deferred(self, key)
+
+    def load(self, key: Hashable) -> Any:
+        state = self.scope.state(self)
+        try:
+            return state.cache[key]
+        except KeyError:
+            pass
+        state.pending[key] = None
+        self._dispatch(state)
+        return state.cache[key]
+
+    def load_many(self, keys: Iterable[Hashable]) -> list[Any]:
+        keys = list(keys)
+        state = self.scope.state(self)
+        cache = state.cache
+        for key in keys:
+            if key not in cache:
+                state.pending[key] = None
+        self._dispatch(state)
+        return [cache[key] for key in keys]
+
+    def dispatch(self) -> None:
+        """Загружает все накопленные ключи"""
+        self._dispatch(self.scope.state(self))
+
+    def prime(self, key: Hashable, value: Any) -> None:
+        state = self.scope.state(self)
+        state.cache[key] = value
+        state.pending.pop(key, None)
+
+    def clear(self, key: Hashable = None) -> None:
+        """Забывает результат для ключа, без ключа - все результаты"""
+        state = self.scope.state(self)
+        if key is None:
+            state.cache.clear()
+        else:
+            state.cache.pop(key, None)
+
+    def _dispatch(self, state: LoaderState) -> None:
+        pending = state.pending
+        while pending:
+            keys = list(islice(pending, self.batch_size))
+            for key in keys:
+                del pending[key]
+            state.cache.update(self._fetch(keys))
+
+    def _fetch(self, keys: list[Hashable]) -> dict[Hashable, Any]:
+        rows = self.query.all({self.param: keys})
+        if self.many:
+            found = {key: [] for key in keys}
+        else:
+            found = dict.fromkeys(keys)
+        key_of = self.key_of
+        for row in rows:
+            if key_of is None:
+                key_of = self.key_of = _getter(self.key, isinstance(row, dict))
+            key = key_of(row)
+            if key not in found:
+                continue
+            if self.many:
+                found[key].append(row)
+            else:
+                found[key] = row
+        with self.lock:
+            self.batches += 1
+            self.keys += len(keys)
+        return found
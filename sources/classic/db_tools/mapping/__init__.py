@@ -1,3 +1,9 @@
 from .compiler import compile_mapper
-from .params import Relationship, OneToMany, OneToOne, ID, Name
+from .disk_cache import MapperDiskCache
+from .profile import MapperStats
+from .params import (
+    Relationship, OneToMany, OneToOne, LazyOneToMany, ID, Name,
+)
+from .context import parse_select_columns
 from .types import Result, Mapper
+from .lazy import LazyCollection, BatchLoader, attach_lazy, parse_lazy_mapper
@@ -1,10 +1,14 @@
 import ast
+import hashlib
+import linecache
 from typing import Generator, Iterable, TypeAlias, Callable, TypeVar
 
 from ..types import Row
 
 from .params import Relationship
 from .context import Context
+from .disk_cache import MapperDiskCache
+from .profile import MapperStats
 from .render import render_module
 
 
@@ -12,23 +16,74 @@ Result = TypeVar('Result')
 Mapper: TypeAlias = Callable[[], Generator[Result, Row, None]]
 
 
+def mapper_filename(ctx: Context, sources: str) -> str:
+    """
+    Синтетическое имя файла маппера: результат и хэш исходника.
+    Одинаковый код получает одно и то же имя между запусками.
+    """
+    mappers = ctx.result_mappers or ctx.mappers.values()
+    result = ','.join(
+        f'{mapper.cls.__module__}.{mapper.cls.__qualname__}'
+        for mapper in mappers
+    )
+    digest = hashlib.sha1(sources.encode()).hexdigest()[:12]
+    return f'<mapper {result} {digest}>'
+
+
+def register_sources(filename: str, sources: str) -> None:
+    # Профилировщики и traceback берут строки кода из linecache,
+    # mtime None защищает запись от linecache.checkcache
+    linecache.cache[filename] = (
+        len(sources), None, sources.splitlines(keepends=True), filename,
+    )
+
+
 def compile_mapper(
     result: Result,
     relationships: Iterable[Relationship],
     columns: tuple[str, ...],
+    disk_cache: MapperDiskCache | None = None,
+    profile: bool = False,
 ) -> Mapper[Result]:
+    """
+    При profile=True маппер считает строки, созданные объекты
+    и попадания в identity map в MapperStats, доступном как
+    func.stats. Такие мапперы не кэшируются на диске.
+    """
+    relationships = tuple(relationships)
     ctx = Context(result, relationships, columns)
 
-    ast_module = render_module(ctx)
-    code = compile(ast_module, '<string>', 'exec')
+    cached = key = None
+    if disk_cache is not None and not profile:
+        key = disk_cache.fingerprint(ctx, result, relationships)
+        cached = disk_cache.load(key)
+
+    if cached:
+        code, sources = cached
+        filename = code.co_filename
+    else:
+        ast_module = render_module(ctx, profile)
+        # Номера строк в AST условные, начиная с 3.11 compile их
+        # проверяет, поэтому компилируем уже отрендеренный исходник
+        sources = ast.unparse(ast_module)
+        filename = mapper_filename(ctx, sources)
+        code = compile(sources, filename, 'exec')
+        if key is not None:
+            disk_cache.save(key, code, sources)
+    register_sources(filename, sources)
+
     namespace = {
         mapper.cls.__name__: mapper.cls
         for mapper in ctx.mappers.values()
     }
+    stats = None
+    if profile:
+        stats = namespace['mapper_stats'] = MapperStats(filename)
     exec(code, namespace)
     func = namespace['mapper_func']
 
     # Ради удобства отладки добавим код маппера
-    func.sources = lambda: ast.unparse(ast_module)
+    func.sources = lambda: sources
+    func.stats = stats
 
     return func
@@ -2,6 +2,7 @@ from collections import defaultdict
 from functools import cached_property
 from typing import Iterable
 import inspect
+import re
 import typing
 from dataclasses import dataclass
 from typing import Type, Any, Literal
@@ -10,6 +11,20 @@ from .params import Relationship, ID, Name
 from .types import Result
 
 
+_ALIAS_RE = re.compile(
+    r'\bAS\s+(["`]?)([A-Za-z_][A-Za-z0-9_]*__[A-Za-z0-9_]+)\1',
+    re.IGNORECASE,
+)
+
+
+def parse_select_columns(sql: str) -> tuple[str, ...]:
+    """
+    Достает из SELECT или RETURNING псевдонимы вида cls__field
+    в порядке их следования.
+    """
+    return tuple(match.group(2) for match in _ALIAS_RE.finditer(sql))
+
+
 @dataclass(slots=True, frozen=True)
 class Mapper:
     cls: Type[Any]
@@ -67,6 +82,14 @@ class Mapper:
     def id_name(self) -> str:
         return self.name + '_id'
 
+    def id_part_name(self, index: int) -> str:
+        return f'{self.id_name}_{index}'
+
+    def last_id_name(self, index: int | None = None) -> str:
+        if index is None:
+            return f'last_{self.id_name}'
+        return f'last_{self.id_name}_{index}'
+
     @property
     def identity_map_name(self) -> str:
         return self.name + '_map'
@@ -75,6 +98,14 @@ class Mapper:
     def last_obj_name(self) -> str:
         return f'last_{self.name}'
 
+    @property
+    def lookups_name(self) -> str:
+        return self.name + '_lookups'
+
+    @property
+    def created_name(self) -> str:
+        return self.name + '_created'
+
 
 class Context:
     mappers: dict[str, Mapper]
@@ -0,0 +1,107 @@
+from functools import cache
+from importlib.util import MAGIC_NUMBER
+from os import PathLike
+from pathlib import Path
+from types import CodeType
+from typing import Iterable
+import hashlib
+import inspect
+import marshal
+import os
+import tempfile
+
+from .context import Context
+from .params import Relationship
+
+
+# Меняется при несовместимых изменениях формата файлов кэша
+FORMAT_VERSION = 1
+
+
+@cache
+def _renderer_digest() -> bytes:
+    # Код маппера зависит от генератора, поэтому любая правка
+    # рендера должна инвалидировать кэш
+    digest = hashlib.sha256(MAGIC_NUMBER)
+    here = Path(__file__).parent
+    for name in ('context.py', 'render.py', 'compiler.py'):
+        digest.update((here / name).read_bytes())
+    return digest.digest()
+
+
+def _class_definition(cls: type) -> str:
+    # inspect.getsource разбирает весь модуль и стоит дороже сборки
+    # маппера, поэтому определение класса отслеживаем по сигнатуре
+    # и по изменению файла модуля
+    try:
+        signature = str(inspect.signature(cls))
+    except (ValueError, TypeError):
+        signature = ''
+    try:
+        stat = os.stat(inspect.getfile(cls))
+        modified = f'{stat.st_mtime_ns}:{stat.st_size}'
+    except (OSError, TypeError):
+        modified = ''
+    return f'{cls.__module__}.{cls.__qualname__}{signature}@{modified}\n'
+
+
+class MapperDiskCache:
+    """
+    Хранит скомпилированный код мапперов на диске, чтобы после
+    перезапуска процесса не строить AST заново.
+
+    Ключ - отпечаток результата, связей, колонок и определений
+    участвующих классов, поэтому при изменении классов старые
+    записи просто перестают находиться.
+    """
+
+    def __init__(self, path: str | PathLike):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def fingerprint(
+        self,
+        ctx: Context,
+        result: object,
+        relationships: Iterable[Relationship],
+    ) -> str:
+        digest = hashlib.sha256(_renderer_digest())
+        digest.update(f'{FORMAT_VERSION}\n{result!r}\n'.encode())
+        for rel in relationships:
+            digest.update(f'{rel!r}\n'.encode())
+        digest.update(repr(ctx.columns).encode())
+        for mapper in ctx.mappers.values():
+            digest.update(_class_definition(mapper.cls).encode())
+        return digest.hexdigest()
+
+    def _filename(self, key: str) -> Path:
+        return self.path / f'{key}.mapper'
+
+    def load(self, key: str) -> tuple[CodeType, str] | None:
+        try:
+            with open(self._filename(key), 'rb') as file:
+                code, sources = marshal.load(file)
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+        if not isinstance(code, CodeType):
+            return None
+        return code, sources
+
+    def save(self, key: str, code: CodeType, sources: str) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                marshal.dump((code, sources), file)
+            os.replace(tmp_path, self._filename(key))
+        except OSError:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+
+    def clear(self) -> None:
+        for path in self.path.glob('*.mapper'):
+            try:
+                path.unlink()
+            except OSError:
+                pass
@@ -0,0 +1,203 @@
+from collections import defaultdict
+from collections.abc import MutableSequence
+from itertools import islice
+from operator import attrgetter, itemgetter
+from typing import Any, Callable, Hashable, Iterable, Iterator
+import threading
+
+from .context import Mapper
+from .params import LazyOneToMany
+from .types import Result
+
+
+def _getter(
+    key: str | int | tuple[str, ...] | Callable[[Any], Hashable],
+    item: bool,
+) -> Callable[[Any], Hashable]:
+    if callable(key):
+        return key
+    if not isinstance(key, tuple):
+        key = (key,)
+    if item or isinstance(key[0], int):
+        return itemgetter(*key)
+    return attrgetter(*key)
+
+
+class LazyCollection(MutableSequence):
+    """
+    Список дочерних объектов, который при первом обращении просит
+    загрузчик догрузить коллекции всех родителей из той же выборки.
+    """
+    __slots__ = ('loader', '_items')
+
+    def __init__(self, loader: 'BatchLoader'):
+        self.loader = loader
+        self._items = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._items is not None
+
+    def _fill(self, items: list[Any]) -> None:
+        self._items = items
+
+    def _get(self) -> list[Any]:
+        if self._items is None:
+            self.loader.load()
+        return self._items
+
+    def __getitem__(self, index):
+        return self._get()[index]
+
+    def __setitem__(self, index, value):
+        self._get()[index] = value
+
+    def __delitem__(self, index):
+        del self._get()[index]
+
+    def __len__(self) -> int:
+        return len(self._get())
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self._get())
+
+    def insert(self, index: int, value: Any) -> None:
+        self._get().insert(index, value)
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, LazyCollection):
+            other = other._get()
+        return self._get() == other
+
+    def __repr__(self) -> str:
+        if self._items is None:
+            return f'<{self.__class__.__name__} (not loaded)>'
+        return repr(self._items)
+
+
+class BatchLoader:
+    """
+    Загрузчик одной ленивой связи для одной выборки.
+    Копит идентификаторы родителей, а при первом обращении к любой
+    из коллекций загружает их все одним запросом.
+    """
+
+    def __init__(self, mapper: Mapper, relationship: LazyOneToMany):
+        item = mapper.accessor_type == 'item'
+        self.relationship = relationship
+        self.id_fields = mapper.id.fields
+        self.id_of = _getter(mapper.id.fields, item)
+        self.child_key = None
+        self.pending: dict[Hashable, list[LazyCollection]] = (
+            defaultdict(list)
+        )
+        self.lock = threading.Lock()
+        #: Сколько запросов выполнил загрузчик
+        self.batches = 0
+        #: Сколько строк (объектов) получено этими запросами
+        self.rows = 0
+        if item:
+            self._set = lambda obj, value: obj.__setitem__(
+                relationship.field, value,
+            )
+        else:
+            self._set = lambda obj, value: setattr(
+                obj, relationship.field, value,
+            )
+
+    def register(self, obj: Any) -> LazyCollection:
+        collection = LazyCollection(self)
+        with self.lock:
+            self.pending[self.id_of(obj)].append(collection)
+        self._set(obj, collection)
+        return collection
+
+    def load(self) -> None:
+        with self.lock:
+            if not self.pending:
+                return
+            pending = self.pending
+
+            # Ожидающие коллекции сбрасываются только после успешной
+            # выборки, чтобы после ошибки обращение повторило загрузку
+            grouped = defaultdict(list)
+            rows = 0
+            rel = self.relationship
+            for child in rel.query.iter(self.params(list(pending))):
+                if self.child_key is None:
+                    self.child_key = _getter(
+                        rel.key, isinstance(child, dict),
+                    )
+                grouped[self.child_key(child)].append(child)
+                rows += 1
+            self.pending = defaultdict(list)
+            self.rows += rows
+            self.batches += 1
+
+            for id_, collections in pending.items():
+                for collection in collections:
+                    collection._fill(list(grouped.get(id_, ())))
+
+    def params(self, ids: list[Hashable]) -> dict[str, list[Any]]:
+        """
+        Идентификаторы для запроса. Составной идентификатор
+        передается не списком кортежей, которые драйверы не умеют
+        передавать, а списком значений на каждое поле в параметрах
+        param_<поле>.
+        """
+        param = self.relationship.param
+        if len(self.id_fields) == 1:
+            return {param: ids}
+        return {
+            f'{param}_{field}': [id_[index] for id_ in ids]
+            for index, field in enumerate(self.id_fields)
+        }
+
+
+def parse_lazy_mapper(
+    result: Result,
+    relationships: Iterable[LazyOneToMany],
+) -> Mapper:
+    mapper = Mapper.parse_from_annotation(result)
+    if not isinstance(mapper, Mapper):
+        raise ValueError(
+            'Lazy relationships are supported only for single class results',
+        )
+    for rel in relationships:
+        if isinstance(rel.left, str):
+            left_name = rel.left.lower()
+        else:
+            left_name = Mapper.parse_from_annotation(rel.left).name
+        if left_name != mapper.name:
+            raise ValueError(
+                f'Lazy relationship {rel.field} must be declared '
+                f'on the result class {mapper.name}',
+            )
+    return mapper
+
+
+def attach_lazy(
+    objects: Iterable[Any],
+    mapper: Mapper,
+    relationships: Iterable[LazyOneToMany],
+    buffer: int | None = None,
+) -> Iterator[Any]:
+    """
+    Родители регистрируются в загрузчиках до того, как будут отданы:
+    все сразу при buffer=None, иначе пачками по buffer, чтобы при
+    потоковом чтении одна загрузка покрывала всю пачку.
+    """
+    loaders = [BatchLoader(mapper, rel) for rel in relationships]
+    iterator = iter(objects)
+    while True:
+        if buffer is None:
+            chunk = list(iterator)
+        else:
+            chunk = list(islice(iterator, buffer))
+        for obj in chunk:
+            if obj is not None:
+                for loader in loaders:
+                    loader.register(obj)
+        yield from chunk
+        if buffer is None or len(chunk) < buffer:
+            return
@@ -1,5 +1,5 @@
 from dataclasses import dataclass
-from typing import Type, Any
+from typing import Type, Any, Callable, Hashable
 
 
 @dataclass(slots=True, init=False, unsafe_hash=True)
@@ -33,3 +33,21 @@ class OneToOne(Relationship):
 @dataclass(slots=True, frozen=True)
 class OneToMany(Relationship):
     pass
+
+
+@dataclass(slots=True, frozen=True)
+class LazyOneToMany(Relationship):
+    """
+    Коллекция, которая загружается при первом обращении.
+    query получает идентификаторы всех ожидающих загрузки родителей
+    из одной выборки одним параметром param, key достает
+    из дочернего объекта (или строки) идентификатор родителя.
+
+    При составном ID родителя query получает по списку на каждое
+    поле в параметрах param_<поле>, например, для Postgres:
+    WHERE (a, b) IN (SELECT * FROM unnest(%(ids_a)s, %(ids_b)s)),
+    а key - кортеж полей или функция, возвращающая кортеж.
+    """
+    query: Any
+    key: str | tuple[str, ...] | Callable[[Any], Hashable]
+    param: str = 'ids'
@@ -0,0 +1,53 @@
+from collections import defaultdict
+from typing import Any
+import threading
+
+
+class MapperStats:
+    """
+    Счетчики маппера, скомпилированного с profile=True. Маппер копит
+    их в локальных переменных и сбрасывает сюда один раз по окончании
+    (или закрытии) генератора.
+
+    Для каждого класса считаются созданные объекты и обращения
+    к identity map. Обращение, не создавшее объект, - попадание
+    в identity map, строка без обращения - попадание по совпадению
+    id с прошлой строкой.
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.rows = 0
+        self.lookups = defaultdict(int)
+        self.objects = defaultdict(int)
+
+    def record(
+        self,
+        rows: int,
+        counters: dict[str, tuple[int, int]],
+    ) -> None:
+        with self.lock:
+            self.calls += 1
+            self.rows += rows
+            for name, (lookups, objects) in counters.items():
+                self.lookups[name] += lookups
+                self.objects[name] += objects
+
+    def report(self) -> dict[str, Any]:
+        with self.lock:
+            return {
+                'calls': self.calls,
+                'rows': self.rows,
+                'mappers': {
+                    name: {
+                        'objects': self.objects[name],
+                        'identity_map_hits': (
+                            lookups - self.objects[name]
+                        ),
+                        'run_length_hits': self.rows - lookups,
+                    }
+                    for name, lookups in self.lookups.items()
+                },
+            }
@@ -15,6 +15,113 @@ def render_columns(ctx: Context, col_offset: int) -> Iterable[ast.stmt]:
         )
 
 
+def render_row_item(
+    ctx: Context,
+    column: str,
+    col_offset: int,
+) -> ast.expr:
+    return ast.Subscript(
+        value=ast.Name(id='row', ctx=ast.Load()),
+        slice=ast.Name(id=column, ctx=ast.Load()),
+        ctx=ast.Load(),
+        lineno=ctx.lineno(),
+        col_offset=col_offset,
+    )
+
+
+def render_last_ids(ctx: Context, col_offset: int) -> Iterable[ast.stmt]:
+    # Начальное значение не равно ни одному id из строк,
+    # поэтому первая строка всегда идет в identity map
+    for mapper in ctx.mappers.values():
+        if len(mapper.id.fields) == 1:
+            names = [mapper.last_id_name()]
+        else:
+            names = [
+                mapper.last_id_name(index)
+                for index in range(len(mapper.id.fields))
+            ]
+        for name in names:
+            yield ast.Assign(
+                targets=[ast.Name(id=name, ctx=ast.Store())],
+                value=ast.Call(
+                    func=ast.Name(id='object', ctx=ast.Load()),
+                    args=[],
+                    keywords=[],
+                ),
+                lineno=ctx.lineno(),
+                col_offset=col_offset,
+            )
+
+
+def render_increment(
+    ctx: Context,
+    name: str,
+    col_offset: int,
+) -> ast.stmt:
+    return ast.AugAssign(
+        target=ast.Name(id=name, ctx=ast.Store()),
+        op=ast.Add(),
+        value=ast.Constant(value=1),
+        lineno=ctx.lineno(),
+        col_offset=col_offset,
+    )
+
+
+def render_profile_counters(
+    ctx: Context,
+    col_offset: int,
+) -> Iterable[ast.stmt]:
+    names = ['profile_rows']
+    for mapper in ctx.mappers.values():
+        names.extend((mapper.lookups_name, mapper.created_name))
+    for name in names:
+        yield ast.Assign(
+            targets=[ast.Name(id=name, ctx=ast.Store())],
+            value=ast.Constant(value=0),
+            lineno=ctx.lineno(),
+            col_offset=col_offset,
+        )
+
+
+def render_profile_record(ctx: Context, col_offset: int) -> ast.stmt:
+    # mapper_stats.record(profile_rows, {'task': (lookups, created)})
+    return ast.Expr(
+        value=ast.Call(
+            func=ast.Attribute(
+                value=ast.Name(id='mapper_stats', ctx=ast.Load()),
+                attr='record',
+                ctx=ast.Load(),
+            ),
+            args=[
+                ast.Name(id='profile_rows', ctx=ast.Load()),
+                ast.Dict(
+                    keys=[
+                        ast.Constant(value=mapper.name)
+                        for mapper in ctx.mappers.values()
+                    ],
+                    values=[
+                        ast.Tuple(
+                            elts=[
+                                ast.Name(
+                                    id=mapper.lookups_name, ctx=ast.Load(),
+                                ),
+                                ast.Name(
+                                    id=mapper.created_name, ctx=ast.Load(),
+                                ),
+                            ],
+                            ctx=ast.Load(),
+                        )
+                        for mapper in ctx.mappers.values()
+                    ],
+                ),
+            ],
+            keywords=[],
+        ),
+        lineno=ctx.lineno(),
+        col_offset=col_offset,
+    )
+
+
 def render_identity_maps(ctx: Context, col_offset: int) -> Iterable[ast.stmt]:
     for mapper in ctx.mappers.values():
         yield ast.Assign(
@@ -41,11 +148,18 @@ def render_last_root(ctx: Context, col_offset: int) -> Iterable[ast.stmt]:
     )]
 
 
-def render_cycle(ctx: Context, col_offset: int) -> ast.stmt:
+def render_cycle(
+    ctx: Context,
+    col_offset: int,
+    profile: bool = False,
+) -> ast.stmt:
+    body = list(render_cycle_body(ctx, col_offset + 1, profile))
+    if profile:
+        body.insert(0, render_increment(ctx, 'profile_rows', col_offset + 1))
     return ast.For(
         target=ast.Name(id='row', ctx=ast.Store()),
         iter=ast.Name(id='rows', ctx=ast.Load()),
-        body=list(render_cycle_body(ctx, col_offset + 1)),
+        body=body,
         orelse=[],
         lineno=ctx.lineno(),
         col_offset=col_offset,
@@ -54,39 +168,121 @@ def render_cycle(ctx: Context, col_offset: int) -> ast.stmt:
 
 def render_cycle_body(
     ctx: Context,
-    col_offset: int
+    col_offset: int,
+    profile: bool = False,
 ) -> Generator[ast.stmt, None, None]:
 
     for mapper in ctx.mappers.values():
-        assign_id_lineno = ctx.lineno()
-        # id = row[0]
-        yield ast.Assign(
-            targets=[ast.Name(id=mapper.id_name, ctx=ast.Store())],
-            value=ast.Tuple(
-                elts=[
-                    ast.Subscript(
-                        value=ast.Name(id='row', ctx=ast.Load()),
-                        slice=ast.Name(
-                            id=ctx.fields_to_columns[mapper][field],
-                            ctx=ast.Load(),
+        # Строки обычно отсортированы по родителю, поэтому сначала
+        # сравниваем id с id из прошлой строки и только при изменении
+        # идем в identity map
+        lookup = []
+        if profile:
+            lookup.append(
+                render_increment(ctx, mapper.lookups_name, col_offset + 1)
+            )
+        if len(mapper.id.fields) == 1:
+            # id = row[0]
+            yield ast.Assign(
+                targets=[ast.Name(id=mapper.id_name, ctx=ast.Store())],
+                value=render_row_item(
+                    ctx, ctx.fields_to_columns[mapper][mapper.id.fields[0]],
+                    col_offset,
+                ),
+                lineno=ctx.lineno(),
+                col_offset=col_offset,
+            )
+            # if id != last_id:
+            #     last_id = id
+            changed = ast.Compare(
+                left=ast.Name(id=mapper.id_name, ctx=ast.Load()),
+                ops=[ast.NotEq()],
+                comparators=[
+                    ast.Name(id=mapper.last_id_name(), ctx=ast.Load()),
+                ],
+            )
+            lookup.append(
+                ast.Assign(
+                    targets=[
+                        ast.Name(id=mapper.last_id_name(), ctx=ast.Store()),
+                    ],
+                    value=ast.Name(id=mapper.id_name, ctx=ast.Load()),
+                    lineno=ctx.lineno(),
+                    col_offset=col_offset + 1,
+                )
+            )
+        else:
+            # id_0 = row[0]
+            # id_1 = row[1]
+            for index, field in enumerate(mapper.id.fields):
+                yield ast.Assign(
+                    targets=[
+                        ast.Name(
+                            id=mapper.id_part_name(index), ctx=ast.Store(),
                         ),
-                        ctx=ast.Load(),
-                        lineno=ctx.lineno(),
-                        col_offset=col_offset,
+                    ],
+                    value=render_row_item(
+                        ctx, ctx.fields_to_columns[mapper][field], col_offset,
+                    ),
+                    lineno=ctx.lineno(),
+                    col_offset=col_offset,
+                )
+            # if id_0 != last_id_0 or id_1 != last_id_1:
+            #     last_id_0 = id_0
+            #     last_id_1 = id_1
+            #     id = (id_0, id_1)
+            changed = ast.BoolOp(
+                op=ast.Or(),
+                values=[
+                    ast.Compare(
+                        left=ast.Name(
+                            id=mapper.id_part_name(index), ctx=ast.Load(),
+                        ),
+                        ops=[ast.NotEq()],
+                        comparators=[
+                            ast.Name(
+                                id=mapper.last_id_name(index), ctx=ast.Load(),
+                            ),
+                        ],
                     )
-                    for field in mapper.id.fields
+                    for index in range(len(mapper.id.fields))
                 ],
-                ctx=ast.Load(),
-                lineno=ctx.lineno(),
-                col_offset=col_offset,
-            ),
-            lineno=assign_id_lineno,
-            col_offset=col_offset,
-        )
+            )
+            for index in range(len(mapper.id.fields)):
+                lookup.append(
+                    ast.Assign(
+                        targets=[
+                            ast.Name(
+                                id=mapper.last_id_name(index), ctx=ast.Store(),
+                            ),
+                        ],
+                        value=ast.Name(
+                            id=mapper.id_part_name(index), ctx=ast.Load(),
+                        ),
+                        lineno=ctx.lineno(),
+                        col_offset=col_offset + 1,
+                    )
+                )
+            lookup.append(
+                ast.Assign(
+                    targets=[ast.Name(id=mapper.id_name, ctx=ast.Store())],
+                    value=ast.Tuple(
+                        elts=[
+                            ast.Name(
+                                id=mapper.id_part_name(index), ctx=ast.Load(),
+                            )
+                            for index in range(len(mapper.id.fields))
+                        ],
+                        ctx=ast.Load(),
+                    ),
+                    lineno=ctx.lineno(),
+                    col_offset=col_offset + 1,
+                )
+            )
 
         # obj = identity_map.get(id)
         search_obj_lineno = ctx.lineno()
-        yield ast.Assign(
+        lookup.append(ast.Assign(
             targets=[
                 ast.Name(id=mapper.name, ctx=ast.Store())
             ],
@@ -102,11 +298,11 @@ def render_cycle_body(
                 args=[ast.Name(id=mapper.id_name, ctx=ast.Load())],
                 keywords=[],
                 lineno=search_obj_lineno,
-                col_offset=col_offset,
+                col_offset=col_offset + 1,
             ),
             lineno=search_obj_lineno,
-            col_offset=col_offset,
-        )
+            col_offset=col_offset + 1,
+        ))
 
         # if not obj:
         #     obj = identity_map[id] = cls(
@@ -157,6 +353,10 @@ def render_cycle_body(
             col_offset=col_offset,
         )
         if_body.append(assign_obj)
+        if profile:
+            if_body.append(
+                render_increment(ctx, mapper.created_name, col_offset + 2)
+            )
 
         ctx.lineno()
 
@@ -242,7 +442,7 @@ def render_cycle_body(
                     )
                 )
 
-        yield ast.If(
+        lookup.append(ast.If(
             test=ast.Compare(
                 left=ast.Name(id=mapper.name, ctx=ast.Load()),
                 ops=[ast.Is()],
@@ -251,6 +451,13 @@ def render_cycle_body(
             body=if_body,
             orelse=[],
             lineno=if_lineno,
+            col_offset=col_offset + 1,
+        ))
+        yield ast.If(
+            test=changed,
+            body=lookup,
+            orelse=[],
+            lineno=ctx.lineno(),
             col_offset=col_offset,
         )
 
@@ -392,7 +599,28 @@ def render_post_cycle(ctx, col_offset: int) -> Iterable[ast.stmt]:
         )
 
 
-def render_mapper_func(ctx: Context, col_offset: int) -> ast.stmt:
+def render_mapper_func(
+    ctx: Context,
+    col_offset: int,
+    profile: bool = False,
+) -> ast.stmt:
+    main = [
+        render_cycle(ctx, col_offset + 1, profile),
+        *render_post_cycle(ctx, col_offset),
+    ]
+    if profile:
+        # Счетчики сбрасываются и при закрытии недочитанного генератора
+        main = [
+            *render_profile_counters(ctx, col_offset),
+            ast.Try(
+                body=main,
+                handlers=[],
+                orelse=[],
+                finalbody=[render_profile_record(ctx, col_offset + 1)],
+                lineno=ctx.lineno(),
+                col_offset=col_offset,
+            ),
+        ]
     return ast.FunctionDef(
         name='mapper_func',
         args=ast.arguments(
@@ -407,9 +635,9 @@ def render_mapper_func(ctx: Context, col_offset: int) -> ast.stmt:
         body=[
             *render_columns(ctx, col_offset),
             *render_identity_maps(ctx, col_offset),
+            *render_last_ids(ctx, col_offset),
             *render_last_root(ctx, col_offset),
-            render_cycle(ctx, col_offset + 1),
-            *(render_post_cycle(ctx, col_offset)),
+            *main,
         ],
         decorator_list=[],
         lineno=ctx.lineno(),
@@ -417,8 +645,8 @@ def render_mapper_func(ctx: Context, col_offset: int) -> ast.stmt:
     )
 
 
-def render_module(ctx: Context) -> ast.Module:
-    func = render_mapper_func(ctx, 0)
+def render_module(ctx: Context, profile: bool = False) -> ast.Module:
+    func = render_mapper_func(ctx, 0, profile)
     return ast.fix_missing_locations(
         ast.Module(body=[func], type_ignores=[])
     )
@@ -15,17 +15,64 @@
 from typing import Any
 from typing import Callable
 from typing import Optional
+import heapq
+import itertools
 import threading
 import queue
 import logging
+import os
+import random
+import time
+import traceback
+import weakref
 
 from . import exceptions
 from . import poolvalidators
+from .poollimit import AdaptiveLimit
+from .poolmetrics import Checkout, PoolMetrics
 
 logger = logging.getLogger(__name__)
 
 ConnType = Any
 
+#: Pools to reset in a forked child
+_pools: "weakref.WeakSet[ConnectionPool]" = weakref.WeakSet()
+
+#: Connections inherited from the parent process. They are kept referenced
+#: so that they are never finalized in the child: closing a connection sends
+#: a terminate message over the socket shared with the parent.
+_abandoned: list = []
+
+_fork_lock = threading.Lock()
+
+
+def _reset_pools_after_fork() -> None:
+    global _fork_lock
+    _fork_lock = threading.Lock()
+    for pool in list(_pools):
+        try:
+            pool._after_fork()
+        except Exception:
+            logger.exception('Could not reset connection pool after fork')
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_pools_after_fork)
+
+
+class _Waiter:
+    """
+    A caller blocked until a connection is handed to it. ``conn`` stays
+    None when the waiter is woken because capacity was freed.
+    """
+
+    __slots__ = ('event', 'conn', 'done')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.conn = None
+        self.done = False
+
 
 class ConnectionPool:
     """
@@ -54,6 +101,34 @@ class ConnectionPool:
     #: How long to wait for a connection to become available
     timeout = 5
 
+    #: Collected metrics, or None if the pool was created without
+    #: ``metrics=True`` or ``leak_threshold``
+    metrics: Optional[PoolMetrics]
+
+    #: Connections held longer than this many seconds are reported by
+    #: :meth:`check_leaks`
+    leak_threshold: Optional[float]
+
+    #: Share of checkouts for which the caller's stack is recorded
+    leak_sample_rate: float
+
+    #: How many connections a forked child opens right after the fork
+    prewarm: int
+
+    #: Connections released less than this many seconds ago are handed out
+    #: without validation. Zero validates on every checkout.
+    validate_interval: float
+
+    #: Concurrency limit adjusted from observed query durations, None if
+    #: the pool is created without ``adaptive``
+    adaptive: Optional[AdaptiveLimit]
+
+    #: Keep the connection released by a thread in a per-thread slot so the
+    #: same thread re-acquires it without going through the shared queue.
+    #: Parked connections are stolen by other threads before a new
+    #: connection is opened or a caller starts waiting.
+    thread_affinity: bool
+
     _pool: queue.Queue
 
     def __init__(
@@ -62,10 +137,19 @@ class ConnectionPool:
         timeout:float = 5,
         limit=0,
         validator="auto",
+        metrics: bool = False,
+        leak_threshold: Optional[float] = None,
+        leak_sample_rate: float = 1.0,
+        prewarm: int = 0,
+        thread_affinity: bool = False,
+        validate_interval: float = 0,
+        adaptive: Optional[AdaptiveLimit] = None,
     ):
         self._pool = self.queue_class()
         self.lock = self.lock_class()
+        self.validator = None
         if isinstance(validator, poolvalidators.ConnectionValidator):
+            self.validator = validator
             self.validate = validator.validate
             self.before_release = validator.before_release
         elif validator == "auto":
@@ -82,53 +166,386 @@ class ConnectionPool:
         self.reached_limit = False
         self.timeout = timeout
 
-    def _getconn(self):
+        self.leak_threshold = leak_threshold
+        self.leak_sample_rate = leak_sample_rate
+        if metrics or leak_threshold is not None:
+            self.metrics = PoolMetrics()
+        else:
+            self.metrics = None
+        self._checkouts: dict[int, Checkout] = {}
+
+        self.validate_interval = validate_interval
+        self._released_at: dict[int, float] = {}
+
+        self.thread_affinity = thread_affinity
+        # Thread ident -> parked connection. Single dict operations are
+        # atomic, so slots are claimed and stolen without a lock
+        self._slots: dict[int, ConnType] = {}
+
+        # Callers waiting for a connection, ordered by
+        # (priority, deadline, arrival)
+        self._waiters: list[tuple[int, float, int, _Waiter]] = []
+        self._waiters_lock = threading.Lock()
+        self._waiter_seq = itertools.count()
+        # Connections with a statement timeout to remove on release
+        self._timed: set[int] = set()
+
+        self.adaptive = adaptive
+        # Connections counted in adaptive.inflight
+        self._adaptive_held: set[int] = set()
+
+        self.prewarm = prewarm
+        self._pid = os.getpid()
+        _pools.add(self)
+
+    def _after_fork(self) -> None:
+        """
+        Forget the state inherited from the parent process: idle
+        connections are abandoned without being closed, the queue,
+        lock and counters are recreated. Connections checked out
+        before the fork must not be used in the child.
+        """
+        # The parent's threads may have held the queue mutex at fork time,
+        # so the underlying deque is read without locking
+        _abandoned.extend(self._pool.queue)
+        _abandoned.extend(self._slots.values())
+        self._pool = self.queue_class()
+        self._slots = {}
+        self._waiters = []
+        self._waiters_lock = threading.Lock()
+        self._timed = set()
+        self._released_at = {}
+        self._adaptive_held = set()
+        if self.adaptive is not None:
+            self.adaptive.inflight = 0
+        self.lock = self.lock_class()
+        self.connections_created = 0
+        self.reached_limit = False
+        self._checkouts = {}
+        if self.metrics is not None:
+            self.metrics = PoolMetrics()
+        self._pid = os.getpid()
+        for _ in range(self.prewarm):
+            if self.limit and self.connections_created >= self.limit:
+                break
+            self._pool.put(self._connect())
+
+    def _check_pid(self) -> None:
+        # Fallback for forks that bypass os.register_at_fork hooks,
+        # e.g. fork() called from C by an application server
+        with _fork_lock:
+            if self._pid != os.getpid():
+                self._after_fork()
+
+    def _getconn(self, deadline=None, priority=0):
         """
         Return a connection from the pool.
         """
-        try:
-            return self._pool.get(block=self.reached_limit, timeout=self.timeout)
-        except queue.Empty:
-            if self.limit:
+        if self.thread_affinity:
+            conn = self._slots.pop(threading.get_ident(), None)
+            if conn is not None:
+                return conn
+        while True:
+            try:
+                return self._pool.get_nowait()
+            except queue.Empty:
+                pass
+            if self.thread_affinity:
+                conn = self._steal()
+                if conn is not None:
+                    return conn
+            if not self.limit:
+                return self._connect()
+            if not self.reached_limit:
                 with self.lock:
-                    if self.reached_limit:
-                        raise exceptions.ConnectionLimitError()
-                    else:
+                    if not self.reached_limit:
                         return self._connect()
+
+            if deadline is None:
+                deadline = time.monotonic() + self.timeout
+            conn = self._wait(deadline, priority)
+            if conn is not None:
+                return conn
+            # Woken up because a discarded connection freed capacity
+
+    def _wait(self, deadline: float, priority: int):
+        waiter = _Waiter()
+        with self._waiters_lock:
+            heapq.heappush(
+                self._waiters,
+                (priority, deadline, next(self._waiter_seq), waiter),
+            )
+            # Releasing threads check the waiters after returning a
+            # connection, so a connection returned concurrently is either
+            # found here or handed to us
+            try:
+                conn = self._pool.get_nowait()
+            except queue.Empty:
+                conn = None
+            if conn is not None or not self.reached_limit:
+                waiter.done = True
+                return conn
+
+        if self.thread_affinity:
+            conn = self._steal()
+            if conn is not None:
+                with self._waiters_lock:
+                    if not waiter.done:
+                        waiter.done = True
+                        return conn
+                # A connection was handed to us meanwhile
+                self._put(conn)
+                return waiter.conn
+
+        if not waiter.event.wait(max(deadline - time.monotonic(), 0)):
+            with self._waiters_lock:
+                if not waiter.done:
+                    waiter.done = True
+                    raise exceptions.ConnectionLimitError()
+        return waiter.conn
+
+    def _handoff(self, conn) -> bool:
+        """
+        Give the connection (or None for freed capacity) to the most
+        urgent live waiter. Must be called with ``_waiters_lock`` held.
+        """
+        while self._waiters:
+            waiter = heapq.heappop(self._waiters)[-1]
+            if not waiter.done:
+                waiter.done = True
+                waiter.conn = conn
+                waiter.event.set()
+                return True
+        return False
+
+    def _put(self, conn) -> None:
+        self._pool.put(conn)
+        if not self._waiters:
+            return
+        with self._waiters_lock:
+            while self._waiters:
+                try:
+                    conn = self._pool.get_nowait()
+                except queue.Empty:
+                    return
+                if not self._handoff(conn):
+                    self._pool.put(conn)
+                    return
+
+    def _steal(self):
+        try:
+            return self._slots.popitem()[1]
+        except KeyError:
+            return None
+
+    def getconn(
+        self,
+        deadline: Optional[float] = None,
+        priority: int = 0,
+        timeout: Optional[float] = None,
+    ) -> ConnType:
+        """
+        Return a connection, waiting up to ``timeout`` seconds (the pool
+        timeout by default) or until ``deadline`` (a :func:`time.monotonic`
+        timestamp) if the pool is at its limit. Waiters are served by
+        ``priority`` (lower first), then by the earliest deadline. With a
+        deadline the remaining time is applied as a statement timeout
+        where the driver supports it, and an already expired deadline
+        raises :class:`~classic.db_tools.exceptions.DeadlineExpired` at
+        once. ``timeout`` only limits the wait.
+        """
+        if self._pid != os.getpid():
+            self._check_pid()
+        wait = None if timeout is None else time.monotonic() + timeout
+        if self.adaptive is None:
+            return self._checkout(deadline, priority, wait)
+
+        self.adaptive.acquire()
+        try:
+            conn = self._checkout(deadline, priority, wait)
+        except BaseException:
+            self.adaptive.cancel()
+            raise
+        self._adaptive_held.add(id(conn))
+        return conn
+
+    def _checkout(
+        self,
+        deadline: Optional[float],
+        priority: int,
+        wait: Optional[float] = None,
+    ) -> ConnType:
+        if self.metrics is None:
+            if deadline is None:
+                return self._validated_getconn(wait, priority)
+            return self._deadline_getconn(deadline, priority, wait)
+
+        started = time.monotonic()
+        try:
+            if deadline is None:
+                conn = self._validated_getconn(wait, priority)
             else:
-                return self._connect()
+                conn = self._deadline_getconn(deadline, priority, wait)
+        except exceptions.ConnectionLimitError:
+            self.metrics.timed_out()
+            raise
+        now = time.monotonic()
+        self.metrics.checked_out(now - started)
+
+        stack = None
+        if (
+            self.leak_threshold is not None
+            and random.random() < self.leak_sample_rate
+        ):
+            stack = traceback.extract_stack()[:-2]
+        self._checkouts[id(conn)] = Checkout(
+            id(conn), threading.current_thread().name, now, stack,
+        )
+        return conn
+
+    def _deadline_getconn(
+        self,
+        deadline: float,
+        priority: int,
+        wait: Optional[float] = None,
+    ) -> ConnType:
+        if deadline <= time.monotonic():
+            raise exceptions.DeadlineExpired()
+        conn = self._validated_getconn(
+            deadline if wait is None else min(deadline, wait), priority,
+        )
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            self.release(conn)
+            raise exceptions.DeadlineExpired()
+        if self._timeouts(conn).set_statement_timeout(conn, remaining):
+            self._timed.add(id(conn))
+        return conn
+
+    def _timeouts(self, conn: ConnType) -> poolvalidators.ConnectionValidator:
+        # Without a validator statement timeouts are still applied
+        # through the driver's validator, but connections are not
+        # validated
+        if self.validator is not None:
+            return self.validator
+        return poolvalidators.validator_for(conn)
 
-    def getconn(self) -> ConnType:
+    def _validated_getconn(self, deadline=None, priority=0) -> ConnType:
         if not self.validate:
-            return self._getconn()
+            return self._getconn(deadline, priority)
         for retry in range(self.max_validation_retries):
-            conn = self._getconn()
+            conn = self._getconn(deadline, priority)
+            if self.validate_interval:
+                released = self._released_at.pop(id(conn), None)
+                if (
+                    released is not None
+                    and time.monotonic() - released < self.validate_interval
+                ):
+                    return conn
             if self.validate(conn):
                 return conn
-            self.release(conn)
+            if self.metrics is not None:
+                self.metrics.validation_failed()
+            if self.thread_affinity:
+                # Released into the slot it would be picked up again
+                self._discard(conn)
+            else:
+                self.release(conn)
         raise Exception(
             f"Could not validate a connection after "
             f"{self.max_validation_retries} attempts"
         )
 
-    def connect(self):
+    def connect(
+        self,
+        deadline: Optional[float] = None,
+        priority: int = 0,
+        timeout: Optional[float] = None,
+    ):
         """
         Return a context manager that manages acquiring and releasing a
-        connection.
+        connection. Arguments are passed to :meth:`getconn`.
+        """
+        return ContextManagerWrappedConnection(
+            self, deadline, priority, timeout,
+        )
+
+    def stats(self) -> dict[str, Any]:
+        """
+        Return a snapshot of the pool metrics together with the
+        current idle and created connection counts.
+        """
+        if self.metrics is None:
+            raise RuntimeError('Pool metrics are not enabled')
+        stats = self.metrics.snapshot()
+        stats['idle'] = self._pool.qsize() + len(self._slots)
+        stats['connections_created'] = self.connections_created
+        if self.adaptive is not None:
+            stats['adaptive'] = self.adaptive.snapshot()
+        return stats
+
+    def check_leaks(self, threshold: Optional[float] = None) -> list[Checkout]:
+        """
+        Return checkouts held longer than ``threshold`` seconds
+        (``leak_threshold`` by default), longest first, and log a
+        warning with the checkout stack for each of them.
+        """
+        if threshold is None:
+            threshold = self.leak_threshold
+        if threshold is None:
+            raise RuntimeError('Leak detection is not enabled')
+        now = time.monotonic()
+        leaks = sorted(
+            (
+                checkout for checkout in list(self._checkouts.values())
+                if now - checkout.started > threshold
+            ),
+            key=lambda checkout: checkout.started,
+        )
+        for checkout in leaks:
+            logger.warning(
+                'Connection held for %.1f s by thread %s, checked out at:\n%s',
+                now - checkout.started,
+                checkout.thread,
+                checkout.format_stack(),
+            )
+        return leaks
+
+    def validate_idle(self) -> int:
+        """
+        Validate idle connections, e.g. periodically from a background
+        thread, so that checkouts within ``validate_interval`` can trust
+        them. Broken connections are closed, their number is returned.
         """
-        return ContextManagerWrappedConnection(self)
+        idle = []
+        for _ in range(len(self._slots)):
+            conn = self._steal()
+            if conn is None:
+                break
+            idle.append(conn)
+        for _ in range(self._pool.qsize()):
+            try:
+                idle.append(self._pool.get_nowait())
+            except queue.Empty:
+                break
+
+        discarded = 0
+        for conn in idle:
+            if self.validate is None or self.validate(conn):
+                self._released_at[id(conn)] = time.monotonic()
+                self._put(conn)
+            else:
+                self._discard(conn)
+                discarded += 1
+        return discarded
 
     def set_validator(self, v):
+        self.validator = v
         self.validate = v.validate
         self.before_release = v.before_release
 
     def auto_validate(self, conn):
-        validator = poolvalidators.ConnectionValidator()
-
-        for cls in poolvalidators.validators:
-            if isinstance(conn, cls):
-                validator = poolvalidators.validators[cls]()
-                break
+        validator = poolvalidators.validator_for(conn)
         self.set_validator(validator)
         return validator.validate(conn)
 
@@ -139,25 +556,75 @@ class ConnectionPool:
         return conn
 
     def release(self, conn: ConnType):
-        reuse = self.before_release(conn) if self.before_release else True
-        if reuse:
-            self._pool.put(conn)
+        if self.adaptive is not None and id(conn) in self._adaptive_held:
+            self._adaptive_held.discard(id(conn))
+            self.adaptive.release()
+        reuse = True
+        timed = bool(self._timed) and id(conn) in self._timed
+        if self.before_release:
+            reuse = self.before_release(conn)
+        elif timed:
+            reuse = self._timeouts(conn).before_release(conn)
+        if timed:
+            self._timed.discard(id(conn))
+            # After the rollback, so that the reset is not undone by it
+            # and cannot commit the caller's work
+            if reuse:
+                try:
+                    self._timeouts(conn).reset_statement_timeout(conn)
+                except Exception:
+                    reuse = False
+            if not reuse:
+                self._timeouts(conn).forget(conn)
+        if self.metrics is not None:
+            checkout = self._checkouts.pop(id(conn), None)
+            self.metrics.released(
+                checkout.held if checkout is not None else None, reuse,
+            )
+        if not reuse:
+            self._discard(conn)
+            return
+        if self.validate_interval:
+            self._released_at[id(conn)] = time.monotonic()
+        if self.thread_affinity:
+            ident = threading.get_ident()
+            if ident in self._slots:
+                self._put(conn)
+                return
+            self._slots[ident] = conn
+            # Waiters check the slots after registering, see _wait
+            if self._waiters:
+                conn = self._slots.pop(ident, None)
+                if conn is not None:
+                    self._put(conn)
         else:
-            conn.close()
-            if self.limit:
-                self.lock.acquire()
-                self.connections_created -= 1
-                self.reached_limit = self.connections_created >= self.limit
-                self.lock.release()
+            self._put(conn)
+
+    def _discard(self, conn: ConnType):
+        self._released_at.pop(id(conn), None)
+        conn.close()
+        if self.limit:
+            self.lock.acquire()
+            self.connections_created -= 1
+            self.reached_limit = self.connections_created >= self.limit
+            self.lock.release()
+            if self._waiters:
+                with self._waiters_lock:
+                    self._handoff(None)
 
 
 class ContextManagerWrappedConnection:
-    def __init__(self, pool):
+    def __init__(self, pool, deadline=None, priority=0, timeout=None):
         self.conn = None
         self.pool = pool
+        self.deadline = deadline
+        self.priority = priority
+        self.timeout = timeout
 
     def __enter__(self):
-        self.conn = self.pool.getconn()
+        self.conn = self.pool.getconn(
+            self.deadline, self.priority, self.timeout,
+        )
         return self.conn
 
     def __exit__(self, exc_type, exc_value, tb):
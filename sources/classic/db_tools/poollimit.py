@@ -0,0 +1,120 @@
+from collections import deque
+from typing import TYPE_CHECKING, Any, Optional
+import threading
+import time
+
+from . import exceptions
+
+if TYPE_CHECKING:
+    from .instrumentation import QueryEvent
+
+
+class AdaptiveLimit:
+    """
+    An AIMD concurrency limit for :class:`ConnectionPool`.
+
+    Latency samples are query durations in the database: an
+    :class:`~classic.db_tools.Engine` on the pool passes the limiter
+    the execute and fetch time of every query (the limiter is a query
+    listener). Time the application spends between queries while
+    holding the connection is not counted. Code using the pool directly
+    reports durations with :meth:`observe`.
+
+    The limiter keeps a baseline that follows the fastest recent
+    samples. A sample slower than ``tolerance`` times
+    the baseline cuts the limit by ``backoff``, at most once per sample
+    duration. Otherwise, while at least half of the limit is in use, each
+    sample adds ``1 / limit``, so the limit grows by about one per round
+    of checkouts. Checkouts above the limit fail at once with
+    :class:`~classic.db_tools.exceptions.PoolOverloaded`.
+    """
+
+    def __init__(
+        self,
+        initial: int = 8,
+        min_limit: int = 1,
+        max_limit: int = 100,
+        backoff: float = 0.9,
+        tolerance: float = 2.0,
+        smoothing: float = 0.01,
+        history: int = 100,
+    ):
+        if not 1 <= min_limit <= initial <= max_limit:
+            raise ValueError('Expected 1 <= min_limit <= initial <= max_limit')
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.tolerance = tolerance
+        #: How fast the baseline drifts up to slower samples
+        self.smoothing = smoothing
+        self.lock = threading.Lock()
+
+        #: Current limit, fractional between integer steps
+        self.limit = float(initial)
+        self.inflight = 0
+        #: Smoothed minimum latency, None until the first sample
+        self.baseline: Optional[float] = None
+        #: Checkouts rejected because the limit was reached
+        self.shed = 0
+        #: ``(time.monotonic(), limit)`` for every change of the integer
+        #: limit
+        self.history: deque[tuple[float, int]] = deque(maxlen=history)
+        self.history.append((time.monotonic(), initial))
+        self._last_decrease = 0.0
+
+    @property
+    def current(self) -> int:
+        return int(self.limit)
+
+    def acquire(self) -> None:
+        with self.lock:
+            if self.inflight >= int(self.limit):
+                self.shed += 1
+                raise exceptions.PoolOverloaded()
+            self.inflight += 1
+
+    def cancel(self) -> None:
+        """Give back a slot taken by a checkout that failed"""
+        with self.lock:
+            self.inflight -= 1
+
+    def release(self) -> None:
+        with self.lock:
+            self.inflight -= 1
+
+    def __call__(self, event: 'QueryEvent') -> None:
+        self.observe(event.execute_time + event.fetch_time)
+
+    def observe(self, latency: float) -> None:
+        with self.lock:
+            inflight = self.inflight
+            baseline = self.baseline
+            if baseline is None or latency < baseline:
+                self.baseline = latency
+            else:
+                self.baseline = baseline + self.smoothing * (latency - baseline)
+
+            before = int(self.limit)
+            now = time.monotonic()
+            if baseline is not None and latency > baseline * self.tolerance:
+                if now - self._last_decrease >= latency:
+                    self._last_decrease = now
+                    self.limit = max(
+                        float(self.min_limit), self.limit * self.backoff,
+                    )
+            elif inflight * 2 >= self.limit:
+                self.limit = min(
+                    float(self.max_limit), self.limit + 1 / self.limit,
+                )
+            if int(self.limit) != before:
+                self.history.append((now, int(self.limit)))
+
+    def snapshot(self) -> dict[str, Any]:
+        with self.lock:
+            return {
+                'limit': int(self.limit),
+                'inflight': self.inflight,
+                'baseline': self.baseline,
+                'shed': self.shed,
+                'history': list(self.history),
+            }
@@ -0,0 +1,140 @@
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from typing import Any, Optional, Sequence
+import threading
+import time
+import traceback
+
+#: Default histogram bucket upper bounds, in seconds
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0,
+)
+
+
+class Histogram:
+    """
+    A fixed-bucket histogram of durations. Not thread-safe on its own,
+    :class:`PoolMetrics` guards it with its lock.
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        #: One counter per bucket plus the overflow bucket
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, percent: float) -> float:
+        """
+        Estimate a percentile as the upper bound of the bucket it
+        falls into. Values in the overflow bucket report the maximum.
+        """
+        if not self.count:
+            return 0.0
+        rank = percent / 100 * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'max': self.max,
+            'p50': self.percentile(50),
+            'p99': self.percentile(99),
+            'buckets': dict(
+                zip((*self.buckets, float('inf')), self.counts)
+            ),
+        }
+
+
+@dataclass(slots=True)
+class Checkout:
+    """
+    A connection currently held by a caller.
+    """
+
+    #: ``id()`` of the held connection
+    conn_id: int
+    thread: str
+    #: ``time.monotonic()`` at checkout
+    started: float
+    #: Stack of the caller, if it was sampled
+    stack: Optional[list[traceback.FrameSummary]] = field(
+        default=None, repr=False,
+    )
+
+    @property
+    def held(self) -> float:
+        return time.monotonic() - self.started
+
+    def format_stack(self) -> str:
+        if self.stack is None:
+            return '<stack not sampled>'
+        return ''.join(traceback.format_list(self.stack))
+
+
+class PoolMetrics:
+    """
+    Counters, gauges and histograms collected by :class:`ConnectionPool`
+    when it is created with ``metrics=True`` or a ``leak_threshold``.
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.lock = threading.Lock()
+        #: Time spent in ``getconn``, including validation
+        self.wait_time = Histogram(buckets)
+        #: Time between ``getconn`` and ``release``
+        self.hold_time = Histogram(buckets)
+        self.checkouts = 0
+        self.in_use = 0
+        self.timeouts = 0
+        self.validation_failures = 0
+        #: Connections closed on release instead of being returned
+        self.recycles = 0
+
+    def checked_out(self, wait_time: float) -> None:
+        with self.lock:
+            self.wait_time.observe(wait_time)
+            self.checkouts += 1
+            self.in_use += 1
+
+    def released(self, hold_time: Optional[float], reused: bool) -> None:
+        with self.lock:
+            if hold_time is not None:
+                self.hold_time.observe(hold_time)
+                self.in_use -= 1
+            if not reused:
+                self.recycles += 1
+
+    def timed_out(self) -> None:
+        with self.lock:
+            self.timeouts += 1
+
+    def validation_failed(self) -> None:
+        with self.lock:
+            self.validation_failures += 1
+
+    def snapshot(self) -> dict[str, Any]:
+        with self.lock:
+            return {
+                'checkouts': self.checkouts,
+                'in_use': self.in_use,
+                'timeouts': self.timeouts,
+                'validation_failures': self.validation_failures,
+                'recycles': self.recycles,
+                'wait_time': self.wait_time.snapshot(),
+                'hold_time': self.hold_time.snapshot(),
+            }
@@ -1,3 +1,6 @@
+import sqlite3
+import time
+
 validators = {}
 
 
@@ -12,7 +15,101 @@ def validator(conn_type, cls=None):
     return validator
 
 
+_instances = {}
+
+
+def validator_for(conn):
+    """
+    Return a shared validator instance for the connection's driver.
+    """
+    conn_type = type(conn)
+    instance = _instances.get(conn_type)
+    if instance is None:
+        cls = ConnectionValidator
+        for registered in validators:
+            if isinstance(conn, registered):
+                cls = validators[registered]
+                break
+        instance = _instances[conn_type] = cls()
+    return instance
+
+
+def _set_session(conn, sql):
+    """
+    Execute a session-level SET on an idle connection and leave it idle.
+    Without autocommit the statement opens a transaction; committing it
+    keeps the setting and lets the caller still change session
+    parameters such as autocommit or the isolation level.
+    """
+    cursor = conn.cursor()
+    cursor.execute(sql)
+    cursor.close()
+    if not conn.autocommit:
+        conn.commit()
+
+
 class ConnectionValidator:
+    """
+    Validates connections on checkout and prepares them for reuse on
+    release. Subclasses for particular drivers override
+    :meth:`in_transaction` to let the release path skip the rollback for
+    idle connections.
+    """
+
+    def in_transaction(self, conn):
+        """
+        Return True if the connection has an open transaction, False if
+        it is known to be idle and None if the driver cannot tell.
+        """
+        return None
+
+    def set_statement_timeout(self, conn, timeout):
+        """
+        Limit statements executed on the connection to ``timeout``
+        seconds. Return True if the limit must be removed with
+        :meth:`reset_statement_timeout` on release, False if the driver
+        does not support it or the limit expires by itself.
+        """
+        return False
+
+    def reset_statement_timeout(self, conn):
+        pass
+
+    def forget(self, conn):
+        """
+        Drop what the validator keeps for a connection with a statement
+        timeout that the pool discards instead of resetting it.
+        """
+
+    def limit_statement(self, conn, timeout):
+        """
+        Limit the next statement (or fetch) on the connection to
+        ``timeout`` seconds, keeping any limit set by
+        :meth:`set_statement_timeout`. Return a token for
+        :meth:`unlimit_statement`, or None if the driver has no cheap
+        native limit and the statement has to be cancelled with
+        :meth:`cancel` from another thread instead.
+        """
+        return None
+
+    def unlimit_statement(self, conn, token):
+        """
+        Remove the limit set by :meth:`limit_statement` and return True
+        if it interrupted the statement.
+        """
+        return False
+
+    def cancel(self, conn):
+        """
+        Cancel the statement running on the connection from another
+        thread. Return False if the driver has no way to do it.
+        """
+        cancel = getattr(conn, 'cancel', None)
+        if cancel is None:
+            return False
+        cancel()
+        return True
+
     def validate(self, conn):
         try:
             cursor = conn.cursor()
@@ -24,11 +121,79 @@ class ConnectionValidator:
         return True
 
     def before_release(self, conn):
+        # Liveness is checked on the next checkout (see
+        # ConnectionPool.validate_interval), not on every release
         try:
-            conn.rollback()
+            if self.in_transaction(conn) is not False:
+                conn.rollback()
         except Exception:
             return False
-        return self.validate(conn)
+        return True
+
+
+@validator(sqlite3.Connection)
+class SQLiteConnectionValidator(ConnectionValidator):
+    """
+    Both the checkout deadline and per-statement limits are enforced by
+    the progress handler, so a statement is never interrupted from
+    another thread after it has finished.
+    """
+    #: How many virtual machine instructions run between deadline checks
+    progress_steps = 1000
+    #: Checkout deadlines by connection id, shared by all instances
+    #: because the pool and the statement guard may use different ones.
+    #: sqlite3.Connection cannot be weakly referenced, so the entry holds
+    #: the connection: its id cannot be reused while the entry exists.
+    #: Entries are removed on release, see :meth:`forget`.
+    _deadlines: dict[int, tuple[sqlite3.Connection, float]] = {}
+
+    def in_transaction(self, conn):
+        return conn.in_transaction
+
+    def _install(self, conn, deadline, expired=None):
+        if deadline is None:
+            conn.set_progress_handler(None, self.progress_steps)
+            return
+
+        def handler():
+            # A true result interrupts the running statement
+            if time.monotonic() <= deadline:
+                return False
+            if expired is not None:
+                expired.append(True)
+            return True
+
+        conn.set_progress_handler(handler, self.progress_steps)
+
+    def _deadline(self, conn):
+        entry = self._deadlines.get(id(conn))
+        return None if entry is None else entry[1]
+
+    def set_statement_timeout(self, conn, timeout):
+        deadline = time.monotonic() + timeout
+        self._deadlines[id(conn)] = (conn, deadline)
+        self._install(conn, deadline)
+        return True
+
+    def reset_statement_timeout(self, conn):
+        self.forget(conn)
+        self._install(conn, None)
+
+    def forget(self, conn):
+        self._deadlines.pop(id(conn), None)
+
+    def limit_statement(self, conn, timeout):
+        deadline = time.monotonic() + timeout
+        checkout = self._deadline(conn)
+        if checkout is not None:
+            deadline = min(deadline, checkout)
+        expired = []
+        self._install(conn, deadline, expired)
+        return expired
+
+    def unlimit_statement(self, conn, token):
+        self._install(conn, self._deadline(conn))
+        return bool(token)
 
 
 try:
@@ -59,6 +224,14 @@ else:
                 return True
             return True
 
+        def set_statement_timeout(self, conn, timeout):
+            milliseconds = max(1, int(timeout * 1000))
+            _set_session(conn, f'SET statement_timeout = {milliseconds}')
+            return True
+
+        def reset_statement_timeout(self, conn):
+            _set_session(conn, 'SET statement_timeout TO DEFAULT')
+
 
 try:
     from psycopg.connection import Connection as psycopg3_conn
@@ -88,6 +261,20 @@ else:
                 return True
             return True
 
+        def set_statement_timeout(self, conn, timeout):
+            milliseconds = max(1, int(timeout * 1000))
+            _set_session(conn, f'SET statement_timeout = {milliseconds}')
+            return True
+
+        def reset_statement_timeout(self, conn):
+            _set_session(conn, 'SET statement_timeout TO DEFAULT')
+
+        def cancel(self, conn):
+            # cancel_safe (psycopg 3.2+) uses the libpq cancellation API
+            # that honours SSL settings and connection timeouts
+            getattr(conn, 'cancel_safe', conn.cancel)()
+            return True
+
 
 class MysqlConnectionValidator(ConnectionValidator):
     def validate(self, conn):
@@ -97,13 +284,32 @@ class MysqlConnectionValidator(ConnectionValidator):
             return False
         return True
 
+    def set_statement_timeout(self, conn, timeout):
+        # MySQL applies the limit to SELECT statements only
+        milliseconds = max(1, int(timeout * 1000))
+        cursor = conn.cursor()
+        cursor.execute(f'SET SESSION MAX_EXECUTION_TIME = {milliseconds}')
+        cursor.close()
+        return True
+
+    def reset_statement_timeout(self, conn):
+        cursor = conn.cursor()
+        cursor.execute('SET SESSION MAX_EXECUTION_TIME = DEFAULT')
+        cursor.close()
+
 
 try:
     from pymysql.connections import Connection as pymysql_conn
+    from pymysql.constants.SERVER_STATUS import SERVER_STATUS_IN_TRANS
 except ImportError:
     pass
 else:
-    validator(pymysql_conn, MysqlConnectionValidator)
+    @validator(pymysql_conn)
+    class PyMySQLConnectionValidator(MysqlConnectionValidator):
+
+        def in_transaction(self, conn):
+            # Updated from the status flags of every server response
+            return bool(conn.server_status & SERVER_STATUS_IN_TRANS)
 
 
 try:
@@ -141,6 +347,9 @@ else:
     @validator(oracledb_conn)
     class OracleConnectionValidator(ConnectionValidator):
 
+        def in_transaction(self, conn):
+            return getattr(conn, 'transaction_in_progress', None)
+
         def validate(self, conn):
             try:
                 cursor = conn.cursor()
@@ -0,0 +1,97 @@
+from typing import Any, Callable, Generator, Sequence
+import queue
+import sqlite3
+import threading
+
+from .types import Row
+
+
+class _Failure:
+    __slots__ = ('error',)
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+# Знак того, что соединение нельзя использовать из фонового потока
+_THREAD_BOUND = object()
+
+
+def _usable_here(conn: Any) -> bool:
+    """
+    Можно ли использовать соединение в текущем потоке: sqlite3
+    по умолчанию (check_same_thread=True) запрещает другие потоки.
+    Проверяется созданием курсора, сам курсор выборки не трогается.
+    """
+    if not isinstance(conn, sqlite3.Connection):
+        return True
+    try:
+        conn.cursor().close()
+    except sqlite3.ProgrammingError:
+        return False
+    return True
+
+
+def prefetch_batches(
+    fetch: Callable[[], Sequence[Row]],
+    depth: int = 1,
+    conn: Any = None,
+) -> Generator[Sequence[Row], None, None]:
+    """
+    Выбирает пачки строк в фоновом потоке, пока вызывающий код
+    обрабатывает текущую. Драйверы отпускают GIL на время сетевого
+    обмена, поэтому выборка и маппинг идут параллельно.
+    depth - сколько пачек может ждать своей очереди.
+
+    Курсор используется только фоновым потоком, пока генератор
+    не будет исчерпан или закрыт. Если соединение conn привязано
+    к потоку, фоновый поток проверяет это до первой выборки,
+    и выборка идет синхронно в вызывающем потоке.
+    """
+    batches = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def worker():
+        if not _usable_here(conn):
+            put(_THREAD_BOUND)
+            return
+        try:
+            while True:
+                rows = fetch()
+                if not put(rows) or not rows:
+                    return
+        except BaseException as error:
+            put(_Failure(error))
+
+    thread = threading.Thread(
+        target=worker, name='classic-db-tools-prefetch', daemon=True,
+    )
+    thread.start()
+    try:
+        while True:
+            rows = batches.get()
+            if rows is _THREAD_BOUND:
+                break
+            if isinstance(rows, _Failure):
+                raise rows.error
+            if not rows:
+                return
+            yield rows
+    finally:
+        stop.set()
+        thread.join()
+
+    while True:
+        rows = fetch()
+        if not rows:
+            return
+        yield rows
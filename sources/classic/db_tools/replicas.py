@@ -0,0 +1,88 @@
+from pathlib import PurePosixPath
+from typing import Sequence
+import re
+import threading
+
+from .pool import ConnectionPool
+from .types import Connection
+
+READONLY_MARK = re.compile(
+    r'^\s*(?:--\s*readonly\b|/\*\s*readonly\s*\*/)', re.IGNORECASE,
+)
+
+
+def is_readonly_sql(content: str) -> bool:
+    """
+    Запрос помечен как читающий комментарием в начале текста:
+    -- readonly или /* readonly */.
+    """
+    return READONLY_MARK.match(content) is not None
+
+
+def in_dirs(filename: str, dirs: Sequence[str]) -> bool:
+    parts = PurePosixPath(filename.replace('\\', '/')).parts
+    for directory in dirs:
+        prefix = PurePosixPath(directory.replace('\\', '/')).parts
+        if parts[:len(prefix)] == prefix:
+            return True
+    return False
+
+
+class ReplicaSet:
+    """
+    Пулы реплик. Соединение берется из пула с наименьшим числом
+    выданных через набор соединений, при равенстве пулы чередуются.
+    """
+
+    def __init__(self, pools: Sequence[ConnectionPool]):
+        if not pools:
+            raise ValueError('At least one replica pool is required')
+        self.pools = tuple(pools)
+        self.outstanding = [0] * len(self.pools)
+        self.lock = threading.Lock()
+        self._offset = 0
+
+    def choose(self) -> int:
+        count = len(self.pools)
+        with self.lock:
+            self._offset = (self._offset + 1) % count
+            index = min(
+                ((self._offset + shift) % count for shift in range(count)),
+                key=self.outstanding.__getitem__,
+            )
+            self.outstanding[index] += 1
+        return index
+
+    def getconn(self) -> tuple[int, Connection]:
+        index = self.choose()
+        try:
+            return index, self.pools[index].getconn()
+        except BaseException:
+            with self.lock:
+                self.outstanding[index] -= 1
+            raise
+
+    def release(self, index: int, conn: Connection) -> None:
+        try:
+            self.pools[index].release(conn)
+        finally:
+            with self.lock:
+                self.outstanding[index] -= 1
+
+
+class RoutingState(threading.local):
+    """
+    Состояние маршрутизации потока: вложенность пишущих
+    и читающих транзакций, соединение с репликой, взятое
+    в текущем контексте движка, и признак того, что в контексте
+    уже использовался основной сервер.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.entered = False
+        self.pinned = False
+        self.writing = 0
+        self.reading = 0
+        self.index: int | None = None
+        self.conn: Connection | None = None
@@ -53,6 +53,11 @@ class ScopedConnection(threading.local):
             ''')
         return getattr(self._conn, item)
 
+    @property
+    def active(self) -> bool:
+        """Соединение взято в текущем потоке"""
+        return '_conn' in self.__dict__
+
     @property
     def __wrapped__(self) -> Connection:
         return self._conn
@@ -0,0 +1,243 @@
+from concurrent.futures import ThreadPoolExecutor, wait
+from heapq import merge
+from itertools import chain
+from os import PathLike
+from typing import (
+    Any, Callable, Generator, Hashable, Iterable, Mapping, Sequence,
+)
+import threading
+
+from .engine import Engine, MappedQuery, Query
+from .instrumentation import Listener
+from .pool import ConnectionPool
+from .types import CursorParams
+
+ShardKey = Callable[[CursorParams], Hashable]
+
+
+class ShardedEngine:
+    """
+    Набор движков по одному на шард с общими кэшами шаблонов
+    и мапперов. Шард для запроса выбирается функцией shard_key
+    от его параметров. pools - словарь идентификатор шарда -> пул
+    или последовательность пулов, тогда идентификаторы - индексы.
+    Остальные аргументы передаются в Engine.
+    """
+
+    def __init__(
+        self,
+        templates_paths: str | PathLike | Sequence[str | PathLike],
+        pools: Mapping[Hashable, ConnectionPool] | Sequence[ConnectionPool],
+        shard_key: ShardKey,
+        max_workers: int | None = None,
+        **kwargs: Any,
+    ):
+        if isinstance(pools, Mapping):
+            items = list(pools.items())
+        else:
+            items = list(enumerate(pools))
+        if not items:
+            raise ValueError('At least one shard pool is required')
+
+        (first_id, first_pool), *rest = items
+        base = Engine(templates_paths, first_pool, **kwargs)
+        self.shards: dict[Hashable, Engine] = {first_id: base}
+        for shard_id, pool in rest:
+            self.shards[shard_id] = base.with_pool(pool)
+        self.shard_key = shard_key
+        self.max_workers = max_workers or len(self.shards)
+        self._executor: ThreadPoolExecutor | None = None
+        self._executor_lock = threading.Lock()
+
+    def shard(self, shard_id: Hashable) -> Engine:
+        try:
+            return self.shards[shard_id]
+        except KeyError:
+            raise ValueError(f'Unknown shard: {shard_id!r}') from None
+
+    def shard_for(self, params: CursorParams) -> Hashable:
+        shard_id = self.shard_key(params)
+        if shard_id not in self.shards:
+            raise ValueError(f'Unknown shard: {shard_id!r}')
+        return shard_id
+
+    def engine_for(self, params: CursorParams) -> Engine:
+        """
+        Движок шарда для параметров, например, чтобы выполнить
+        несколько запросов в одной транзакции:
+        >>> with sharded.engine_for({'tenant_id': 1}) as db:
+        ...     ...
+        """
+        return self.shards[self.shard_for(params)]
+
+    def query_from(
+        self,
+        filename: str,
+        readonly: bool | None = None,
+    ) -> 'ShardedQuery':
+        return ShardedQuery(self, {
+            shard_id: engine.query_from(filename, readonly)
+            for shard_id, engine in self.shards.items()
+        })
+
+    def query(
+        self,
+        content: str,
+        static: bool = None,
+        readonly: bool | None = None,
+    ) -> 'ShardedQuery':
+        return ShardedQuery(self, {
+            shard_id: engine.query(content, static, readonly)
+            for shard_id, engine in self.shards.items()
+        })
+
+    def add_listener(self, listener: Listener) -> None:
+        for engine in self.shards.values():
+            engine.add_listener(listener)
+
+    def remove_listener(self, listener: Listener) -> None:
+        for engine in self.shards.values():
+            engine.remove_listener(listener)
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    self.max_workers, thread_name_prefix='shard',
+                )
+            return self._executor
+
+    def close(self) -> None:
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+    def __enter__(self) -> 'ShardedEngine':
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+
+class ShardedQuery:
+    """
+    Запрос на всех шардах. Методы выполнения выбирают шард по
+    параметрам. Если движок шарда уже открыт в текущем потоке,
+    используется его соединение, иначе на время вызова открывается
+    отдельный контекст движка. Исключение - execute: курсор нужен
+    после вызова, поэтому он работает только в открытом контексте
+    движка шарда (см. ShardedEngine.engine_for).
+    """
+
+    def __init__(
+        self,
+        sharded: ShardedEngine,
+        queries: dict[Hashable, Query | MappedQuery],
+    ):
+        self.sharded = sharded
+        self.queries = queries
+
+    def on(self, shard_id: Hashable) -> Query | MappedQuery:
+        """Запрос, привязанный к движку одного шарда"""
+        self.sharded.shard(shard_id)
+        return self.queries[shard_id]
+
+    def return_as(self, *args: Any, **kwargs: Any) -> 'ShardedQuery':
+        return ShardedQuery(self.sharded, {
+            shard_id: query.return_as(*args, **kwargs)
+            for shard_id, query in self.queries.items()
+        })
+
+    def _run(
+        self,
+        shard_id: Hashable,
+        method: str,
+        params: CursorParams,
+    ) -> Any:
+        engine = self.sharded.shards[shard_id]
+        call = getattr(self.queries[shard_id], method)
+        # Курсор execute пережил бы временный контекст, коммит
+        # и возврат соединения в пул, поэтому без открытого контекста
+        # запрос получает ту же ошибку, что и обычный Query
+        if engine.conn.active or method == 'execute':
+            return call(params)
+        with engine:
+            return call(params)
+
+    def _call(self, method: str, params: CursorParams) -> Any:
+        return self._run(self.sharded.shard_for(params), method, params)
+
+    def execute(self, params: CursorParams = None, /, **kwargs: Any) -> Any:
+        return self._call('execute', params or kwargs)
+
+    def all(self, params: CursorParams = None, /, **kwargs: Any) -> list:
+        return self._call('all', params or kwargs)
+
+    def one(self, params: CursorParams = None, /, **kwargs: Any) -> Any:
+        return self._call('one', params or kwargs)
+
+    def scalar(self, params: CursorParams = None, /, **kwargs: Any) -> Any:
+        return self._call('scalar', params or kwargs)
+
+    def rowcount(self, params: CursorParams = None, /, **kwargs: Any) -> int:
+        return self._call('rowcount', params or kwargs)
+
+    def iter(
+        self,
+        params: CursorParams = None,
+        /,
+        **kwargs: Any,
+    ) -> Generator[Any, None, None]:
+        params = params or kwargs
+        shard_id = self.sharded.shard_for(params)
+        engine = self.sharded.shards[shard_id]
+        query = self.queries[shard_id]
+        if engine.conn.active:
+            yield from query.iter(params)
+            return
+        with engine:
+            yield from query.iter(params)
+
+    def each(
+        self,
+        params: CursorParams = None,
+        /,
+        _method: str = 'all',
+        **kwargs: Any,
+    ) -> dict[Hashable, Any]:
+        """
+        Выполняет запрос на всех шардах параллельно и возвращает
+        результаты по идентификаторам шардов. Ошибка шарда
+        пробрасывается после завершения остальных.
+        """
+        params = params or kwargs
+        executor = self.sharded.executor
+        futures = {
+            shard_id: executor.submit(self._run, shard_id, _method, params)
+            for shard_id in self.queries
+        }
+        wait(futures.values())
+        return {
+            shard_id: future.result() for shard_id, future in futures.items()
+        }
+
+    def gather(
+        self,
+        params: CursorParams = None,
+        /,
+        _key: Callable[[Any], Any] | None = None,
+        _reverse: bool = False,
+        **kwargs: Any,
+    ) -> list:
+        """
+        Scatter-gather: строки всех шардов одним списком. С _key
+        результаты шардов, уже отсортированные по этому ключу
+        (ORDER BY в запросе), сливаются с сохранением порядка,
+        без _key идут подряд в порядке шардов.
+        """
+        results: Iterable[list] = self.each(params or kwargs).values()
+        if _key is None:
+            return list(chain.from_iterable(results))
+        return list(merge(*results, key=_key, reverse=_reverse))
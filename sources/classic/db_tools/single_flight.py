@@ -0,0 +1,89 @@
+from copy import deepcopy
+from typing import Any, Callable, Hashable, Mapping
+import threading
+
+
+def freeze(value: Any) -> Hashable:
+    """
+    Хэшируемое представление параметров запроса.
+    Выбрасывает TypeError для значений, которые нельзя сравнить.
+    """
+    if isinstance(value, Mapping):
+        return tuple(sorted((key, freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    if isinstance(value, (set, frozenset)):
+        return frozenset(freeze(item) for item in value)
+    hash(value)
+    return value
+
+
+class Flight:
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error: BaseException | None = None
+
+
+class SingleFlight:
+    """
+    Объединение одинаковых одновременных запросов: первый поток
+    выполняет запрос, остальные с тем же ключом ждут и получают
+    его результат (или его исключение).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flights: dict[Hashable, Flight] = {}
+        #: Сколько выполнений сэкономлено
+        self.shared = 0
+
+    def run(
+        self,
+        key: tuple,
+        params: Any,
+        func: Callable[[], Any],
+        copy: bool = False,
+    ) -> Any:
+        """
+        Списки в результате ожидающие получают собственными (строки
+        общие), copy=True отдает им глубокую копию результата,
+        например, объектов маппера, которые будут изменяться.
+        Параметры, которые нельзя привести к ключу, выполняются
+        без объединения.
+        """
+        try:
+            key = (*key, freeze(params))
+        except TypeError:
+            return func()
+
+        with self.lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = Flight()
+            else:
+                self.shared += 1
+
+        if leader:
+            try:
+                flight.result = func()
+            except BaseException as error:
+                flight.error = error
+                raise
+            finally:
+                with self.lock:
+                    del self.flights[key]
+                flight.event.set()
+            return flight.result
+
+        flight.event.wait()
+        if flight.error is not None:
+            raise flight.error
+        if copy:
+            return deepcopy(flight.result)
+        if isinstance(flight.result, list):
+            return list(flight.result)
+        return flight.result
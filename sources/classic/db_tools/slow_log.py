@@ -0,0 +1,227 @@
+from collections import deque
+from dataclasses import dataclass, asdict
+from typing import Any, Callable, TextIO
+import json
+import logging
+import queue
+import re
+import threading
+import time
+
+from . import exceptions
+from .instrumentation import QueryEvent
+from .pool import ConnectionPool
+
+logger = logging.getLogger(__name__)
+
+Redactor = Callable[[Any], Any]
+
+_READ_ONLY_RE = re.compile(r'^\s*(SELECT|VALUES)\b', re.IGNORECASE)
+
+
+def redact_keys(*keys: str, mask: str = '***') -> Redactor:
+    """
+    Хук для SlowQueryLog, заменяющий значения перечисленных
+    именованных параметров.
+    """
+    keys = frozenset(keys)
+
+    def redact(params: Any) -> Any:
+        if not isinstance(params, dict):
+            return params
+        return {
+            key: mask if key in keys else value
+            for key, value in params.items()
+        }
+
+    return redact
+
+
+@dataclass(slots=True)
+class SlowQuery:
+    template: str
+    method: str
+    sql: str | None
+    params: Any
+    started_at: float
+    total_time: float
+    render_time: float
+    execute_time: float
+    fetch_time: float
+    map_time: float
+    rows: int
+    error: str | None = None
+    plan: list[str] | None = None
+    plan_error: str | None = None
+
+
+class SlowQueryLog:
+    """
+    Слушатель Engine, который сохраняет выполнения дольше threshold
+    секунд в кольцевой буфер на capacity записей.
+
+    Если передан pool, для медленных запросов снимается план через
+    отдельное соединение из него: explain_sql, либо explain_analyze_sql
+    для читающих запросов при analyze=True. Транзакция, в которой
+    снимался план, откатывается. Планы снимаются не чаще раза
+    в explain_interval секунд.
+
+    План снимается фоновым потоком и дописывается в запись позже,
+    поток запроса не ждет ни соединения, ни повторного выполнения.
+    Соединение ждется не дольше explain_checkout_timeout секунд
+    с наименьшим приоритетом. Если свободного нет или предыдущий
+    план еще снимается, план пропускается, причина - в plan_error.
+    """
+
+    def __init__(
+        self,
+        threshold: float,
+        capacity: int = 100,
+        redact: Redactor | None = None,
+        pool: ConnectionPool | None = None,
+        analyze: bool = False,
+        explain_interval: float = 60.0,
+        explain_sql: str = 'EXPLAIN',
+        explain_analyze_sql: str = 'EXPLAIN ANALYZE',
+        explain_checkout_timeout: float = 0.05,
+        explain_priority: int = 100,
+    ):
+        self.threshold = threshold
+        self.redact = redact
+        self.pool = pool
+        self.analyze = analyze
+        self.explain_interval = explain_interval
+        self.explain_sql = explain_sql
+        self.explain_analyze_sql = explain_analyze_sql
+        self.explain_checkout_timeout = explain_checkout_timeout
+        self.explain_priority = explain_priority
+        self.records: deque[SlowQuery] = deque(maxlen=capacity)
+        self.lock = threading.Lock()
+        self._last_explain = None
+        self._plans: queue.Queue = queue.Queue(maxsize=1)
+        self._worker: threading.Thread | None = None
+
+    def __call__(self, event: QueryEvent) -> None:
+        total_time = event.total_time
+        if total_time < self.threshold:
+            return
+
+        params = event.params
+        if self.redact is not None:
+            params = self.redact(params)
+        record = SlowQuery(
+            template=event.template,
+            method=event.method,
+            sql=event.sql,
+            params=params,
+            started_at=time.time() - total_time,
+            total_time=total_time,
+            render_time=event.render_time,
+            execute_time=event.execute_time,
+            fetch_time=event.fetch_time,
+            map_time=event.map_time,
+            rows=event.rows,
+            error=repr(event.error) if event.error is not None else None,
+        )
+        if event.sql is not None and self.pool is not None:
+            self._schedule_explain(record, event.sql, event.params)
+
+        with self.lock:
+            self.records.append(record)
+        logger.warning(
+            'Slow query %s.%s: %.3f s', event.template, event.method,
+            total_time,
+        )
+
+    def _schedule_explain(
+        self,
+        record: SlowQuery,
+        sql: str,
+        params: Any,
+    ) -> None:
+        # Отметка времени ставится только за поставленный в очередь
+        # план, пропущенный план не откладывает следующий
+        now = time.monotonic()
+        with self.lock:
+            if (
+                self._last_explain is not None
+                and now - self._last_explain < self.explain_interval
+            ):
+                return
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run, name='classic-db-tools-explain',
+                    daemon=True,
+                )
+                self._worker.start()
+            try:
+                self._plans.put_nowait((record, sql, params))
+            except queue.Full:
+                record.plan_error = 'Skipped: previous plan is still running'
+                return
+            self._last_explain = now
+
+    def _run(self) -> None:
+        while True:
+            record, sql, params = self._plans.get()
+            try:
+                self._explain(record, sql, params)
+            finally:
+                self._plans.task_done()
+
+    def wait_plans(self) -> None:
+        """Ждет, пока будут сняты все запланированные планы"""
+        self._plans.join()
+
+    def _explain(self, record: SlowQuery, sql: str, params: Any) -> None:
+        if self.analyze and _READ_ONLY_RE.match(sql):
+            prefix = self.explain_analyze_sql
+        else:
+            prefix = self.explain_sql
+        try:
+            conn = self.pool.getconn(
+                priority=self.explain_priority,
+                timeout=self.explain_checkout_timeout,
+            )
+        except exceptions.ConnectionLimitError as error:
+            record.plan_error = f'Skipped: no free connection ({error!r})'
+            with self.lock:
+                self._last_explain = None
+            return
+        except Exception as error:
+            record.plan_error = repr(error)
+            return
+        try:
+            try:
+                cursor = conn.cursor()
+                cursor.execute(f'{prefix} {sql}', params)
+                record.plan = [
+                    ' '.join(str(value) for value in row)
+                    for row in cursor.fetchall()
+                ]
+                cursor.close()
+            finally:
+                conn.rollback()
+        except Exception as error:
+            record.plan_error = repr(error)
+        finally:
+            self.pool.release(conn)
+
+    def snapshot(self) -> list[SlowQuery]:
+        with self.lock:
+            return list(self.records)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.records.clear()
+
+    def dump(self, file: TextIO | None = None) -> list[dict[str, Any]]:
+        """
+        Возвращает записи словарями, а если передан file,
+        пишет их туда в формате JSON Lines.
+        """
+        records = [asdict(record) for record in self.snapshot()]
+        if file is not None:
+            for record in records:
+                file.write(json.dumps(record, default=repr) + '\n')
+        return records
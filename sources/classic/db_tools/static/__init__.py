@@ -1 +1 @@
-from .factory import StaticQueriesCache
+from .factory import StaticQueriesCache, StaticQuery
@@ -1,9 +1,11 @@
 from pathlib import Path
-from typing import Sequence, Callable
+from time import perf_counter
+from typing import Iterable, Sequence, Callable
 
 import os
 import threading
 
+from classic.db_tools.instrumentation import QueryEvent
 from classic.db_tools.types import Cursor, CursorParams
 
 
@@ -29,16 +31,32 @@ class StaticQuery:
         self,
         params: CursorParams = None,
         cursor: Cursor = None,
+        event: QueryEvent | None = None,
     ) -> Cursor:
+        if event is None:
+            cursor.execute(self.content, params)
+            return cursor
+
+        event.sql, event.params = self.content, params
+        started = perf_counter()
         cursor.execute(self.content, params)
+        event.execute_time += perf_counter() - started
         return cursor
 
     def executemany(
         self,
-        params: Sequence[CursorParams],
+        params: Iterable[CursorParams],
         cursor: Cursor = None,
+        event: QueryEvent | None = None,
     ) -> Cursor:
+        if event is None:
+            cursor.executemany(self.content, params)
+            return cursor
+
+        event.sql = self.content
+        started = perf_counter()
         cursor.executemany(self.content, params)
+        event.execute_time += perf_counter() - started
         return cursor
 
 
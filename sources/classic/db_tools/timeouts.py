@@ -0,0 +1,185 @@
+from heapq import heapify, heappop, heappush
+from itertools import count
+from types import TracebackType
+from typing import Callable
+import logging
+import os
+import threading
+import time
+
+from . import poolvalidators
+from .exceptions import StatementTimeoutError
+from .types import Connection
+
+logger = logging.getLogger(__name__)
+
+
+class Watch:
+    """
+    Отмена, запланированная на deadline. После stop отмена
+    гарантированно не будет вызвана.
+    """
+    __slots__ = ('cancel', 'deadline', 'lock', 'done', 'fired')
+
+    def __init__(self, cancel: Callable[[], object], deadline: float):
+        self.cancel = cancel
+        self.deadline = deadline
+        self.lock = threading.Lock()
+        self.done = False
+        self.fired = False
+
+    def fire(self) -> None:
+        with self.lock:
+            if self.done:
+                return
+            self.done = True
+            self.fired = True
+            try:
+                self.cancel()
+            except Exception:
+                logger.exception('Could not cancel statement')
+
+
+class Watchdog:
+    """
+    Один фоновый поток на процесс, вызывающий отмену запросов,
+    не уложившихся в срок. Поток запускается при первом запросе
+    с таймаутом и перезапускается после fork.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.heap: list[tuple[float, int, Watch]] = []
+        self.stopped = 0
+        self.counter = count()
+        self.thread: threading.Thread | None = None
+        self.pid: int | None = None
+
+    def watch(self, timeout: float, cancel: Callable[[], object]) -> Watch:
+        watch = Watch(cancel, time.monotonic() + timeout)
+        with self.condition:
+            if self.pid != os.getpid():
+                self._start()
+            # Остановленные записи удаляются, когда дойдут до вершины,
+            # при большом их числе куча пересобирается
+            if self.stopped > len(self.heap) // 2 + 64:
+                self.heap = [item for item in self.heap if not item[2].done]
+                heapify(self.heap)
+                self.stopped = 0
+            heappush(self.heap, (watch.deadline, next(self.counter), watch))
+            if self.heap[0][2] is watch:
+                self.condition.notify()
+        return watch
+
+    def stop(self, watch: Watch) -> bool:
+        """Снимает отмену, возвращает True, если она уже сработала"""
+        with watch.lock:
+            stopped = not watch.done
+            watch.done = True
+            fired = watch.fired
+        if stopped:
+            with self.condition:
+                self.stopped += 1
+        return fired
+
+    def _after_fork(self) -> None:
+        # Поток родителя мог держать блокировку условия в момент fork,
+        # а его записи в потомке не нужны
+        self.condition = threading.Condition()
+        self.heap = []
+        self.stopped = 0
+        self.thread = None
+        self.pid = None
+
+    def _start(self) -> None:
+        self.heap = []
+        self.stopped = 0
+        self.pid = os.getpid()
+        self.thread = threading.Thread(
+            target=self._run, name='classic-db-tools-watchdog', daemon=True,
+        )
+        self.thread.start()
+
+    def _run(self) -> None:
+        while True:
+            with self.condition:
+                while True:
+                    while self.heap and self.heap[0][2].done:
+                        heappop(self.heap)
+                        self.stopped = max(self.stopped - 1, 0)
+                    if not self.heap:
+                        self.condition.wait()
+                        continue
+                    delay = self.heap[0][0] - time.monotonic()
+                    if delay <= 0:
+                        watch = heappop(self.heap)[2]
+                        break
+                    self.condition.wait(delay)
+            watch.fire()
+
+
+#: Общий для всех движков процесса
+WATCHDOG = Watchdog()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=WATCHDOG._after_fork)
+
+
+class StatementGuard:
+    """
+    Ограничивает время операции на соединении (выполнения запроса
+    или выборки) timeout секундами. Если у драйвера есть собственное
+    ограничение (limit_statement валидатора, для sqlite3 - обработчик
+    прогресса), используется оно, иначе запрос отменяется из потока
+    Watchdog. Ошибку драйвера об отмене заменяет на
+    StatementTimeoutError и откатывает всю открытую транзакцию, чтобы
+    соединение оставалось пригодным: в PostgreSQL транзакция после
+    ошибки все равно прервана. Чтобы сохранить сделанное до запроса,
+    его надо выполнять внутри точки сохранения.
+
+    Охраняет только операции внутри with, может входить повторно.
+    """
+
+    def __init__(
+        self,
+        conn: Connection,
+        timeout: float,
+        watchdog: Watchdog = WATCHDOG,
+    ):
+        self.conn = conn
+        self.timeout = timeout
+        self.watchdog = watchdog
+        self.validator = poolvalidators.validator_for(conn)
+        self.watch: Watch | None = None
+        self.limit = None
+
+    def __enter__(self) -> 'StatementGuard':
+        conn = self.conn
+        self.limit = self.validator.limit_statement(conn, self.timeout)
+        if self.limit is None:
+            validator = self.validator
+            self.watch = self.watchdog.watch(
+                self.timeout, lambda: validator.cancel(conn),
+            )
+        return self
+
+    def __exit__(
+        self,
+        type_: type[BaseException] | None,
+        value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> bool | None:
+        if self.limit is not None:
+            fired = self.validator.unlimit_statement(self.conn, self.limit)
+        else:
+            fired = self.watchdog.stop(self.watch)
+        if not fired or type_ is None or not issubclass(type_, Exception):
+            return False
+        if getattr(self.conn, 'autocommit', True) is False:
+            try:
+                self.conn.rollback()
+            except Exception:
+                logger.exception('Could not roll back cancelled statement')
+        raise StatementTimeoutError(
+            f'Statement cancelled after {self.timeout} s'
+        ) from value
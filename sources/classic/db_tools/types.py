@@ -1,4 +1,4 @@
-from typing import Any, Protocol, Sequence, Optional, TypeAlias
+from typing import Any, Iterable, Protocol, Sequence, Optional, TypeAlias
 
 
 Row: TypeAlias = tuple[Any, ...]
@@ -20,7 +20,7 @@ class Cursor(Protocol):
     def executemany(
             self,
             operation: str,
-            seq_of_parameters: Sequence[CursorParams],
+            seq_of_parameters: Iterable[CursorParams],
     ) -> None:
         pass
 
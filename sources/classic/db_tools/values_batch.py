@@ -0,0 +1,202 @@
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Sequence
+import re
+import sqlite3
+
+from .types import CursorParams
+
+#: Число строк в одном INSERT, если не задано явно
+DEFAULT_BATCH_SIZE = 1000
+
+#: Ограничения драйверов на число параметров в одном запросе
+MAX_PARAMS = {
+    'sqlite3': 32766 if sqlite3.sqlite_version_info >= (3, 32) else 999,
+    'psycopg': 65535,
+    'psycopg2': 65535,
+    'pymysql': 65535,
+    'MySQLdb': 65535,
+    'pymssql': 2100,
+}
+DEFAULT_MAX_PARAMS = 999
+
+_TOKEN_RE = re.compile(
+    r"""
+      '(?:[^']|'')*'
+    | "(?:[^"]|"")*"
+    | (?P<pyformat>%\((?P<pyformat_name>\w+)\)s)
+    | (?P<format>%s)
+    | (?P<qmark>\?)
+    | (?P<numeric>(?<!:):(?P<numeric_index>\d+))
+    | (?P<asyncpg>\$(?P<asyncpg_index>\d+))
+    | (?P<named>(?<!:):(?P<named_name>[A-Za-z_]\w*))
+    """,
+    re.VERBOSE,
+)
+_VALUES_RE = re.compile(
+    r"""'(?:[^']|'')*'|"(?:[^"]|"")*"|(?P<values>\bVALUES\s*\()""",
+    re.IGNORECASE,
+)
+_PARENS_RE = re.compile(r"""'(?:[^']|'')*'|"(?:[^"]|"")*"|[()]""")
+_RETURNING_RE = re.compile(r'\bRETURNING\b', re.IGNORECASE)
+
+_POSITIONAL = ('qmark', 'format')
+_NUMBERED = ('numeric', 'asyncpg')
+_NAMED = ('named', 'pyformat')
+
+
+@dataclass(frozen=True, slots=True)
+class ValuesTemplate:
+    """
+    Однострочный INSERT, разобранный на части до группы VALUES,
+    саму группу и хвост (ON CONFLICT, RETURNING и т.п.). Группа
+    хранится как literals, между которыми стоят параметры slots.
+    keys - различные параметры строки в порядке появления.
+    """
+    prefix: str
+    literals: tuple[str, ...]
+    slots: tuple[str | int, ...]
+    suffix: str
+    style: str
+    keys: tuple[str | int, ...]
+    returning: bool
+
+    def row_sql(self, row: int) -> str:
+        pieces = [self.literals[0]]
+        for slot, literal in zip(self.slots, self.literals[1:]):
+            pieces.append(self.placeholder(slot, row))
+            pieces.append(literal)
+        return ''.join(pieces)
+
+    def placeholder(self, slot: str | int, row: int) -> str:
+        style = self.style
+        if style == 'qmark':
+            return '?'
+        elif style == 'format':
+            return '%s'
+        elif style == 'numeric':
+            return f':{slot + row * len(self.keys)}'
+        elif style == 'asyncpg':
+            return f'${slot + row * len(self.keys)}'
+        elif style == 'named':
+            return f':{slot}_r{row}'
+        else:
+            return f'%({slot}_r{row})s'
+
+    def params(self, rows: Sequence[CursorParams]) -> CursorParams:
+        if self.style in _NAMED:
+            return {
+                f'{key}_r{index}': row[key]
+                for index, row in enumerate(rows)
+                for key in self.keys
+            }
+        params = []
+        for row in rows:
+            params.extend(row)
+        return params
+
+
+def _find_group(sql: str) -> tuple[int, int]:
+    for match in _VALUES_RE.finditer(sql):
+        if match.group('values'):
+            break
+    else:
+        raise ValueError('Query is not an INSERT ... VALUES (...)')
+
+    start = match.end() - 1
+    depth = 0
+    for match in _PARENS_RE.finditer(sql, start):
+        if match.group() == '(':
+            depth += 1
+        elif match.group() == ')':
+            depth -= 1
+            if depth == 0:
+                return start, match.end()
+    raise ValueError('Unbalanced parentheses after VALUES')
+
+
+def _has_placeholders(sql: str) -> bool:
+    return any(match.lastgroup for match in _TOKEN_RE.finditer(sql))
+
+
+@lru_cache(maxsize=256)
+def parse_values(sql: str) -> ValuesTemplate:
+    """
+    Разбирает INSERT с одной группой VALUES. Параметры допускаются
+    только внутри группы и только одного стиля.
+    """
+    start, end = _find_group(sql)
+    prefix, group, suffix = sql[:start], sql[start:end], sql[end:]
+    if _has_placeholders(prefix) or _has_placeholders(suffix):
+        raise ValueError(
+            'Only the VALUES group may contain parameters '
+            'for multi-row batching'
+        )
+
+    literals, slots, keys, styles = [], [], [], set()
+    position = 0
+    for match in _TOKEN_RE.finditer(group):
+        style = match.lastgroup
+        if style is None:
+            # Строковый литерал или идентификатор в кавычках
+            continue
+        styles.add(style)
+        literals.append(group[position:match.start()])
+        position = match.end()
+        if style in _POSITIONAL:
+            slot = len(slots)
+        elif style in _NUMBERED:
+            slot = int(match.group(f'{style}_index'))
+        else:
+            slot = match.group(f'{style}_name')
+        slots.append(slot)
+        if slot not in keys:
+            keys.append(slot)
+    literals.append(group[position:])
+
+    if len(styles) != 1:
+        raise ValueError('VALUES group must use exactly one parameter style')
+    style = styles.pop()
+    if style in _NUMBERED and sorted(keys) != list(range(1, len(keys) + 1)):
+        raise ValueError('Numbered parameters must be 1..N')
+
+    return ValuesTemplate(
+        prefix=prefix,
+        literals=tuple(literals),
+        slots=tuple(slots),
+        suffix=suffix,
+        style=style,
+        keys=tuple(keys),
+        returning=bool(_RETURNING_RE.search(suffix)),
+    )
+
+
+def has_returning(sql: str) -> bool:
+    return bool(_RETURNING_RE.search(sql))
+
+
+@lru_cache(maxsize=256)
+def multi_row_sql(sql: str, rows: int) -> str:
+    """
+    SQL вставки rows строк за раз, кэшируется по числу строк.
+    """
+    template = parse_values(sql)
+    return (
+        template.prefix
+        + ', '.join(template.row_sql(row) for row in range(rows))
+        + template.suffix
+    )
+
+
+def max_params_for(cursor: Any) -> int:
+    module = type(cursor).__module__.split('.')[0]
+    return MAX_PARAMS.get(module, DEFAULT_MAX_PARAMS)
+
+
+def rows_per_batch(
+    template: ValuesTemplate,
+    batch_size: int,
+    max_params: int,
+) -> int:
+    per_row = len(template.keys) or 1
+    return max(1, min(batch_size, max_params // per_row))
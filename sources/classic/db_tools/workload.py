@@ -0,0 +1,205 @@
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from time import perf_counter, sleep
+from typing import Any, Callable, Sequence
+import itertools
+import random
+import threading
+
+from .engine import Engine, Query
+from .instrumentation import percentile
+from .types import CursorParams
+
+ParamsFactory = Callable[[random.Random], CursorParams]
+
+
+@dataclass(slots=True)
+class Scenario:
+    """
+    Один вид запроса в нагрузке. template - имя файла шаблона
+    (.sql или .sql.tmpl) либо текст запроса, params строит параметры
+    из генератора случайных чисел потока, weight - доля сценария
+    в смеси, method - вызываемый метод Query.
+    """
+    name: str
+    template: str
+    params: ParamsFactory | None = None
+    weight: float = 1.0
+    method: str = 'all'
+    static: bool | None = None
+
+    def query(self, engine: Engine) -> Query:
+        if self.template.endswith(('.sql', '.sql.tmpl')):
+            return engine.query_from(self.template)
+        return engine.query(self.template, static=self.static)
+
+
+@dataclass(slots=True)
+class ScenarioReport:
+    """
+    Итоги сценария. latency - от запланированного старта запроса
+    до его завершения, включая ожидание соединения. pool_wait -
+    время получения соединения из пула. Времена в секундах.
+    """
+    count: int
+    errors: int
+    latency: dict[str, float]
+    pool_wait: dict[str, float]
+    error_types: dict[str, int] = field(default_factory=dict)
+
+
+@dataclass(slots=True)
+class WorkloadReport:
+    duration: float
+    requests: int
+    errors: int
+    scenarios: dict[str, ScenarioReport]
+    pool: dict[str, Any] | None = None
+
+    @property
+    def throughput(self) -> float:
+        return self.requests / self.duration if self.duration else 0.0
+
+    @property
+    def error_rate(self) -> float:
+        return self.errors / self.requests if self.requests else 0.0
+
+    def format(self) -> str:
+        lines = [
+            f'{self.requests} requests in {self.duration:.2f} s, '
+            f'{self.throughput:.0f} req/s, '
+            f'errors {self.error_rate:.2%}',
+            f'{"scenario":20} {"count":>8} {"errors":>7} '
+            f'{"p50 ms":>9} {"p99 ms":>9} {"max ms":>9} {"wait p99":>9}',
+        ]
+        for name, item in self.scenarios.items():
+            lines.append(
+                f'{name:20} {item.count:8} {item.errors:7} '
+                f'{item.latency["p50"] * 1000:9.2f} '
+                f'{item.latency["p99"] * 1000:9.2f} '
+                f'{item.latency["max"] * 1000:9.2f} '
+                f'{item.pool_wait["p99"] * 1000:9.2f}'
+            )
+            for error, count in item.error_types.items():
+                lines.append(f'    {error}: {count}')
+        return '\n'.join(lines)
+
+
+def summary(values: list[float]) -> dict[str, float]:
+    values = sorted(values)
+    result = {
+        f'p{percent}': percentile(values, percent)
+        for percent in (50, 90, 99)
+    }
+    result['max'] = values[-1] if values else 0.0
+    return result
+
+
+class _Samples:
+
+    def __init__(self):
+        self.latency = defaultdict(list)
+        self.wait = defaultdict(list)
+        self.errors = defaultdict(Counter)
+
+
+def run_workload(
+    engine: Engine,
+    scenarios: Sequence[Scenario],
+    concurrency: int = 10,
+    duration: float | None = 10.0,
+    requests: int | None = None,
+    rate: float | None = None,
+    seed: int | None = None,
+) -> WorkloadReport:
+    """
+    Выполняет смесь сценариев в concurrency потоках, каждый запрос -
+    в своем скоупе движка (соединение берется из пула и возвращается).
+
+    Нагрузка останавливается по истечении duration секунд или после
+    requests запросов, что наступит раньше. При заданном rate
+    запросы запускаются по общему расписанию rate в секунду, иначе
+    потоки выполняют их друг за другом без пауз. Задержка считается
+    от запланированного времени старта, так что отставание от
+    расписания под нагрузкой попадает в перцентили.
+    """
+    if duration is None and requests is None:
+        raise ValueError('Either duration or requests must be set')
+
+    queries = [scenario.query(engine) for scenario in scenarios]
+    weights = [scenario.weight for scenario in scenarios]
+    counter = itertools.count()
+    samples = [_Samples() for _ in range(concurrency)]
+    started = perf_counter()
+    deadline = started + duration if duration is not None else None
+
+    def worker(index: int) -> None:
+        rng = random.Random(None if seed is None else seed + index)
+        worker_samples = samples[index]
+        while True:
+            number = next(counter)
+            if requests is not None and number >= requests:
+                return
+            scheduled = perf_counter()
+            if rate is not None:
+                scheduled = started + number / rate
+                delay = scheduled - perf_counter()
+                if delay > 0:
+                    sleep(delay)
+            if deadline is not None and perf_counter() >= deadline:
+                return
+
+            position = rng.choices(range(len(scenarios)), weights)[0]
+            scenario = scenarios[position]
+            method = getattr(queries[position], scenario.method)
+            acquired = None
+            entered = perf_counter()
+            try:
+                params = scenario.params(rng) if scenario.params else None
+                entered = perf_counter()
+                with engine:
+                    acquired = perf_counter()
+                    method(params)
+            except Exception as error:
+                worker_samples.errors[scenario.name][
+                    type(error).__name__
+                ] += 1
+            finished = perf_counter()
+            worker_samples.latency[scenario.name].append(
+                finished - scheduled
+            )
+            worker_samples.wait[scenario.name].append(
+                (acquired or finished) - entered
+            )
+
+    threads = [
+        threading.Thread(target=worker, args=(index,), daemon=True)
+        for index in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = perf_counter() - started
+
+    report = {}
+    total = errors = 0
+    for scenario in scenarios:
+        latency, wait, error_types = [], [], Counter()
+        for item in samples:
+            latency.extend(item.latency[scenario.name])
+            wait.extend(item.wait[scenario.name])
+            error_types.update(item.errors[scenario.name])
+        failed = sum(error_types.values())
+        total += len(latency)
+        errors += failed
+        report[scenario.name] = ScenarioReport(
+            count=len(latency),
+            errors=failed,
+            latency=summary(latency),
+            pool_wait=summary(wait),
+            error_types=dict(error_types),
+        )
+
+    pool_stats = engine.pool.stats() if engine.pool.metrics else None
+    return WorkloadReport(elapsed, total, errors, report, pool_stats)
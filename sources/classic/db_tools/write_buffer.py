@@ -0,0 +1,213 @@
+from concurrent.futures import Future
+from itertools import groupby
+from time import monotonic
+from types import TracebackType
+from typing import TYPE_CHECKING, Any
+import logging
+import queue
+import threading
+
+from . import exceptions
+from .transaction import Transaction
+from .types import CursorParams
+
+if TYPE_CHECKING:
+    from .engine import Engine, Query
+
+logger = logging.getLogger(__name__)
+
+
+class _Write:
+    __slots__ = ('query', 'prepared', 'params', 'future')
+
+    def __init__(self, query: 'Query', params: CursorParams):
+        self.query = query
+        # Одинаковые запросы отдают один и тот же объект из кэша
+        # шаблонов, по нему записи и группируются
+        self.prepared = query._lazy_query()
+        self.params = params
+        self.future = Future()
+
+
+class _Flush:
+    __slots__ = ('future',)
+
+    def __init__(self):
+        self.future = Future()
+
+
+_CLOSE = object()
+
+
+class WriteBuffer:
+    """
+    Отложенная запись с групповым коммитом. Писатели ставят пары
+    (запрос, параметры) в очередь и получают Future, фоновый поток
+    собирает записи за flush_interval секунд, но не больше batch_size,
+    и выполняет их в одной транзакции. Идущие подряд записи одного
+    запроса отправляются одним executemany, порядок записей
+    сохраняется. Future завершается после коммита.
+
+    Если транзакция падает, записи пачки повторяются по одной, каждая
+    в своей транзакции, и ошибка попадает только в Future виновной
+    записи. Отмененные до записи Future пропускаются.
+
+    В очереди помещается не больше max_size записей, при заполнении
+    submit ждет до put_timeout секунд и бросает WriteBufferFull.
+    Ожидающие места писатели после close получают RuntimeError.
+    """
+
+    def __init__(
+        self,
+        engine: 'Engine',
+        max_size: int = 10_000,
+        batch_size: int = 1_000,
+        flush_interval: float = 0.01,
+        put_timeout: float | None = None,
+    ):
+        self.engine = engine
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.max_size = max_size
+        # Размер ограничивается условием not_full, а не самой очередью:
+        # ждать места можно только отпустив блокировку
+        self.queue = queue.Queue()
+        self.closed = False
+        # Проверка closed и постановка в очередь атомарны, чтобы ничего
+        # не попало в очередь после маркера остановки
+        self.lock = threading.Lock()
+        self.not_full = threading.Condition(self.lock)
+        self.flushes = 0
+        self.thread = threading.Thread(
+            target=self._run, name='classic-db-tools-write-buffer',
+            daemon=True,
+        )
+        self.thread.start()
+
+    def submit(
+        self,
+        query: 'Query',
+        params: CursorParams = None,
+        /,
+        **kwargs: Any,
+    ) -> Future:
+        write = _Write(query, params or kwargs)
+        with self.not_full:
+            if not self.not_full.wait_for(
+                lambda: self.closed or self.queue.qsize() < self.max_size,
+                self.put_timeout,
+            ):
+                raise exceptions.WriteBufferFull()
+            if self.closed:
+                raise RuntimeError('Write buffer is closed')
+            self.queue.put_nowait(write)
+        return write.future
+
+    def flush(self, timeout: float | None = None) -> None:
+        """
+        Ждет, пока будут закоммичены все записи, поставленные
+        до вызова. После close все уже записано, и ждать нечего.
+        """
+        marker = _Flush()
+        with self.lock:
+            if self.closed:
+                return
+            self.queue.put_nowait(marker)
+        marker.future.result(timeout)
+
+    def close(self) -> None:
+        """
+        Записывает все накопленное и останавливает фоновый поток.
+        """
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.queue.put_nowait(_CLOSE)
+            self.not_full.notify_all()
+        self.thread.join()
+
+    def __enter__(self) -> 'WriteBuffer':
+        return self
+
+    def __exit__(
+        self,
+        type_: type[BaseException] | None,
+        value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> bool:
+        self.close()
+        return False
+
+    def _run(self) -> None:
+        while True:
+            writes, markers, closing = self._collect()
+            if writes:
+                self._flush(writes)
+            for marker in markers:
+                marker.future.set_result(None)
+            if closing:
+                return
+
+    def _get(self, timeout: float | None = None) -> Any:
+        item = self.queue.get(timeout=timeout)
+        with self.not_full:
+            self.not_full.notify()
+        return item
+
+    def _collect(self) -> tuple[list[_Write], list[_Flush], bool]:
+        writes, markers = [], []
+        item = self._get()
+        deadline = monotonic() + self.flush_interval
+        while True:
+            if item is _CLOSE:
+                return writes, markers, True
+            if isinstance(item, _Flush):
+                markers.append(item)
+                return writes, markers, False
+            if item.future.set_running_or_notify_cancel():
+                writes.append(item)
+            if len(writes) >= self.batch_size:
+                return writes, markers, False
+            timeout = deadline - monotonic()
+            if timeout <= 0:
+                return writes, markers, False
+            try:
+                item = self._get(timeout)
+            except queue.Empty:
+                return writes, markers, False
+
+    def _flush(self, writes: list[_Write]) -> None:
+        try:
+            self._write(writes)
+        except Exception as error:
+            if len(writes) == 1:
+                writes[0].future.set_exception(error)
+                return
+            logger.warning(
+                'Batch of %d writes failed, retrying one by one',
+                len(writes),
+            )
+            for write in writes:
+                self._flush([write])
+            return
+
+        self.flushes += 1
+        for write in writes:
+            write.future.set_result(None)
+
+    def _write(self, writes: list[_Write]) -> None:
+        with self.engine.pool.connect() as conn:
+            cursor = conn.cursor()
+            try:
+                with Transaction(conn):
+                    for _, group in groupby(
+                        writes, key=lambda write: id(write.prepared),
+                    ):
+                        group = list(group)
+                        group[0].query.executemany(
+                            [write.params for write in group], cursor,
+                        )
+            finally:
+                cursor.close()
@@ -0,0 +1,72 @@
+from unittest.mock import Mock
+
+import pytest
+
+from classic.db_tools import AdaptiveLimit, ConnectionPool, Engine
+from classic.db_tools.exceptions import PoolOverloaded
+
+from .conftest import SQL_DIR_PATH
+
+
+def test_limit_grows_while_saturated_and_latency_stable():
+    limit = AdaptiveLimit(initial=2, max_limit=4)
+
+    for _ in range(20):
+        limit.acquire()
+        limit.acquire()
+        limit.observe(0.01)
+        limit.observe(0.01)
+        limit.release()
+        limit.release()
+
+    assert limit.current == 4
+    assert [value for _, value in limit.history] == [2, 3, 4]
+
+
+def test_limit_backs_off_on_latency_rise():
+    limit = AdaptiveLimit(initial=10, backoff=0.5)
+    limit.observe(0.01)
+
+    limit.observe(0.1)
+    # Второе снижение не раньше, чем через длительность выборки
+    limit.observe(0.1)
+
+    assert limit.current == 5
+
+
+def test_pool_sheds_load_above_limit():
+    pool = ConnectionPool(
+        Mock, validator=None, metrics=True,
+        adaptive=AdaptiveLimit(initial=1, min_limit=1),
+    )
+
+    with pool.connect():
+        with pytest.raises(PoolOverloaded):
+            pool.getconn()
+        assert pool.stats()['adaptive']['inflight'] == 1
+
+    stats = pool.stats()['adaptive']
+    assert stats['inflight'] == 0
+    assert stats['shed'] == 1
+
+
+def test_engine_feeds_query_time_not_hold_time():
+    conn = Mock()
+    conn.cursor.return_value.fetchall.return_value = [(1,)]
+    limit = AdaptiveLimit()
+    pool = ConnectionPool(lambda: conn, validator=None, adaptive=limit)
+    engine = Engine(SQL_DIR_PATH, pool)
+    events = []
+    engine.add_listener(events.append)
+    observed = []
+    limit.observe = observed.append
+
+    with engine:
+        engine.query('SELECT 1', static=True).all()
+        engine.query('SELECT 2', static=True).all()
+
+    assert observed == [
+        event.execute_time + event.fetch_time for event in events
+    ]
+    assert len(observed) == 2
+    assert limit not in engine.with_pool(ConnectionPool(Mock)).listeners
@@ -0,0 +1,86 @@
+import sqlite3
+
+import pytest
+
+from classic.db_tools import BulkUpsert, ConnectionPool, Engine, UpsertResult
+from classic.db_tools.bulk import quote_identifier
+
+from .conftest import SQL_DIR_PATH
+
+
+class Connection(sqlite3.Connection):
+    autocommit = False
+
+
+@pytest.fixture
+def pool(tmp_path):
+    path = tmp_path / 'bulk.db'
+
+    def connect():
+        return sqlite3.connect(path, factory=Connection)
+
+    with connect() as conn:
+        conn.execute(
+            'CREATE TABLE items (sku text, store int, qty int, '
+            'PRIMARY KEY (sku, store))'
+        )
+        conn.execute("INSERT INTO items VALUES ('a', 1, 1), ('b', 1, 1)")
+    return ConnectionPool(connect)
+
+
+def rows(pool):
+    with pool.connect() as conn:
+        return conn.execute('SELECT * FROM items ORDER BY sku').fetchall()
+
+
+def test_inserted_and_updated_counted(pool):
+    upsert = BulkUpsert(pool, 'items', ['sku', 'store'], chunk_size=2)
+
+    result = upsert.run([
+        {'sku': 'b', 'store': 1, 'qty': 2},
+        {'sku': 'c', 'store': 1, 'qty': 3},
+        {'sku': 'c', 'store': 1, 'qty': 4},
+        {'sku': 'd', 'store': 1, 'qty': 5},
+    ])
+
+    assert result == UpsertResult(inserted=2, updated=2)
+    assert rows(pool) == [
+        ('a', 1, 1), ('b', 1, 2), ('c', 1, 4), ('d', 1, 5),
+    ]
+
+
+def test_tuples_without_updates(pool):
+    upsert = BulkUpsert(
+        pool, 'items', ['sku', 'store'], update_columns=[],
+        columns=['sku', 'store', 'qty'],
+    )
+
+    result = upsert.run([('a', 1, 9), ('e', 1, 9)])
+
+    assert result == UpsertResult(inserted=1, updated=0)
+    assert rows(pool)[0] == ('a', 1, 1)
+
+
+def test_identifiers_validated(pool):
+    assert quote_identifier('public.items') == '"public"."items"'
+    with pytest.raises(ValueError):
+        BulkUpsert(pool, 'items; DROP TABLE items', ['sku'])
+
+
+def test_engine_scope_connection_reused(pool):
+    pool.limit = 1
+    engine = Engine(SQL_DIR_PATH, pool, commit_on_exit=False)
+
+    with engine:
+        engine.query(
+            "INSERT INTO items VALUES ('z', 1, 1)", static=True,
+        ).execute()
+        result = engine.bulk_upsert(
+            'items', [{'sku': 'a', 'store': 1, 'qty': 5}], ['sku', 'store'],
+        )
+        assert result == UpsertResult(inserted=0, updated=1)
+        assert engine.query(
+            'SELECT qty FROM items WHERE sku = ?', static=True,
+        ).scalar(('a',)) == 5
+
+    assert rows(pool) == [('a', 1, 1), ('b', 1, 1)]
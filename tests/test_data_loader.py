@@ -0,0 +1,98 @@
+from unittest.mock import Mock
+
+import pytest
+
+from classic.db_tools import ConnectionPool, Engine
+
+from .conftest import SQL_DIR_PATH
+
+ROWS = [(1, 'first'), (2, 'second'), (2, 'other'), (3, 'third')]
+
+
+@pytest.fixture
+def executed():
+    return []
+
+
+@pytest.fixture
+def engine(executed):
+    conn = Mock()
+    conn.autocommit = False
+    cursor = conn.cursor.return_value
+
+    def execute(sql, params):
+        executed.append(params)
+        cursor.fetchall.return_value = [
+            row for row in ROWS if row[0] in params['ids']
+        ]
+
+    cursor.execute.side_effect = execute
+    return Engine(SQL_DIR_PATH, ConnectionPool(lambda: conn, validator=None))
+
+
+@pytest.fixture
+def query(engine: Engine):
+    return engine.query(
+        'SELECT id, name FROM t WHERE id = ANY(%(ids)s)', static=True,
+    )
+
+
+def test_deferred_keys_loaded_in_one_batch(engine: Engine, query, executed):
+    loader = query.loader()
+
+    with engine:
+        pending = [loader.defer(key) for key in (3, 1, 3, 4)]
+        assert executed == []
+
+        assert [item.get() for item in pending] == [
+            (3, 'third'), (1, 'first'), (3, 'third'), None,
+        ]
+        assert loader.load(1) == (1, 'first')
+        assert loader.load_many([4, 3]) == [None, (3, 'third')]
+
+    assert executed == [{'ids': [3, 1, 4]}]
+    assert loader.batches == 1
+
+
+def test_memo_cleared_with_scope(engine: Engine, query, executed):
+    loader = query.loader()
+
+    with engine:
+        loader.load(1)
+        engine.clear_loaders()
+        loader.load(1)
+    with engine:
+        loader.load(1)
+
+    assert len(executed) == 3
+
+
+def test_many_and_batch_size(engine: Engine, query, executed):
+    loader = query.loader(key=0, many=True, batch_size=2)
+
+    with engine:
+        result = loader.load_many([1, 2, 5])
+
+    assert result == [[(1, 'first')], [(2, 'second'), (2, 'other')], []]
+    assert executed == [{'ids': [1, 2]}, {'ids': [5]}]
+
+
+class Task:
+
+    def __init__(self, id, name):
+        self.id, self.name = id, name
+
+
+def test_mapped_objects_keyed_by_id(engine: Engine, query):
+    mapped = query.return_as(Task)
+    mapped._iter = Mock(side_effect=lambda params, *args: iter([
+        Task(*row) for row in ROWS if row[0] in params['ids']
+    ]))
+    loader = mapped.loader()
+
+    with engine:
+        first, second = loader.load_many([1, 3])
+        assert loader.load(3) is second
+
+    assert (first.name, second.name) == ('first', 'third')
+    mapped._iter.assert_called_once()
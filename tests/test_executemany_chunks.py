@@ -0,0 +1,70 @@
+from unittest.mock import Mock, call
+
+import pytest
+
+from classic.db_tools import Engine, ConnectionPool
+
+from .conftest import SQL_DIR_PATH
+
+
+@pytest.fixture
+def engine():
+    return Engine(SQL_DIR_PATH, ConnectionPool(Mock()))
+
+
+@pytest.fixture
+def cursor():
+    cursor = Mock()
+    sent = cursor.sent = []
+    cursor.executemany.side_effect = (
+        lambda sql, params: sent.append(list(params))
+    )
+    return cursor
+
+
+def test_sequence_sent_at_once(engine: Engine, cursor):
+    query = engine.query('INSERT', static=True)
+
+    query.executemany([(1,), (2,), (3,)], cursor)
+
+    assert cursor.sent == [[(1,), (2,), (3,)]]
+
+
+def test_generator_chunked(engine: Engine, cursor):
+    query = engine.query('INSERT', static=True)
+    progress = Mock()
+
+    query.executemany(
+        ((index,) for index in range(5)), cursor,
+        chunk_size=2, progress=progress,
+    )
+
+    assert cursor.sent == [[(0,), (1,)], [(2,), (3,)], [(4,)]]
+    assert progress.call_args_list == [call(2), call(4), call(5)]
+
+
+def test_commit_per_chunk(engine: Engine, cursor):
+    query = engine.query('INSERT', static=True)
+
+    query.executemany(
+        [(1,), (2,), (3,)], cursor, chunk_size=2, per_chunk='commit',
+    )
+
+    assert cursor.connection.commit.call_count == 2
+
+
+def test_savepoint_rolled_back_on_error(engine: Engine, cursor):
+    query = engine.query('INSERT', static=True)
+    cursor.executemany.side_effect = [None, ValueError]
+
+    with pytest.raises(ValueError):
+        query.executemany(
+            [(1,), (2,), (3,)], cursor, chunk_size=2, per_chunk='savepoint',
+        )
+
+    assert [args.args[0] for args in cursor.execute.call_args_list] == [
+        'SAVEPOINT classic_db_tools_chunk',
+        'RELEASE SAVEPOINT classic_db_tools_chunk',
+        'SAVEPOINT classic_db_tools_chunk',
+        'ROLLBACK TO SAVEPOINT classic_db_tools_chunk',
+    ]
@@ -0,0 +1,71 @@
+from unittest.mock import Mock
+
+import pytest
+
+from classic.db_tools import Engine, ConnectionPool
+from classic.db_tools.instrumentation import QueryStats
+from classic.db_tools.types import Cursor
+
+from .conftest import SQL_DIR_PATH
+from .dto import Task
+
+
+@pytest.fixture
+def engine():
+    return Engine(SQL_DIR_PATH, ConnectionPool(Mock()))
+
+
+@pytest.fixture
+def cursor():
+    cursor = Mock(Cursor)
+    cursor.description = [
+        ('task__id', 0, 0, 0, 0, True),
+        ('task__name', 0, 0, 0, 0, True),
+    ]
+    cursor.fetchall.return_value = [(1, 'First'), (2, 'Second')]
+    cursor.fetchmany.side_effect = [[(1, 'First'), (2, 'Second')], []]
+    return cursor
+
+
+def test_events_emitted_to_listeners(engine: Engine, cursor):
+    events = []
+    engine.add_listener(events.append)
+
+    engine.query_from('test_render.sql').all(cursor=cursor)
+    query = engine.query('SELECT id, name FROM tasks', static=True)
+    query.return_as(Task).all(_cursor=cursor)
+
+    assert [(event.template, event.method) for event in events] == [
+        ('test_render.sql', 'all'),
+        ('SELECT id, name FROM tasks', 'all'),
+    ]
+    assert [event.rows for event in events] == [2, 2]
+    assert events[0].sql.strip() == "SELECT 'rendered'"
+    assert events[0].bytes == events[1].bytes > 0
+    assert events[1].map_time > 0
+
+
+def test_error_recorded(engine: Engine, cursor):
+    events = []
+    engine.add_listener(events.append)
+    cursor.execute.side_effect = ValueError
+
+    with pytest.raises(ValueError):
+        engine.query('SELECT 1', static=True).execute(cursor=cursor)
+
+    assert isinstance(events[0].error, ValueError)
+
+
+def test_stats_report(engine: Engine, cursor):
+    stats = QueryStats()
+    engine.add_listener(stats)
+
+    for _ in range(3):
+        engine.query('SELECT 1', static=True).all(cursor=cursor)
+    engine.remove_listener(stats)
+    engine.query('SELECT 1', static=True).all(cursor=cursor)
+
+    report = stats.report()['SELECT 1']
+    assert report['count'] == 3
+    assert report['rows'] == 6
+    assert set(report['total']) == {'p50', 'p90', 'p99', 'max'}
@@ -0,0 +1,139 @@
+from dataclasses import dataclass
+from typing import Annotated
+from unittest.mock import Mock
+
+import pytest
+
+from classic.db_tools import ID, Engine, LazyOneToMany
+from classic.db_tools.mapping import attach_lazy, parse_lazy_mapper
+
+from .dto import Task
+
+
+@dataclass
+class Status:
+    id: int
+    title: str
+    task_id: int
+
+
+@pytest.fixture
+def tasks(engine: Engine, ddl):
+    engine.query_from('example/save_task.sql').executemany([
+        {'name': 'First', 'value': ''},
+        {'name': 'Second', 'value': ''},
+        {'name': 'Third', 'value': ''},
+    ])
+    engine.query_from('example/save_task_statuses.sql').executemany([
+        {'title': 'CREATED', 'task_id': 1},
+        {'title': 'CREATED', 'task_id': 2},
+        {'title': 'CREATED', 'task_id': 3},
+        {'title': 'STARTED', 'task_id': 1},
+        {'title': 'FINISHED', 'task_id': 1},
+    ])
+    yield
+
+
+@pytest.fixture
+def statuses(engine: Engine):
+    return engine.query('''
+        SELECT
+            id      AS Status__id,
+            title   AS Status__title,
+            task_id AS Status__task_id
+        FROM task_status
+        WHERE task_id = ANY(%(ids)s)
+        ORDER BY id
+    ''', static=True).return_as(Status)
+
+
+def test_lazy_one_to_many(engine: Engine, tasks, statuses):
+    result = engine.query('''
+        SELECT id AS Task__id, name AS Task__name
+        FROM tasks
+        ORDER BY id
+    ''').return_as(
+        Task,
+        LazyOneToMany(Task, 'statuses', Status, statuses, 'task_id'),
+    ).all()
+
+    loader = result[0].statuses.loader
+    assert not result[2].statuses.loaded
+    assert loader.batches == 0
+
+    assert result[0].statuses == [
+        Status(id=1, title='CREATED', task_id=1),
+        Status(id=4, title='STARTED', task_id=1),
+        Status(id=5, title='FINISHED', task_id=1),
+    ]
+    assert result[2].statuses.loaded
+    assert len(result[1].statuses) == 1
+    assert loader.batches == 1
+    assert loader.rows == 5
+
+
+def test_lazy_load_retried_after_error():
+    query = Mock()
+    query.iter.side_effect = [
+        RuntimeError('connection lost'),
+        iter([Status(id=1, title='CREATED', task_id=1)]),
+    ]
+    relationship = LazyOneToMany(Task, 'statuses', Status, query, 'task_id')
+    mapper = parse_lazy_mapper(Task, [relationship])
+    tasks = list(attach_lazy(
+        [Task(id=1, name='First'), Task(id=2, name='Second')],
+        mapper, [relationship],
+    ))
+
+    with pytest.raises(RuntimeError):
+        len(tasks[0].statuses)
+
+    assert tasks[0].statuses == [Status(id=1, title='CREATED', task_id=1)]
+    assert tasks[1].statuses == []
+    assert tasks[0].statuses.loader.batches == 1
+    assert query.iter.call_count == 2
+
+
+def test_lazy_parents_registered_before_streaming():
+    query = Mock()
+    query.iter.return_value = iter([
+        Status(id=1, title='CREATED', task_id=1),
+        Status(id=2, title='CREATED', task_id=3),
+    ])
+    relationship = LazyOneToMany(Task, 'statuses', Status, query, 'task_id')
+    mapper = parse_lazy_mapper(Task, [relationship])
+    tasks = (Task(id=id_, name='') for id_ in range(1, 4))
+
+    for task in attach_lazy(tasks, mapper, [relationship], buffer=10):
+        len(task.statuses)
+
+    query.iter.assert_called_once_with({'ids': [1, 2, 3]})
+
+
+@dataclass
+class Assignment:
+    project: int
+    user: int
+    statuses: list[Status]
+
+
+def test_lazy_composite_id_split_into_params():
+    query = Mock()
+    query.iter.return_value = iter([
+        {'id': 1, 'title': 'CREATED', 'project': 1, 'user': 2},
+    ])
+    result = Annotated[Assignment, ID('project', 'user')]
+    relationship = LazyOneToMany(
+        Assignment, 'statuses', Status, query, ('project', 'user'),
+    )
+    mapper = parse_lazy_mapper(result, [relationship])
+    assignments = list(attach_lazy(
+        [Assignment(1, 2, []), Assignment(1, 3, [])],
+        mapper, [relationship],
+    ))
+
+    assert len(assignments[0].statuses) == 1
+    assert assignments[1].statuses == []
+    query.iter.assert_called_once_with({
+        'ids_project': [1, 1], 'ids_user': [2, 3],
+    })
@@ -0,0 +1,61 @@
+from unittest.mock import patch
+import importlib.util
+
+from classic.db_tools.mapping import compile_mapper, MapperDiskCache
+
+from . import dto
+
+
+columns = ('task__id', 'task__name')
+
+TASK_SOURCE = '''\
+from dataclasses import dataclass
+
+
+@dataclass
+class Task:
+    id: int
+    name: str
+'''
+
+
+def test_mapper_loaded_from_disk(tmp_path):
+    cache = MapperDiskCache(tmp_path)
+    compile_mapper(dto.Task, [], columns, disk_cache=cache)
+    assert len(list(tmp_path.glob('*.mapper'))) == 1
+
+    with patch('classic.db_tools.mapping.compiler.render_module') as render:
+        mapper = compile_mapper(dto.Task, [], columns, disk_cache=cache)
+
+    render.assert_not_called()
+    assert list(mapper([(1, 'First')])) == [dto.Task(id=1, name='First')]
+
+
+def _import_module(path, source):
+    path.write_text(source)
+    spec = importlib.util.spec_from_file_location('disk_cache_dto', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_changed_class_invalidates_entry(tmp_path):
+    cache = MapperDiskCache(tmp_path / 'cache')
+    path = tmp_path / 'disk_cache_dto.py'
+    old = _import_module(path, TASK_SOURCE)
+    compile_mapper(old.Task, [], columns, disk_cache=cache)
+
+    new = _import_module(path, TASK_SOURCE + '    value: str = None\n')
+    assert new.Task.__qualname__ == old.Task.__qualname__
+
+    with patch(
+        'classic.db_tools.mapping.compiler.render_module',
+        wraps=compile_mapper.__globals__['render_module'],
+    ) as render:
+        mapper = compile_mapper(new.Task, [], columns, disk_cache=cache)
+
+    render.assert_called_once()
+    task, = mapper([(1, 'First')])
+    assert type(task) is new.Task
+    assert task.value is None
+    assert len(list(cache.path.glob('*.mapper'))) == 2
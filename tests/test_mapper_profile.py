@@ -0,0 +1,67 @@
+import linecache
+from unittest.mock import Mock
+
+from classic.db_tools import Engine, ConnectionPool, OneToMany
+from classic.db_tools.mapping import compile_mapper
+
+from .conftest import SQL_DIR_PATH
+from .dto import Task, Status
+
+
+columns = ('task__id', 'task__name', 'status__id', 'status__title')
+rows = [
+    (1, 'First', 1, 'CREATED'),
+    (1, 'First', 2, 'STARTED'),
+    (2, 'Second', 3, 'CREATED'),
+    (1, 'First', 4, 'FINISHED'),
+]
+
+
+def test_sources_registered_in_linecache():
+    mapper = compile_mapper(Task, [], columns[:2])
+    filename = mapper.__code__.co_filename
+
+    assert filename.startswith('<mapper tests.dto.Task ')
+    assert linecache.getline(filename, 1) == 'def mapper_func(rows):\n'
+    again = compile_mapper(Task, [], columns[:2])
+    assert again.__code__.co_filename == filename
+
+
+def test_profile_counters():
+    mapper = compile_mapper(
+        Task, [OneToMany(Task, 'statuses', Status)], columns, profile=True,
+    )
+
+    list(mapper(rows))
+
+    assert mapper.stats.report() == {
+        'calls': 1,
+        'rows': 4,
+        'mappers': {
+            'task': {
+                'objects': 2, 'identity_map_hits': 1, 'run_length_hits': 1,
+            },
+            'status': {
+                'objects': 4, 'identity_map_hits': 0, 'run_length_hits': 0,
+            },
+        },
+    }
+
+
+def test_engine_collects_profiles():
+    engine = Engine(
+        SQL_DIR_PATH, ConnectionPool(Mock()), profile_mappers=True,
+    )
+    cursor = Mock()
+    cursor.description = [(name, 0, 0, 0, 0, True) for name in columns]
+    cursor.fetchmany.side_effect = [rows, [], rows, []]
+    query = engine.query('SELECT', static=True).return_as(
+        Task, OneToMany(Task, 'statuses', Status),
+    )
+
+    query.all(_cursor=cursor)
+    query.all(_cursor=cursor)
+
+    [report] = engine.mapper_profile().values()
+    assert report['calls'] == 2
+    assert report['rows'] == 8
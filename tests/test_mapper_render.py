@@ -0,0 +1,46 @@
+from typing import Annotated
+
+from classic.db_tools import OneToMany, ID
+from classic.db_tools.mapping import compile_mapper
+
+from .dto import Task, Status
+
+
+columns = ('task__id', 'task__name', 'status__id', 'status__title')
+
+
+def test_unsorted_rows_use_identity_map():
+    mapper = compile_mapper(
+        Task, [OneToMany(Task, 'statuses', Status)], columns,
+    )
+    rows = [
+        (1, 'First', 1, 'CREATED'),
+        (1, 'First', 2, 'STARTED'),
+        (2, 'Second', 3, 'CREATED'),
+        (1, 'First', 4, 'FINISHED'),
+    ]
+
+    result = list(mapper(rows))
+
+    assert [task.id for task in result] == [1, 2]
+    assert result[0].statuses == [
+        Status(id=1, title='CREATED'),
+        Status(id=2, title='STARTED'),
+        Status(id=4, title='FINISHED'),
+    ]
+
+
+def test_composite_ids_are_compared_by_columns():
+    mapper = compile_mapper(
+        tuple[Annotated[Task, ID('id', 'name')], Status], [], columns,
+    )
+    rows = [
+        (1, 'First', 1, 'CREATED'),
+        (1, 'First', 2, 'STARTED'),
+        (1, 'Other', 3, 'CREATED'),
+    ]
+
+    result = list(mapper(rows))
+
+    assert result[0][0] is result[1][0]
+    assert result[2][0] == Task(id=1, name='Other')
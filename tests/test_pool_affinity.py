@@ -0,0 +1,55 @@
+from unittest.mock import Mock
+import threading
+
+import pytest
+
+from classic.db_tools import ConnectionPool
+from classic.db_tools.exceptions import ConnectionLimitError
+
+
+def test_thread_reacquires_own_connection():
+    pool = ConnectionPool(Mock, validator=None, thread_affinity=True)
+
+    with pool.connect() as first:
+        pass
+    with pool.connect() as second:
+        pass
+
+    assert first is second
+    assert pool._slots == {threading.get_ident(): first}
+    assert pool._pool.qsize() == 0
+
+
+def test_parked_connection_stolen_at_limit():
+    pool = ConnectionPool(
+        Mock, validator=None, limit=1, timeout=0.01, thread_affinity=True,
+    )
+    with pool.connect() as parked:
+        pass
+
+    stolen = []
+    thread = threading.Thread(target=lambda: stolen.append(pool.getconn()))
+    thread.start()
+    thread.join()
+
+    assert stolen == [parked]
+    assert pool.connections_created == 1
+    with pytest.raises(ConnectionLimitError):
+        pool.getconn()
+
+
+def test_waiter_woken_by_release():
+    pool = ConnectionPool(
+        Mock, validator=None, limit=1, timeout=5, thread_affinity=True,
+    )
+    conn = pool.getconn()
+    received = []
+    waiter = threading.Thread(target=lambda: received.append(pool.getconn()))
+    waiter.start()
+    while not pool._waiters:
+        pass
+
+    pool.release(conn)
+    waiter.join()
+
+    assert received == [conn]
@@ -0,0 +1,124 @@
+from unittest.mock import Mock
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from classic.db_tools import ConnectionPool
+from classic.db_tools.exceptions import DeadlineExpired
+from classic.db_tools.poolvalidators import SQLiteConnectionValidator
+
+
+def wait_for_waiters(pool: ConnectionPool, count: int) -> None:
+    while len(pool._waiters) < count:
+        time.sleep(0.001)
+
+
+def test_expired_deadline_rejected():
+    factory = Mock()
+    pool = ConnectionPool(factory, validator=None)
+
+    with pytest.raises(DeadlineExpired):
+        pool.getconn(deadline=time.monotonic() - 1)
+
+    factory.assert_not_called()
+
+
+def test_waiters_served_by_priority():
+    pool = ConnectionPool(Mock, validator=None, limit=1)
+    conn = pool.getconn()
+    served = []
+
+    def wait(name, priority):
+        served.append((name, pool.getconn(priority=priority)))
+        pool.release(served[-1][1])
+
+    batch = threading.Thread(target=wait, args=('batch', 10))
+    batch.start()
+    wait_for_waiters(pool, 1)
+    urgent = threading.Thread(target=wait, args=('urgent', 0))
+    urgent.start()
+    wait_for_waiters(pool, 2)
+
+    pool.release(conn)
+    batch.join()
+    urgent.join()
+
+    assert served == [('urgent', conn), ('batch', conn)]
+
+
+def test_discarded_connection_frees_capacity():
+    validator = Mock(SQLiteConnectionValidator)
+    validator.before_release.return_value = False
+    pool = ConnectionPool(Mock, validator=validator, limit=1)
+    conn = pool.getconn()
+    received = []
+    waiter = threading.Thread(target=lambda: received.append(pool.getconn()))
+    waiter.start()
+    wait_for_waiters(pool, 1)
+
+    pool.release(conn)
+    waiter.join()
+
+    assert len(received) == 1 and received[0] is not conn
+
+
+def test_remaining_budget_applied_as_statement_timeout():
+    pool = ConnectionPool(
+        lambda: sqlite3.connect(':memory:'),
+        validator=SQLiteConnectionValidator(),
+    )
+    endless = (
+        'WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) '
+        'SELECT count(*) FROM n'
+    )
+
+    with pool.connect(deadline=time.monotonic() + 0.05) as conn:
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute(endless)
+
+    with pool.connect() as conn:
+        assert conn.execute('SELECT 1').fetchone() == (1,)
+        assert not pool._timed
+
+
+def test_statement_timeout_applied_without_validator():
+    pool = ConnectionPool(lambda: sqlite3.connect(':memory:'), validator=None)
+    endless = (
+        'WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) '
+        'SELECT count(*) FROM n'
+    )
+
+    with pool.connect(deadline=time.monotonic() + 0.05) as conn:
+        conn.execute('CREATE TABLE t (id INTEGER)')
+        conn.execute('INSERT INTO t VALUES (1)')
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute(endless)
+
+    with pool.connect() as conn:
+        assert conn.execute('SELECT count(*) FROM t').fetchone() == (0,)
+        assert not pool._timed
+    assert pool.validate is None
+
+
+def test_psycopg_timeout_leaves_connection_idle():
+    from classic.db_tools.poolvalidators import Psycopg3ConnectionValidator
+
+    log = []
+    conn = Mock(autocommit=False)
+    conn.cursor.return_value.execute.side_effect = log.append
+    conn.commit.side_effect = lambda: log.append('COMMIT')
+    validator = Psycopg3ConnectionValidator()
+    validator.validate = lambda conn: True
+    validator.before_release = lambda conn: log.append('ROLLBACK') or True
+    pool = ConnectionPool(lambda: conn, validator=validator)
+
+    pool.getconn(deadline=time.monotonic() + 1.5)
+    assert log[-1] == 'COMMIT'
+    pool.release(conn)
+
+    assert log[0].startswith('SET statement_timeout = ')
+    assert log[1:] == [
+        'COMMIT', 'ROLLBACK', 'SET statement_timeout TO DEFAULT', 'COMMIT',
+    ]
@@ -0,0 +1,47 @@
+from unittest.mock import Mock
+import os
+
+import pytest
+
+from classic.db_tools import ConnectionPool
+from classic.db_tools import pool as pool_module
+
+
+def test_pid_change_resets_pool():
+    pool = ConnectionPool(Mock, validator=None, limit=2, prewarm=1)
+    with pool.connect() as inherited:
+        pass
+    pool._pid = -1
+
+    conn = pool.getconn()
+
+    assert conn is not inherited
+    assert pool.connections_created == 1
+    assert pool._pool.qsize() == 0
+    inherited.close.assert_not_called()
+    assert inherited in pool_module._abandoned
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='requires os.fork')
+def test_child_after_fork():
+    pool = ConnectionPool(Mock, validator=None, prewarm=2)
+    with pool.connect() as inherited:
+        pass
+
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        ok = (
+            pool._pool.qsize() == 2
+            and pool.connections_created == 2
+            and pool.getconn() is not inherited
+        )
+        os.write(write, b'1' if ok else b'0')
+        os._exit(0)
+
+    os.close(write)
+    result = os.read(read, 1)
+    os.close(read)
+    os.waitpid(pid, 0)
+    assert result == b'1'
+    assert pool.getconn() is inherited
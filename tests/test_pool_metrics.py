@@ -0,0 +1,79 @@
+from unittest.mock import Mock
+import time
+
+import pytest
+
+from classic.db_tools import ConnectionPool
+from classic.db_tools.exceptions import ConnectionLimitError
+from classic.db_tools.poolvalidators import ConnectionValidator
+
+
+def test_metrics_disabled_by_default():
+    pool = ConnectionPool(Mock, validator=None)
+
+    with pool.connect():
+        pass
+
+    assert pool.metrics is None
+    with pytest.raises(RuntimeError):
+        pool.stats()
+
+
+def test_checkouts_and_gauges():
+    pool = ConnectionPool(Mock, validator=None, metrics=True)
+
+    with pool.connect():
+        with pool.connect():
+            stats = pool.stats()
+            assert stats['in_use'] == 2
+            assert stats['idle'] == 0
+
+    stats = pool.stats()
+    assert stats['checkouts'] == 2
+    assert stats['in_use'] == 0
+    assert stats['idle'] == 2
+    assert stats['wait_time']['count'] == 2
+    assert stats['hold_time']['count'] == 2
+
+
+def test_timeouts_counted():
+    pool = ConnectionPool(
+        Mock, timeout=0.01, limit=1, validator=None, metrics=True,
+    )
+
+    with pool.connect():
+        with pytest.raises(ConnectionLimitError):
+            pool.getconn()
+
+    assert pool.stats()['timeouts'] == 1
+
+
+def test_validation_failures_and_recycles():
+    validator = Mock(ConnectionValidator)
+    validator.validate.side_effect = [False, True]
+    validator.before_release.side_effect = [False, True]
+    pool = ConnectionPool(Mock, validator=validator, metrics=True)
+
+    with pool.connect():
+        pass
+
+    stats = pool.stats()
+    assert stats['validation_failures'] == 1
+    assert stats['recycles'] == 1
+    assert stats['connections_created'] == 2
+    assert stats['in_use'] == 0
+
+
+def test_leaks_reported():
+    pool = ConnectionPool(Mock, validator=None, leak_threshold=0.01)
+
+    leaked = pool.getconn()
+    with pool.connect():
+        time.sleep(0.02)
+        leaks = pool.check_leaks()
+
+    assert [checkout.conn_id for checkout in leaks[:1]] == [id(leaked)]
+    assert 'test_leaks_reported' in leaks[0].format_stack()
+
+    pool.release(leaked)
+    assert pool.check_leaks() == []
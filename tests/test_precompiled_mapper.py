@@ -0,0 +1,59 @@
+from unittest.mock import Mock
+
+import pytest
+
+from classic.db_tools import Engine, ConnectionPool, OneToMany
+from classic.db_tools.types import Cursor
+
+from .conftest import SQL_DIR_PATH
+from .dto import Task, Status
+
+
+sql = '''
+    SELECT
+        tasks.id            AS Task__id,
+        tasks.name          AS Task__name,
+        task_status.id      AS Status__id,
+        task_status.title   AS Status__title
+    FROM tasks
+    JOIN task_status ON task_status.task_id = tasks.id
+'''
+
+
+@pytest.fixture
+def engine():
+    return Engine(SQL_DIR_PATH, ConnectionPool(Mock()))
+
+
+def cursor_with(*columns: str) -> Cursor:
+    cursor = Mock(Cursor)
+    cursor.description = [(column, 0, 0, 0, 0, True) for column in columns]
+    return cursor
+
+
+def test_columns_inferred_from_static_query(engine: Engine):
+    query = engine.query(sql, static=True).return_as(
+        Task, OneToMany(Task, 'statuses', Status), columns=True,
+    )
+    cursor = cursor_with(
+        'task__id', 'task__name', 'status__id', 'status__title',
+    )
+
+    assert query._mapper is not None
+    assert query.mapper(cursor) is query._mapper
+
+
+def test_mismatched_description_falls_back(engine: Engine):
+    query = engine.query(sql, static=True).return_as(
+        Task, columns=('task__id', 'task__name'),
+    )
+
+    mapper = query.mapper(cursor_with('task__name', 'task__id'))
+
+    assert mapper is not query._mapper
+    assert list(mapper([('First', 1)])) == [Task(id=1, name='First')]
+
+
+def test_columns_not_inferred_for_dynamic_query(engine: Engine):
+    with pytest.raises(ValueError):
+        engine.query(sql, static=False).return_as(Task, columns=True)
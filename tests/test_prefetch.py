@@ -0,0 +1,63 @@
+import sqlite3
+import threading
+
+import pytest
+
+from classic.db_tools.engine import fetch_batches
+from classic.db_tools.prefetch import prefetch_batches
+
+
+def fetcher(batches):
+    iterator = iter(batches)
+    return lambda: next(iterator, [])
+
+
+def test_batches_in_order():
+    batches = [[(1,), (2,)], [(3,)], [(4,), (5,)]]
+
+    assert list(prefetch_batches(fetcher(batches), 2)) == batches
+
+
+def test_error_is_raised_in_consumer():
+    def fetch():
+        raise ValueError
+
+    with pytest.raises(ValueError):
+        list(prefetch_batches(fetch))
+
+
+def test_close_stops_worker():
+    threads = threading.active_count()
+    batches = prefetch_batches(lambda: [(1,)], 1)
+
+    assert next(batches) == [(1,)]
+    batches.close()
+
+    assert threading.active_count() == threads
+
+
+@pytest.mark.parametrize('check_same_thread', [True, False])
+def test_thread_bound_sqlite_fetched_in_caller(check_same_thread):
+    conn = sqlite3.connect(':memory:', check_same_thread=check_same_thread)
+    threads = []
+
+    def fetch():
+        threads.append(threading.current_thread())
+        return [(1,)] if len(threads) == 1 else []
+
+    assert list(prefetch_batches(fetch, 1, conn)) == [[(1,)]]
+
+    in_caller = {thread is threading.current_thread() for thread in threads}
+    assert in_caller == {check_same_thread}
+
+
+def test_prefetch_falls_back_for_thread_bound_sqlite():
+    conn = sqlite3.connect(':memory:')
+    cursor = conn.execute(
+        'WITH RECURSIVE n(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM n '
+        'WHERE x < 5) SELECT x FROM n'
+    )
+
+    batches = list(fetch_batches(cursor, 2, prefetch=2))
+
+    assert batches == [[(1,), (2,)], [(3,), (4,)], [(5,)]]
@@ -0,0 +1,64 @@
+from unittest.mock import Mock
+import sqlite3
+
+from classic.db_tools import ConnectionPool
+from classic.db_tools.poolvalidators import (
+    ConnectionValidator, SQLiteConnectionValidator,
+)
+
+
+def test_idle_connection_not_rolled_back():
+    validator = ConnectionValidator()
+    validator.in_transaction = Mock(return_value=False)
+    conn = Mock()
+
+    assert validator.before_release(conn)
+
+    conn.rollback.assert_not_called()
+    conn.cursor.assert_not_called()
+
+
+def test_unknown_status_rolled_back_without_validation():
+    conn = Mock()
+
+    assert ConnectionValidator().before_release(conn)
+
+    conn.rollback.assert_called_once()
+    conn.cursor.assert_not_called()
+
+
+def test_sqlite_transaction_status():
+    validator = SQLiteConnectionValidator()
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE t (a int)')
+
+    conn.execute('INSERT INTO t VALUES (1)')
+    assert validator.in_transaction(conn)
+    validator.before_release(conn)
+    assert not validator.in_transaction(conn)
+
+
+def test_validation_deferred_by_interval():
+    validator = ConnectionValidator()
+    validator.validate = Mock(return_value=True)
+    pool = ConnectionPool(Mock, validator=validator, validate_interval=60)
+
+    for _ in range(3):
+        with pool.connect():
+            pass
+
+    # Только новое соединение
+    assert validator.validate.call_count == 1
+
+
+def test_validate_idle_discards_broken():
+    validator = ConnectionValidator()
+    pool = ConnectionPool(Mock, validator=validator, validate_interval=60)
+    with pool.connect() as broken:
+        with pool.connect():
+            pass
+    broken.cursor.side_effect = RuntimeError
+
+    assert pool.validate_idle() == 1
+    broken.close.assert_called_once()
+    assert pool._pool.qsize() == 1
@@ -0,0 +1,120 @@
+from unittest.mock import Mock
+
+import pytest
+
+from classic.components import component
+from classic.db_tools import ConnectionPool, Engine, in_transaction
+
+from .conftest import SQL_DIR_PATH
+
+
+def make_pool():
+    def connect():
+        conn = Mock()
+        conn.autocommit = False
+        return conn
+    return ConnectionPool(connect, validator=None)
+
+
+@pytest.fixture
+def engine():
+    return Engine(
+        SQL_DIR_PATH, make_pool(),
+        replicas=[make_pool(), make_pool()],
+        readonly_dirs=['example'],
+    )
+
+
+def primary_cursor(engine: Engine):
+    return engine.conn.__wrapped__.cursor.return_value
+
+
+def replica_cursor(engine: Engine):
+    return engine.routing.conn.cursor.return_value
+
+
+def test_readonly_marking(engine: Engine):
+    assert engine.query('SELECT 1', readonly=True).readonly
+    assert engine.query('-- readonly\nSELECT 1').readonly
+    assert engine.query('/* READONLY */ SELECT 1', static=True).readonly
+    assert not engine.query('UPDATE t SET a = 1').readonly
+    assert engine.query_from('example/get_all.sql').readonly
+    assert not engine.query_from('test_render.sql').readonly
+
+
+def test_reads_routed_to_replicas(engine: Engine):
+    select = engine.query('SELECT 1', static=True, readonly=True)
+    update = engine.query('UPDATE t SET a = 1', static=True)
+
+    used = set()
+    for _ in range(2):
+        with engine:
+            select.execute()
+            update.execute()
+            assert replica_cursor(engine).execute.call_args.args[0] == (
+                'SELECT 1'
+            )
+            assert primary_cursor(engine).execute.call_args.args[0] == (
+                'UPDATE t SET a = 1'
+            )
+            used.add(engine.routing.index)
+
+    assert used == {0, 1}
+    assert engine.replicas.outstanding == [0, 0]
+    assert engine.routing.conn is None
+
+
+def test_reads_after_write_stay_on_primary(engine: Engine):
+    select = engine.query('SELECT 1', static=True, readonly=True)
+    insert = engine.query('INSERT INTO t VALUES (1)', static=True)
+
+    with engine:
+        insert.execute()
+        select.execute()
+        with engine.transaction(readonly=True):
+            select.execute()
+        assert engine.routing.conn is None
+        assert primary_cursor(engine).execute.call_count == 3
+
+    with engine:
+        select.execute()
+        assert engine.routing.conn is not None
+
+
+def test_least_outstanding_replica_chosen(engine: Engine):
+    engine.replicas.outstanding[0] = 3
+
+    assert engine.replicas.choose() == 1
+    assert engine.replicas.choose() == 1
+
+
+def test_write_transaction_reads_from_primary(engine: Engine):
+    select = engine.query('SELECT 1', static=True, readonly=True)
+
+    with engine:
+        with engine.transaction():
+            select.execute()
+            with engine.transaction(readonly=True):
+                select.execute()
+
+        assert primary_cursor(engine).execute.call_count == 2
+        assert engine.routing.conn is None
+
+
+@component
+class Service:
+    db: Engine
+
+    @in_transaction(readonly=True)
+    def read(self):
+        self.db.query('SELECT 1', static=True).execute()
+        return self.db.routing.conn
+
+
+def test_readonly_transaction_on_replica(engine: Engine):
+    with engine:
+        conn = Service(db=engine).read()
+        conn.cursor.return_value.execute.assert_called_once()
+        primary_cursor(engine).execute.assert_not_called()
+
+    conn.commit.assert_called_once()
@@ -0,0 +1,84 @@
+from operator import itemgetter
+from unittest.mock import Mock
+
+import pytest
+
+from classic.db_tools import ConnectionPool, ShardedEngine
+
+from .conftest import SQL_DIR_PATH
+
+
+def make_pool(rows):
+    def connect():
+        conn = Mock()
+        conn.autocommit = False
+        conn.cursor.return_value.fetchall.return_value = rows
+        return conn
+    return ConnectionPool(connect, validator=None)
+
+
+@pytest.fixture
+def sharded():
+    pools = {
+        'even': make_pool([(2, 'b'), (4, 'd')]),
+        'odd': make_pool([(1, 'a'), (3, 'c')]),
+    }
+    with ShardedEngine(
+        SQL_DIR_PATH, pools,
+        shard_key=lambda params: 'odd' if params['tenant'] % 2 else 'even',
+    ) as sharded:
+        yield sharded
+
+
+def test_caches_shared(sharded: ShardedEngine):
+    even, odd = sharded.shard('even'), sharded.shard('odd')
+
+    assert even.static_templates is odd.static_templates
+    assert even.dynamic_templates is odd.dynamic_templates
+    assert even.mapper_cache is odd.mapper_cache
+    assert even.pool is not odd.pool
+
+
+def test_execution_state_not_shared(sharded: ShardedEngine):
+    even, odd = sharded.shard('even'), sharded.shard('odd')
+
+    assert vars(even).keys() == vars(odd).keys()
+    for name in ('conn', 'routing', 'flights', 'loaders'):
+        assert getattr(even, name) is not getattr(odd, name)
+
+
+def test_routed_by_shard_key(sharded: ShardedEngine):
+    query = sharded.query('SELECT * FROM t', static=True)
+
+    assert query.all(tenant=3) == [(1, 'a'), (3, 'c')]
+    assert query.all(tenant=2) == [(2, 'b'), (4, 'd')]
+    with pytest.raises(ValueError):
+        sharded.shard('missing')
+
+
+def test_open_shard_scope_reused(sharded: ShardedEngine):
+    query = sharded.query('SELECT * FROM t', static=True)
+
+    with sharded.engine_for({'tenant': 1}) as engine:
+        query.execute(tenant=1)
+        engine.conn.__wrapped__.cursor.return_value.execute.assert_called_once()
+
+
+def test_execute_requires_open_shard_scope(sharded: ShardedEngine):
+    query = sharded.query('SELECT * FROM t', static=True)
+
+    with pytest.raises(AttributeError):
+        query.execute(tenant=1)
+
+    with sharded.engine_for({'tenant': 1}):
+        assert query.execute(tenant=1).fetchall() == [(1, 'a'), (3, 'c')]
+
+
+def test_gather_merges_sorted_results(sharded: ShardedEngine):
+    query = sharded.query('SELECT * FROM t ORDER BY id', static=True)
+
+    assert query.gather() == [(2, 'b'), (4, 'd'), (1, 'a'), (3, 'c')]
+    assert query.gather(_key=itemgetter(0)) == [
+        (1, 'a'), (2, 'b'), (3, 'c'), (4, 'd'),
+    ]
+    assert query.each(_method='rowcount').keys() == {'even', 'odd'}
@@ -0,0 +1,161 @@
+from unittest.mock import Mock
+import threading
+import time
+
+import pytest
+
+from classic.db_tools import ConnectionPool, Engine
+
+from .conftest import SQL_DIR_PATH
+
+THREADS = 8
+
+
+@pytest.fixture
+def executed():
+    return []
+
+
+@pytest.fixture
+def engine(executed):
+    def connect():
+        conn = Mock()
+        conn.autocommit = False
+        cursor = conn.cursor.return_value
+
+        def execute(sql, params):
+            executed.append(params)
+            time.sleep(0.05)
+
+        cursor.execute.side_effect = execute
+        cursor.fetchall.return_value = [(1, 'name')]
+        return conn
+
+    return Engine(
+        SQL_DIR_PATH, ConnectionPool(connect, validator=None),
+        single_flight=True,
+    )
+
+
+def run_concurrently(engine: Engine, func) -> list:
+    results = [None] * THREADS
+    barrier = threading.Barrier(THREADS)
+
+    def work(index):
+        with engine:
+            barrier.wait()
+            results[index] = func()
+
+    threads = [
+        threading.Thread(target=work, args=(index,))
+        for index in range(THREADS)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_identical_reads_share_execution(engine: Engine, executed):
+    query = engine.query('SELECT * FROM t WHERE id = :id', static=True)
+
+    results = run_concurrently(engine, lambda: query.all(id=1))
+
+    assert executed == [{'id': 1}]
+    assert all(result == [(1, 'name')] for result in results)
+    assert len({id(result) for result in results}) == THREADS
+    assert engine.flights.shared == THREADS - 1
+
+
+def test_disabled_per_call(engine: Engine, executed):
+    query = engine.query('SELECT * FROM t WHERE id = :id', static=True)
+
+    run_concurrently(engine, lambda: query.all(id=1, _single_flight=False))
+
+    assert len(executed) == THREADS
+
+
+class Task:
+
+    def __init__(self, id, name):
+        self.id, self.name = id, name
+
+
+def test_mapped_results_copied(engine: Engine):
+    query = engine.query('SELECT', static=True).return_as(Task)
+    mapped = Mock(side_effect=lambda *args: (
+        time.sleep(0.05) or iter([Task(1, 'name')])
+    ))
+    query._iter = mapped
+
+    results = run_concurrently(engine, lambda: query.all(id=1, _copy=True))
+
+    mapped.assert_called_once()
+    objects = [result[0] for result in results]
+    assert len({id(obj) for obj in objects}) == THREADS
+    assert {obj.name for obj in objects} == {'name'}
+
+
+def test_pinned_writer_not_coalesced(engine: Engine, executed):
+    insert = engine.query('INSERT INTO t VALUES (1)', static=True)
+    query = engine.query('SELECT * FROM t WHERE id = :id', static=True)
+    barrier = threading.Barrier(2)
+    pinned = []
+
+    def work(write):
+        with engine:
+            if write:
+                insert.execute()
+            pinned.append(engine.routing.pinned)
+            barrier.wait(1)
+            query.all(id=1)
+
+    threads = [
+        threading.Thread(target=work, args=(write,))
+        for write in (True, False)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Писатель видит свои изменения только через свое соединение
+    assert sorted(pinned) == [False, True]
+    assert executed.count({'id': 1}) == 2
+    assert engine.flights.shared == 0
+
+
+def test_engines_on_other_pools_not_coalesced(engine: Engine):
+    def pool(value):
+        def connect():
+            conn = Mock()
+            conn.autocommit = False
+            cursor = conn.cursor.return_value
+            cursor.execute.side_effect = lambda *args: time.sleep(0.05)
+            cursor.fetchall.return_value = [(value,)]
+            return conn
+
+        return ConnectionPool(connect, validator=None)
+
+    shards = {
+        'a': engine.with_pool(pool('A')),
+        'b': engine.with_pool(pool('B')),
+    }
+    results = {}
+    barrier = threading.Barrier(len(shards))
+
+    def work(name):
+        shard = shards[name]
+        query = shard.query('SELECT * FROM t WHERE x = :x', static=True)
+        with shard:
+            barrier.wait()
+            results[name] = query.all(x=1)
+
+    threads = [threading.Thread(target=work, args=(name,)) for name in shards]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == {'a': [('A',)], 'b': [('B',)]}
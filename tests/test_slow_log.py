@@ -0,0 +1,143 @@
+from io import StringIO
+from unittest.mock import Mock
+import json
+import threading
+
+import pytest
+
+from classic.db_tools import Engine, ConnectionPool
+from classic.db_tools.instrumentation import QueryEvent
+from classic.db_tools.slow_log import SlowQueryLog, redact_keys
+
+from .conftest import SQL_DIR_PATH
+
+
+@pytest.fixture
+def engine():
+    return Engine(SQL_DIR_PATH, ConnectionPool(Mock()))
+
+
+def event(total_time: float, sql: str = 'SELECT 1', params=None):
+    return QueryEvent(
+        'template', 'all', sql=sql, params=params, execute_time=total_time,
+    )
+
+
+def plan_pool(plan):
+    conn = Mock()
+    conn.cursor.return_value.fetchall.return_value = plan
+    pool = Mock(ConnectionPool)
+    pool.getconn.return_value = conn
+    return pool, conn
+
+
+def test_only_slow_queries_recorded():
+    slow_log = SlowQueryLog(0.5, capacity=2)
+
+    for total_time in (0.1, 0.6, 0.7, 0.8):
+        slow_log(event(total_time))
+
+    assert [record.total_time for record in slow_log.snapshot()] == [0.7, 0.8]
+
+
+def test_params_redacted():
+    slow_log = SlowQueryLog(0, redact=redact_keys('password'))
+
+    slow_log(event(1, params={'login': 'user', 'password': 'secret'}))
+
+    assert slow_log.snapshot()[0].params == {
+        'login': 'user', 'password': '***',
+    }
+
+
+def test_plan_captured_and_rate_limited():
+    pool, conn = plan_pool([('Seq Scan on tasks',)])
+    slow_log = SlowQueryLog(0, pool=pool, analyze=True)
+
+    slow_log(event(1, params={'id': 1}))
+    slow_log(event(1))
+    slow_log.wait_plans()
+
+    first, second = slow_log.snapshot()
+    assert first.plan == ['Seq Scan on tasks']
+    assert second.plan is None
+    conn.cursor.return_value.execute.assert_called_once_with(
+        'EXPLAIN ANALYZE SELECT 1', {'id': 1},
+    )
+    conn.rollback.assert_called_once()
+    pool.release.assert_called_once_with(conn)
+
+
+def test_analyze_only_for_reading_queries():
+    pool, conn = plan_pool([])
+    slow_log = SlowQueryLog(0, pool=pool, analyze=True)
+
+    slow_log(event(1, sql='DELETE FROM tasks'))
+    slow_log.wait_plans()
+
+    conn.cursor.return_value.execute.assert_called_once_with(
+        'EXPLAIN DELETE FROM tasks', None,
+    )
+
+
+def test_enabled_on_engine(engine: Engine):
+    slow_log = engine.enable_slow_query_log(0)
+    cursor = Mock()
+    cursor.fetchall.return_value = [(1,)]
+
+    engine.query('SELECT 1', static=True).all(cursor=cursor)
+
+    output = StringIO()
+    slow_log.dump(output)
+    record = json.loads(output.getvalue())
+    assert record['template'] == 'SELECT 1'
+    assert record['rows'] == 1
+
+
+def test_plan_checkout_does_not_block_caller():
+    pool, conn = plan_pool([('Seq Scan on tasks',)])
+    checkout = threading.Event()
+    release = threading.Event()
+
+    def getconn(**kwargs):
+        checkout.set()
+        release.wait(1)
+        return conn
+
+    pool.getconn.side_effect = getconn
+    slow_log = SlowQueryLog(
+        0, pool=pool, explain_checkout_timeout=0.01, explain_priority=7,
+    )
+
+    slow_log(event(1))
+
+    assert checkout.wait(1)
+    record = slow_log.snapshot()[0]
+    assert record.plan is None
+    release.set()
+    slow_log.wait_plans()
+    assert record.plan == ['Seq Scan on tasks']
+    pool.getconn.assert_called_once_with(priority=7, timeout=0.01)
+
+
+def test_plan_skipped_without_free_connection():
+    pool = ConnectionPool(Mock, limit=1, validator=None)
+    slow_log = SlowQueryLog(0, pool=pool, explain_checkout_timeout=0.01)
+    held = pool.getconn()
+
+    slow_log(event(1))
+    slow_log.wait_plans()
+
+    record = slow_log.snapshot()[0]
+    assert record.plan is None
+    assert record.plan_error.startswith('Skipped: no free connection')
+    assert held.cursor.call_count == 0
+
+    pool.release(held)
+    slow_log(event(1))
+    slow_log.wait_plans()
+
+    # Пропущенный план не откладывает следующий на explain_interval
+    held.cursor.return_value.execute.assert_called_once_with(
+        'EXPLAIN SELECT 1', None,
+    )
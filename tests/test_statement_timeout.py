@@ -0,0 +1,175 @@
+import os
+import select
+import signal
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from classic.db_tools import ConnectionPool, Engine
+from classic.db_tools.exceptions import StatementTimeoutError
+from classic.db_tools.poolvalidators import SQLiteConnectionValidator
+from classic.db_tools.timeouts import WATCHDOG, Watchdog
+
+from .conftest import SQL_DIR_PATH
+
+ENDLESS = (
+    'WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) '
+    'SELECT count(*) FROM n'
+)
+
+
+class Connection(sqlite3.Connection):
+    autocommit = False
+
+
+@pytest.fixture
+def engine(tmp_path):
+    path = tmp_path / 'timeouts.db'
+    pool = ConnectionPool(lambda: sqlite3.connect(path, factory=Connection))
+    engine = Engine(SQL_DIR_PATH, pool)
+    with engine:
+        engine.query('CREATE TABLE t (a int)', static=True).execute()
+    return engine
+
+
+def test_runaway_query_cancelled(engine: Engine):
+    query = engine.query(ENDLESS, static=True)
+
+    with engine:
+        engine.query('INSERT INTO t VALUES (1)', static=True).execute()
+        with pytest.raises(StatementTimeoutError) as info:
+            query.all(_timeout=0.05)
+        assert isinstance(info.value.__cause__, sqlite3.OperationalError)
+
+        # Транзакция откачена, соединение пригодно для работы
+        assert engine.query('SELECT count(*) FROM t', static=True).scalar(
+            _timeout=1,
+        ) == 0
+
+
+def test_engine_default_timeout(engine: Engine):
+    engine.statement_timeout = 0.05
+
+    with engine:
+        with pytest.raises(StatementTimeoutError):
+            engine.query(ENDLESS, static=True).one()
+
+
+def test_stopped_watch_never_fires():
+    watchdog = Watchdog()
+    fired = []
+
+    watch = watchdog.watch(0.01, lambda: fired.append(True))
+    assert watchdog.stop(watch) is False
+    expired = watchdog.watch(0, lambda: fired.append(True))
+    time.sleep(0.05)
+
+    assert watchdog.stop(expired) is True
+    assert fired == [True]
+
+
+def test_iterator_timeout_does_not_outlive_fetches(engine: Engine):
+    with engine:
+        engine.query('INSERT INTO t VALUES (1), (2)', static=True).execute()
+        rows = engine.query('SELECT a FROM t', static=True).iter(
+            _batch=1, _timeout=0.05,
+        )
+        assert next(rows) == (1,)
+        time.sleep(0.1)
+
+        assert engine.query(
+            'SELECT count(*) FROM (SELECT 1 FROM t, t, t, t, t, t)',
+            static=True,
+        ).scalar() == 64
+        assert list(rows) == [(2,)]
+
+
+def test_statement_limit_keeps_checkout_deadline():
+    validator = SQLiteConnectionValidator()
+    conn = sqlite3.connect(':memory:')
+    validator.set_statement_timeout(conn, 0.05)
+
+    validator.unlimit_statement(conn, validator.limit_statement(conn, 10))
+
+    with pytest.raises(sqlite3.OperationalError):
+        conn.execute(ENDLESS)
+    validator.reset_statement_timeout(conn)
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='requires os.fork')
+def test_watchdog_usable_in_child_after_fork():
+    WATCHDOG.stop(WATCHDOG.watch(10, lambda: None))
+    held, done = threading.Event(), threading.Event()
+
+    def hold():
+        # Блокировка занята другим потоком родителя в момент fork
+        with WATCHDOG.condition:
+            held.set()
+            done.wait()
+
+    holder = threading.Thread(target=hold)
+    holder.start()
+    held.wait()
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        fired = threading.Event()
+        WATCHDOG.watch(0, fired.set)
+        os.write(write, b'1' if fired.wait(1) else b'0')
+        os._exit(0)
+
+    done.set()
+    holder.join()
+    os.close(write)
+    ready, _, _ = select.select([read], [], [], 5)
+    result = os.read(read, 1) if ready else b''
+    os.close(read)
+    if not ready:
+        os.kill(pid, signal.SIGKILL)
+    os.waitpid(pid, 0)
+    assert result == b'1'
+
+
+class BareCursor:
+    """Курсор без необязательного атрибута connection"""
+
+    def __init__(self, cursor: sqlite3.Cursor):
+        self._cursor = cursor
+
+    def __getattr__(self, name):
+        if name == 'connection':
+            raise AttributeError(name)
+        return getattr(self._cursor, name)
+
+
+class BareConnection(Connection):
+
+    def cursor(self, *args, **kwargs):
+        return BareCursor(super().cursor(*args, **kwargs))
+
+
+def test_guard_takes_connection_from_scope():
+    pool = ConnectionPool(
+        lambda: sqlite3.connect(':memory:', factory=BareConnection),
+    )
+    engine = Engine(SQL_DIR_PATH, pool)
+
+    with engine:
+        with pytest.raises(StatementTimeoutError):
+            engine.query(ENDLESS, static=True).all(_timeout=0.05)
+
+
+def test_discarded_connection_deadline_dropped():
+    pool = ConnectionPool(
+        lambda: sqlite3.connect(':memory:'),
+        validator=SQLiteConnectionValidator(),
+    )
+    conn = pool.getconn(deadline=time.monotonic() + 10)
+    assert id(conn) in SQLiteConnectionValidator._deadlines
+
+    conn.close()
+    pool.release(conn)
+
+    assert id(conn) not in SQLiteConnectionValidator._deadlines
@@ -0,0 +1,86 @@
+from unittest.mock import Mock
+import sqlite3
+
+import pytest
+
+from classic.db_tools import Engine, ConnectionPool
+from classic.db_tools.values_batch import multi_row_sql, parse_values
+
+from .conftest import SQL_DIR_PATH
+
+
+@pytest.fixture
+def engine():
+    return Engine(SQL_DIR_PATH, ConnectionPool(Mock()))
+
+
+@pytest.mark.parametrize('sql, expected', [
+    (
+        "INSERT INTO t VALUES (?, 'a?')",
+        "INSERT INTO t VALUES (?, 'a?'), (?, 'a?')",
+    ),
+    (
+        'INSERT INTO t VALUES (%(a)s, %(b)s::int)',
+        'INSERT INTO t VALUES (%(a_r0)s, %(b_r0)s::int), '
+        '(%(a_r1)s, %(b_r1)s::int)',
+    ),
+    (
+        'INSERT INTO t VALUES ($1, lower($2)) RETURNING id',
+        'INSERT INTO t VALUES ($1, lower($2)), ($3, lower($4)) RETURNING id',
+    ),
+])
+def test_multi_row_sql(sql, expected):
+    assert multi_row_sql(sql, 2) == expected
+
+
+def test_parameters_outside_values_rejected():
+    with pytest.raises(ValueError):
+        parse_values('INSERT INTO t VALUES (?) ON CONFLICT DO UPDATE SET a = ?')
+
+
+def test_named_params_renamed_per_row():
+    template = parse_values('INSERT INTO t VALUES (:a, :b)')
+
+    assert template.params([{'a': 1, 'b': 2}, {'a': 3, 'b': 4}]) == {
+        'a_r0': 1, 'b_r0': 2, 'a_r1': 3, 'b_r1': 4,
+    }
+
+
+def test_batches_limited_by_params(engine: Engine):
+    cursor = Mock()
+    cursor.rowcount = 2
+    query = engine.query('INSERT INTO t VALUES (?, ?)', static=True)
+
+    rowcount = query.insert_many(
+        ((index, index) for index in range(5)), cursor, max_params=4,
+    )
+
+    assert [args.args for args in cursor.execute.call_args_list] == [
+        ('INSERT INTO t VALUES (?, ?), (?, ?)', [0, 0, 1, 1]),
+        ('INSERT INTO t VALUES (?, ?), (?, ?)', [2, 2, 3, 3]),
+        ('INSERT INTO t VALUES (?, ?)', [4, 4]),
+    ]
+    assert rowcount == 6
+
+
+def test_returning_concatenated(engine: Engine):
+    cursor = Mock()
+    cursor.fetchall.side_effect = [[(1,), (2,)], [(3,)]]
+    query = engine.query(
+        'INSERT INTO t VALUES (?) RETURNING id', static=True,
+    )
+
+    assert query.insert_many([(1,), (2,), (3,)], cursor, batch_size=2) == [
+        (1,), (2,), (3,),
+    ]
+
+
+def test_empty_dynamic_insert(engine: Engine):
+    cursor = sqlite3.connect(':memory:').cursor()
+    returning = engine.query(
+        'INSERT INTO t VALUES ({{ id }}) RETURNING id', static=False,
+    )
+    plain = engine.query('INSERT INTO t VALUES ({{ id }})', static=False)
+
+    assert returning.insert_many([], cursor) == []
+    assert plain.insert_many([], cursor) == 0
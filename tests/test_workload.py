@@ -0,0 +1,55 @@
+from unittest.mock import Mock
+
+import pytest
+
+from classic.db_tools import Engine, ConnectionPool
+from classic.db_tools.workload import Scenario, run_workload
+
+from .conftest import SQL_DIR_PATH
+
+
+@pytest.fixture
+def engine():
+    pool = ConnectionPool(Mock, validator=None, metrics=True)
+    return Engine(SQL_DIR_PATH, pool)
+
+
+def test_requests_distributed_by_weight(engine: Engine):
+    scenarios = [
+        Scenario('read', 'SELECT 1', weight=3, static=True),
+        Scenario('write', 'SELECT 2', weight=1, static=True, method='execute'),
+    ]
+
+    report = run_workload(
+        engine, scenarios, concurrency=4, duration=None, requests=400,
+        seed=1,
+    )
+
+    assert report.requests == 400
+    assert report.errors == 0
+    assert report.scenarios['read'].count > report.scenarios['write'].count
+    assert report.pool['checkouts'] == 400
+    assert report.scenarios['read'].latency['p99'] >= 0
+
+
+def test_errors_reported(engine: Engine):
+    def params(rng):
+        raise ValueError
+
+    report = run_workload(
+        engine,
+        [Scenario('broken', 'SELECT 1', params=params, static=True)],
+        concurrency=2, duration=None, requests=10,
+    )
+
+    assert report.error_rate == 1
+    assert report.scenarios['broken'].error_types == {'ValueError': 10}
+
+
+def test_rate_limited(engine: Engine):
+    report = run_workload(
+        engine, [Scenario('read', 'SELECT 1', static=True)],
+        concurrency=2, duration=None, requests=10, rate=100,
+    )
+
+    assert report.duration >= 0.09
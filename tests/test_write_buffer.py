@@ -0,0 +1,131 @@
+from unittest.mock import Mock
+import threading
+
+import pytest
+
+from classic.db_tools import Engine, ConnectionPool
+from classic.db_tools.exceptions import WriteBufferFull
+
+from .conftest import SQL_DIR_PATH
+
+
+@pytest.fixture
+def conn():
+    conn = Mock()
+    conn.autocommit = False
+    return conn
+
+
+@pytest.fixture
+def engine(conn):
+    return Engine(SQL_DIR_PATH, ConnectionPool(lambda: conn, validator=None))
+
+
+def test_writes_grouped_in_one_transaction(engine: Engine, conn):
+    insert = engine.query('INSERT INTO a VALUES (?)', static=True)
+    same = engine.query('INSERT INTO a VALUES (?)', static=True)
+    other = engine.query('INSERT INTO b VALUES (?)', static=True)
+
+    with engine.write_buffer(flush_interval=1) as buffer:
+        futures = [
+            buffer.submit(insert, (1,)),
+            buffer.submit(same, (2,)),
+            buffer.submit(other, (3,)),
+        ]
+        buffer.flush()
+
+    assert [future.result() for future in futures] == [None] * 3
+    executemany = conn.cursor.return_value.executemany
+    assert executemany.call_args_list[0].args == (
+        'INSERT INTO a VALUES (?)', [(1,), (2,)],
+    )
+    assert executemany.call_args_list[1].args == (
+        'INSERT INTO b VALUES (?)', [(3,)],
+    )
+    conn.commit.assert_called_once()
+
+
+def test_failed_write_isolated(engine: Engine, conn):
+    query = engine.query('INSERT INTO a VALUES (?)', static=True)
+
+    def executemany(sql, params):
+        if (0,) in params:
+            raise ValueError
+
+    conn.cursor.return_value.executemany.side_effect = executemany
+
+    with engine.write_buffer(flush_interval=1) as buffer:
+        good = buffer.submit(query, (1,))
+        bad = buffer.submit(query, (0,))
+        buffer.flush()
+
+    assert good.result() is None
+    assert isinstance(bad.exception(), ValueError)
+
+
+def test_backpressure(engine: Engine, conn):
+    query = engine.query('INSERT INTO a VALUES (?)', static=True)
+    started, release = threading.Event(), threading.Event()
+
+    def executemany(sql, params):
+        started.set()
+        release.wait()
+
+    conn.cursor.return_value.executemany.side_effect = executemany
+
+    with engine.write_buffer(
+        max_size=1, flush_interval=0, put_timeout=0.01,
+    ) as buffer:
+        buffer.submit(query, (1,))
+        started.wait()
+        buffer.submit(query, (2,))
+        with pytest.raises(WriteBufferFull):
+            buffer.submit(query, (3,))
+        release.set()
+
+
+def test_close_wakes_blocked_producer(engine: Engine, conn):
+    query = engine.query('INSERT INTO a VALUES (?)', static=True)
+    started, release = threading.Event(), threading.Event()
+
+    def executemany(sql, params):
+        started.set()
+        release.wait()
+
+    conn.cursor.return_value.executemany.side_effect = executemany
+    buffer = engine.write_buffer(max_size=1, flush_interval=0)
+    buffer.submit(query, (1,))
+    started.wait()
+    buffer.submit(query, (2,))
+    errors = []
+
+    def produce():
+        try:
+            buffer.submit(query, (3,))
+        except RuntimeError as error:
+            errors.append(error)
+
+    producer = threading.Thread(target=produce)
+    producer.start()
+    closer = threading.Thread(target=buffer.close)
+    closer.start()
+
+    # Писатель просыпается, пока фоновый поток еще занят записью
+    producer.join(1)
+    assert not producer.is_alive()
+    assert len(errors) == 1
+    release.set()
+    closer.join()
+
+
+def test_flush_after_close_returns(engine: Engine):
+    query = engine.query('INSERT INTO a VALUES (?)', static=True)
+    buffer = engine.write_buffer()
+    future = buffer.submit(query, (1,))
+    buffer.close()
+
+    buffer.flush(timeout=1)
+
+    assert future.result(0) is None
+    with pytest.raises(RuntimeError):
+        buffer.submit(query, (2,))